@@ -0,0 +1 @@
+# Analytics package 
\ No newline at end of file
@@ -0,0 +1,439 @@
+"""
+Агрегаты для вкладок дашборда
+
+Функции show_* получают не исходные записи, а небольшие сводные таблицы
+от одного из движков:
+
+- `PandasAggregates` - группировки pandas по записям, загруженным в память;
+- `DuckDBAggregates` - SQL-запросы DuckDB к базе SQLite (через расширение
+  sqlite) или к снимку Parquet; в память попадает только результат.
+
+Движок выбирается переменной ANALYTICS_BACKEND. Оба движка возвращают
+таблицы одинаковой формы: ключи группировки по порядку, затем показатели.
+Совпадение результатов проверяет scripts/check_analytics_parity.py.
+"""
+
+import logging
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from database.models import ActivityCategory, TimeEntry
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+# Движок агрегатов: pandas или duckdb
+ANALYTICS_BACKEND = os.getenv('ANALYTICS_BACKEND', 'pandas').lower()
+# Источник для DuckDB: адрес sqlite:/// или путь к файлу/каталогу Parquet (по умолчанию - DATABASE_URL)
+ANALYTICS_SOURCE = os.getenv('ANALYTICS_SOURCE', '')
+# Потоков DuckDB; 0 - по числу ядер
+DUCKDB_THREADS = int(os.getenv('DUCKDB_THREADS', '0'))
+# Сколько задач с наибольшим временем предлагать в фильтре дашборда; остальные - через поиск
+ACTIVITY_OPTIONS_LIMIT = int(os.getenv('ACTIVITY_OPTIONS_LIMIT', '50'))
+
+# Периоды дня: подпись, первый и последний час
+HOUR_GROUPS = (
+    ('Ночь (0-6)', 0, 5),
+    ('Утро (6-12)', 6, 11),
+    ('День (12-18)', 12, 17),
+    ('Вечер (18-24)', 18, 23),
+)
+HOUR_GROUP_LABELS = [label for label, _, _ in HOUR_GROUPS]
+TIME_PERIODS = {label: (first, last) for label, first, last in HOUR_GROUPS}
+
+# Показатели группировки: сумма, число записей, среднее, максимум и минимум
+# длительности, число дней и число разных задач
+STATS = ('sum', 'count', 'mean', 'max', 'min', 'days', 'activities')
+# Ключи группировки
+KEYS = ('category', 'activity_id', 'date', 'hour', 'day_of_week', 'week', 'month', 'year', 'hour_group')
+# Допустимые колонки сортировки записей
+ENTRY_ORDERS = ('entry_date', 'duration_minutes', 'activity_name')
+# Колонки записей в базе и в снимке Parquet
+ENTRY_FIELDS = ['id', 'user_id', 'activity_id', 'category', 'duration_minutes', 'entry_date', 'local_date', 'local_hour']
+ENTRY_COLUMNS = ['id', 'activity_id', 'activity_name', 'category', 'duration_minutes', 'entry_date', 'day_of_week', 'hour']
+
+_INT_COLUMNS = {'id', 'activity_id', 'hour', 'week', 'month', 'year', 'sum', 'count', 'max', 'min',
+                'days', 'activities', 'duration_minutes'}
+_STR_COLUMNS = {'category', 'day_of_week', 'hour_group', 'activity_name'}
+_DATETIME_COLUMNS = {'date', 'entry_date'}
+
+@dataclass(frozen=True)
+class Filters:
+    """Фильтры боковой панели; None - без ограничения"""
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    categories: Optional[Tuple[str, ...]] = None
+    activity_ids: Optional[Tuple[int, ...]] = None
+    time_period: str = "Все время"
+
+    @classmethod
+    def from_sidebar(cls, date_range, categories, activity_ids, time_period) -> 'Filters':
+        """
+        Фильтры из значений виджетов (период может быть выбран наполовину)
+
+        activity_ids=None - все задачи: фильтр по задачам не применяется.
+        """
+        start_date = end_date = None
+        if len(date_range) == 2 and date_range[0] and date_range[1]:
+            start_date, end_date = date_range
+        if activity_ids is not None:
+            activity_ids = tuple(int(i) for i in activity_ids)
+        return cls(start_date, end_date, tuple(categories), activity_ids, time_period)
+
+def _normalize(frame: pd.DataFrame) -> pd.DataFrame:
+    """Приводит типы колонок к общему виду для обоих движков"""
+    frame = frame.reset_index(drop=True)
+    for column in frame.columns:
+        if column in _DATETIME_COLUMNS:
+            frame[column] = pd.to_datetime(frame[column]).astype('datetime64[ns]')
+        elif column in _STR_COLUMNS:
+            frame[column] = frame[column].astype(object).where(frame[column].notna(), None)
+        elif column in _INT_COLUMNS and not frame[column].isna().any():
+            frame[column] = frame[column].astype('int64')
+        elif column == 'mean':
+            frame[column] = frame[column].astype('float64')
+    return frame
+
+def _check(keys: Sequence[str], stats: Sequence[str]):
+    unknown = [name for name in keys if name not in KEYS] + [name for name in stats if name not in STATS]
+    if unknown:
+        raise ValueError(f"Неизвестные ключи или показатели: {unknown}")
+
+class Aggregates(ABC):
+    """Общая часть движков: нормализация результатов и производные сводки"""
+
+    def __init__(self, activity_names: Optional[Dict[int, str]] = None, filters: Filters = Filters()):
+        self.activity_names = activity_names or {}
+        self.filters = filters
+        self._summary: Optional[dict] = None
+
+    @abstractmethod
+    def options(self, activities: bool = True) -> dict:
+        """
+        Значения для фильтров по всем записям: границы дат, категории, задачи, число записей
+
+        activities=False не собирает список задач (дашборд берет его из базы
+        запросом по индексу) - activity_ids тогда пустой.
+        """
+
+    @abstractmethod
+    def with_filters(self, filters: Filters) -> 'Aggregates':
+        """Те же данные с другими фильтрами"""
+
+    def group(self, keys: Sequence[str], stats: Sequence[str] = ('sum',)) -> pd.DataFrame:
+        """Показатели длительности по ключам; строки упорядочены по ключам"""
+        _check(keys, stats)
+        frame = self._group(list(keys), list(stats))
+        if keys:
+            frame = frame.sort_values(list(keys), kind='stable')
+        elif 'sum' in stats:
+            # Сумма по пустой выборке: 0 в pandas и NULL в SQL
+            frame['sum'] = frame['sum'].fillna(0)
+        return _normalize(frame[list(keys) + list(stats)])
+
+    def totals(self, keys: Sequence[str]) -> pd.DataFrame:
+        """Сумма минут по ключам в колонке duration_minutes, как в исходных записях"""
+        return self.group(keys, ['sum']).rename(columns={'sum': 'duration_minutes'})
+
+    def summary(self) -> dict:
+        """Все показатели по отфильтрованным записям одним словарем"""
+        if self._summary is None:
+            frame = self.group([], STATS)
+            values = {stat: frame[stat].iloc[0] for stat in STATS}
+            self._summary = {stat: (None if pd.isna(value) else value.item()) for stat, value in values.items()}
+        return self._summary
+
+    def entries(self, order_by: str = 'entry_date', ascending: bool = False, limit: Optional[int] = None) -> pd.DataFrame:
+        """Отфильтрованные записи с названиями задач; при равенстве - по id"""
+        if order_by not in ENTRY_ORDERS:
+            raise ValueError(f"Неизвестная колонка сортировки: {order_by}")
+        return _normalize(self._entries(order_by, ascending, limit)[ENTRY_COLUMNS])
+
+    @abstractmethod
+    def _group(self, keys: List[str], stats: List[str]) -> pd.DataFrame:
+        ...
+
+    @abstractmethod
+    def _entries(self, order_by: str, ascending: bool, limit: Optional[int]) -> pd.DataFrame:
+        ...
+
+def query_entries(session, since: Optional[datetime] = None, until: Optional[datetime] = None) -> pd.DataFrame:
+    """Записи из базы без производных колонок; категории - значениями перечисления"""
+    # Названия задач не загружаем: группировка идет по activity_id
+    query = session.query(
+        TimeEntry.id,
+        TimeEntry.user_id,
+        TimeEntry.activity_id,
+        TimeEntry.category,
+        TimeEntry.duration_minutes,
+        TimeEntry.entry_date,
+        TimeEntry.local_date,
+        TimeEntry.local_hour
+    )
+    if since is not None:
+        query = query.filter(TimeEntry.entry_date >= since)
+    if until is not None:
+        query = query.filter(TimeEntry.entry_date < until)
+    df = pd.DataFrame(query.all(), columns=ENTRY_FIELDS)
+    if not df.empty:
+        df['category'] = df['category'].map(lambda category: category.value)
+        df['entry_date'] = pd.to_datetime(df['entry_date'])
+    return df
+
+def add_derived_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Добавляет колонки для анализа: дата, час, день недели, неделя, месяц, год
+
+    День и час - локальные, в поясе пользователя (local_date, local_hour);
+    у строк без них (файлы архива, записанные до их появления) - по
+    entry_date в UTC.
+    """
+    if not df.empty:
+        missing = df['local_date'].isna()
+        if missing.any():
+            df.loc[missing, 'local_date'] = df.loc[missing, 'entry_date'].dt.date
+            df.loc[missing, 'local_hour'] = df.loc[missing, 'entry_date'].dt.hour
+            df['local_hour'] = df['local_hour'].astype('int64')
+        local_date = pd.to_datetime(df['local_date'])
+        df['date'] = df['local_date']
+        df['hour'] = df['local_hour'].astype('int32')
+        df['day_of_week'] = local_date.dt.day_name()
+        df['week'] = local_date.dt.isocalendar().week
+        df['month'] = local_date.dt.month
+        df['year'] = local_date.dt.year
+    return df
+
+def load_entries(session) -> pd.DataFrame:
+    """Записи из базы с производными колонками для анализа"""
+    return add_derived_columns(query_entries(session))
+
+def filter_frame(df: pd.DataFrame, filters: Filters) -> pd.DataFrame:
+    """Применяет фильтры к записям из load_entries"""
+    if df.empty:
+        return df
+    mask = pd.Series(True, index=df.index)
+    if filters.start_date and filters.end_date:
+        mask &= (df['date'] >= filters.start_date) & (df['date'] <= filters.end_date)
+    if filters.categories is not None:
+        mask &= df['category'].isin(filters.categories)
+    if filters.activity_ids is not None:
+        mask &= df['activity_id'].isin(filters.activity_ids)
+    period = TIME_PERIODS.get(filters.time_period)
+    if period:
+        mask &= df['hour'].between(*period)
+    return df[mask]
+
+# Показатель -> (колонка, функция pandas)
+_PANDAS_STATS = {
+    'sum': ('duration_minutes', 'sum'),
+    'count': ('duration_minutes', 'count'),
+    'mean': ('duration_minutes', 'mean'),
+    'max': ('duration_minutes', 'max'),
+    'min': ('duration_minutes', 'min'),
+    'days': ('date', 'nunique'),
+    'activities': ('activity_id', 'nunique'),
+}
+
+class PandasAggregates(Aggregates):
+    """Группировки pandas по записям в памяти"""
+
+    def __init__(self, df: pd.DataFrame, activity_names: Optional[Dict[int, str]] = None, filters: Filters = Filters()):
+        super().__init__(activity_names, filters)
+        self.df = df
+        self.filtered = filter_frame(df, filters)
+
+    def with_filters(self, filters: Filters) -> 'PandasAggregates':
+        return PandasAggregates(self.df, self.activity_names, filters)
+
+    def options(self, activities: bool = True) -> dict:
+        df = self.df
+        if df.empty:
+            return {'rows': 0, 'min_date': None, 'max_date': None, 'categories': [], 'activity_ids': []}
+        return {
+            'rows': len(df),
+            'min_date': df['date'].min(),
+            'max_date': df['date'].max(),
+            'categories': sorted(df['category'].unique()),
+            'activity_ids': sorted(int(i) for i in df['activity_id'].dropna().unique()) if activities else [],
+        }
+
+    def _group(self, keys, stats):
+        df = self.filtered
+        if 'hour_group' in keys:
+            hour_group = pd.cut(df['hour'], bins=[0, 6, 12, 18, 24], right=False, labels=HOUR_GROUP_LABELS)
+            df = df.assign(hour_group=hour_group.astype(object))
+        named = {stat: _PANDAS_STATS[stat] for stat in stats}
+        if not keys:
+            return pd.DataFrame([{stat: df[column].agg(func) for stat, (column, func) in named.items()}])
+        return df.groupby(keys, observed=True).agg(**named).reset_index()
+
+    def _entries(self, order_by, ascending, limit):
+        df = self.filtered.assign(activity_name=self.filtered['activity_id'].map(self.activity_names))
+        df = df.sort_values([order_by, 'id'], ascending=ascending, kind='stable')
+        return df if limit is None else df.head(limit)
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+# Ключ -> выражение SQL над представлением entries
+_DUCKDB_KEYS = {
+    'category': 'category',
+    'activity_id': 'activity_id',
+    'date': 'local_date',
+    'hour': 'local_hour',
+    'day_of_week': 'dayname(local_date)',
+    'week': 'week(local_date)',
+    'month': 'month(local_date)',
+    'year': 'year(local_date)',
+    'hour_group': 'CASE ' + ' '.join(
+        f"WHEN local_hour BETWEEN {first} AND {last} THEN {_sql_literal(label)}"
+        for label, first, last in HOUR_GROUPS
+    ) + ' END',
+}
+_DUCKDB_STATS = {
+    'sum': 'sum(duration_minutes)',
+    'count': 'count(duration_minutes)',
+    'mean': 'avg(duration_minutes)',
+    'max': 'max(duration_minutes)',
+    'min': 'min(duration_minutes)',
+    'days': 'count(DISTINCT local_date)',
+    'activities': 'count(DISTINCT activity_id)',
+}
+
+def _source_relation(source: str) -> Tuple[Optional[str], str]:
+    """Команда подключения и таблица записей для источника DuckDB"""
+    if source.startswith('sqlite:///'):
+        path = source[len('sqlite:///'):]
+        return f"ATTACH {_sql_literal(path)} AS tracker (TYPE sqlite, READ_ONLY)", 'tracker.time_entries'
+    if os.path.isdir(source):
+        source = os.path.join(source, '**', '*.parquet')
+    return None, f"read_parquet({_sql_literal(source)}, union_by_name = true)"
+
+def connect_duckdb(source: str, threads: int = DUCKDB_THREADS,
+                   archive: Optional[Tuple[str, datetime]] = None):
+    """
+    Соединение DuckDB с представлением entries над источником
+
+    Категории в SQLite хранятся именами перечисления, в представлении они
+    приводятся к значениям ('work', 'study', 'rest'), как в PandasAggregates.
+    archive - каталог и граница архива (analytics/archive.py): записи до
+    границы читаются из его файлов, из источника - только после нее.
+    """
+    if duckdb is None:
+        raise RuntimeError("duckdb не установлен: pip install duckdb")
+    connection = duckdb.connect(config={'threads': threads} if threads else {})
+    attach, relation = _source_relation(source)
+    if attach:
+        connection.execute(attach)
+    categories = ' '.join(
+        f"WHEN {_sql_literal(category.name)} THEN {_sql_literal(category.value)}" for category in ActivityCategory
+    )
+    if archive:
+        directory, cutoff = archive
+        relation = f"""(
+            SELECT * FROM {relation} WHERE CAST(entry_date AS TIMESTAMP) >= {_sql_literal(cutoff.isoformat(sep=' '))}
+            UNION ALL BY NAME
+            SELECT * FROM read_parquet({_sql_literal(os.path.join(directory, '**', '*.parquet'))}, union_by_name = true)
+        )"""
+    connection.execute(f"""
+        CREATE OR REPLACE VIEW entries AS
+        SELECT id, user_id, activity_id,
+               CASE CAST(category AS VARCHAR) {categories} ELSE CAST(category AS VARCHAR) END AS category,
+               duration_minutes,
+               CAST(entry_date AS TIMESTAMP) AS entry_date,
+               -- Файлы архива, записанные до появления локальных полей, - по UTC
+               COALESCE(CAST(local_date AS DATE), CAST(entry_date AS DATE)) AS local_date,
+               CAST(COALESCE(local_hour, hour(CAST(entry_date AS TIMESTAMP))) AS INTEGER) AS local_hour
+        FROM {relation}
+    """)
+    logger.info("DuckDB подключен к %s", relation)
+    return connection
+
+class DuckDBAggregates(Aggregates):
+    """SQL-запросы DuckDB; в pandas попадают только результаты"""
+
+    def __init__(self, connection, activity_names: Optional[Dict[int, str]] = None, filters: Filters = Filters()):
+        super().__init__(activity_names, filters)
+        self.connection = connection
+
+    def with_filters(self, filters: Filters) -> 'DuckDBAggregates':
+        return DuckDBAggregates(self.connection, self.activity_names, filters)
+
+    def _query(self, sql: str, parameters=()) -> pd.DataFrame:
+        # Отдельный курсор на запрос: дашборд может читать из нескольких потоков
+        cursor = self.connection.cursor()
+        try:
+            if 'activity_names' in sql:
+                cursor.register('activity_names', pd.DataFrame(
+                    list(self.activity_names.items()), columns=['activity_id', 'activity_name']
+                ).astype({'activity_id': 'int64', 'activity_name': object}))
+            return cursor.execute(sql, list(parameters)).df()
+        finally:
+            cursor.close()
+
+    def _where(self) -> Tuple[str, list]:
+        filters = self.filters
+        conditions, parameters = [], []
+        if filters.start_date and filters.end_date:
+            conditions.append("local_date BETWEEN ? AND ?")
+            parameters += [filters.start_date, filters.end_date]
+        if filters.categories is not None:
+            conditions.append("list_contains(?::VARCHAR[], category)")
+            parameters.append(list(filters.categories))
+        if filters.activity_ids is not None:
+            conditions.append("list_contains(?::BIGINT[], activity_id)")
+            parameters.append(list(filters.activity_ids))
+        period = TIME_PERIODS.get(filters.time_period)
+        if period:
+            conditions.append("local_hour BETWEEN ? AND ?")
+            parameters += list(period)
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), parameters
+
+    def options(self, activities: bool = True) -> dict:
+        rows, min_date, max_date = self._query(
+            "SELECT count(*), min(local_date), max(local_date) FROM entries"
+        ).iloc[0]
+        if not rows:
+            return {'rows': 0, 'min_date': None, 'max_date': None, 'categories': [], 'activity_ids': []}
+        categories = self._query("SELECT DISTINCT category FROM entries ORDER BY category")['category']
+        activity_ids = self._query(
+            "SELECT DISTINCT activity_id FROM entries WHERE activity_id IS NOT NULL ORDER BY activity_id"
+        )['activity_id'] if activities else []
+        return {
+            'rows': int(rows),
+            'min_date': pd.Timestamp(min_date).date(),
+            'max_date': pd.Timestamp(max_date).date(),
+            'categories': categories.tolist(),
+            'activity_ids': [int(i) for i in activity_ids],
+        }
+
+    def _group(self, keys, stats):
+        where, parameters = self._where()
+        columns = [f"{_DUCKDB_KEYS[key]} AS {key}" for key in keys]
+        columns += [f"{_DUCKDB_STATS[stat]} AS {stat}" for stat in stats]
+        sql = f"SELECT {', '.join(columns)} FROM entries{where}"
+        if keys:
+            sql += " GROUP BY ALL"
+        return self._query(sql, parameters)
+
+    def _entries(self, order_by, ascending, limit):
+        where, parameters = self._where()
+        direction = 'ASC' if ascending else 'DESC'
+        sql = f"""
+            SELECT id, activity_id, activity_name, category, duration_minutes, entry_date,
+                   dayname(local_date) AS day_of_week, local_hour AS hour
+            FROM entries LEFT JOIN activity_names USING (activity_id){where}
+            ORDER BY {order_by} {direction} NULLS LAST, id {direction}
+        """
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return self._query(sql, parameters)
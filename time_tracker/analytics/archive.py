@@ -0,0 +1,267 @@
+"""
+Архив старых записей: горячая таблица и годовые файлы Parquet
+
+Бот читает только последние дни (статистика за сегодня, напоминания,
+подсказки за 90 дней), поэтому записи старше ARCHIVE_AFTER_DAYS целыми
+месяцами переносятся из time_entries в сжатые файлы
+data/archive/year=ГГГГ/part.parquet. Дневные итоги перенесенных записей
+сохраняются в таблице entry_rollups в той же транзакции, что и удаление.
+
+Порядок шагов допускает сбой на любом из них:
+
+1. записи старше границы дописываются в годовые файлы (повторы по id
+   отбрасываются);
+2. граница записывается в _manifest.json - с этого момента читатели берут
+   записи до границы только из архива;
+3. по месяцу за транзакцию: итоги добавляются в entry_rollups, записи
+   удаляются из базы.
+
+Дашборд объединяет архив, снимок и хвост базы (load_history).
+"""
+
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from analytics.aggregates import add_derived_columns, query_entries
+from analytics.snapshot import (
+    SNAPSHOT_DIR, load_snapshot, month_key, month_start, next_month_start, read_parquet, replace_file, snapshot_table, to_table
+)
+from database.events import head_seq, mark_archived
+from database.models import ActivityCategory, EntryRollup, TimeEntry
+from database.timezones import get_timezone
+
+logger = logging.getLogger(__name__)
+
+# Каталог архива
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', os.path.join('data', 'archive'))
+# Записи старше стольких дней переносятся в архив (целыми месяцами)
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '365'))
+# Самые старые записи, которые читает бот: прогрев подсказок за 90 дней
+MIN_ARCHIVE_DAYS = 90
+MANIFEST_FILE = '_manifest.json'
+
+def archive_path(directory: str, year: int) -> str:
+    return os.path.join(directory, f"year={year}", 'part.parquet')
+
+def read_manifest(directory: str) -> dict:
+    """Граница архива и итоги по годам; пустые, если архива еще нет"""
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'cutoff': None, 'years': {}}
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+def archive_cutoff(directory: str = ARCHIVE_DIR) -> Optional[datetime]:
+    """Записи раньше этой даты хранятся только в архиве"""
+    cutoff = read_manifest(directory)['cutoff']
+    return datetime.fromisoformat(cutoff) if cutoff else None
+
+def cutoff_for(now: datetime, days: int) -> datetime:
+    """Начало месяца, в который попадает now - days: архивируются только целые месяцы"""
+    return month_start(month_key(now - timedelta(days=days)))
+
+def _append_year(directory: str, year: int, table: pa.Table) -> pa.Table:
+    """Дописывает записи в годовой файл, отбрасывая уже архивированные id"""
+    path = archive_path(directory, year)
+    if os.path.exists(path):
+        existing = read_parquet(path)
+        table = table.filter(pc.invert(pc.is_in(table['id'], value_set=existing['id'])))
+        table = pa.concat_tables([existing, table])
+    table = table.sort_by('entry_date')
+    replace_file(path, lambda temporary: pq.write_table(table, temporary, compression='zstd'))
+    return table
+
+def _rollup_rows(df: pd.DataFrame) -> List[dict]:
+    """Дневные итоги записей для entry_rollups (по локальному дню пользователя)"""
+    # В файлах, записанных до появления local_date, день - по UTC
+    day = df['local_date'].where(df['local_date'].notna(), df['entry_date'].dt.date)
+    rollups = df.assign(day=day).groupby(
+        ['user_id', 'activity_id', 'category', 'day'], dropna=False
+    ).agg(entries=('id', 'count'), minutes=('duration_minutes', 'sum')).reset_index()
+    return [
+        {
+            'user_id': int(row.user_id),
+            'activity_id': None if pd.isna(row.activity_id) else int(row.activity_id),
+            'category': ActivityCategory(row.category),
+            'day': row.day,
+            'entries': int(row.entries),
+            'minutes': int(row.minutes),
+        }
+        for row in rollups.itertuples(index=False)
+    ]
+
+def archive_entries(db_engine: Engine, directory: str = ARCHIVE_DIR, days: int = ARCHIVE_AFTER_DAYS,
+                    now: Optional[datetime] = None, dry_run: bool = False) -> dict:
+    """Переносит записи старше days дней в архив, возвращает границу и число записей по годам"""
+    if days < MIN_ARCHIVE_DAYS:
+        raise ValueError(f"Горизонт архивации меньше {MIN_ARCHIVE_DAYS} дней: бот еще читает эти записи")
+
+    manifest = read_manifest(directory)
+    cutoff = cutoff_for(now or datetime.utcnow(), days)
+    previous = archive_cutoff(directory)
+    # Граница не отступает назад, даже если горизонт увеличили
+    if previous and previous > cutoff:
+        cutoff = previous
+
+    with Session(db_engine) as session:
+        df = query_entries(session, until=cutoff)
+    counts = df['entry_date'].dt.year.value_counts().sort_index() if not df.empty else pd.Series(dtype='int64')
+    result = {'cutoff': cutoff, 'years': {int(year): int(count) for year, count in counts.items()}}
+    if dry_run or (df.empty and previous == cutoff):
+        return result
+
+    # 1. Годовые файлы
+    for year, rows in df.groupby(df['entry_date'].dt.year):
+        table = _append_year(directory, int(year), to_table(rows))
+        manifest['years'][str(year)] = {
+            'rows': table.num_rows,
+            'total_minutes': pc.sum(table['duration_minutes']).as_py(),
+        }
+
+    # 2. Граница: читатели перестают брать записи до нее из базы
+    manifest['cutoff'] = cutoff.isoformat()
+    manifest['updated_at'] = datetime.utcnow().isoformat(timespec='seconds')
+    def write(path):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, ensure_ascii=False, indent=2, sort_keys=True)
+    replace_file(os.path.join(directory, MANIFEST_FILE), write)
+
+    # 3. Итоги и удаление - отдельной транзакцией на каждый месяц, чтобы не
+    # держать блокировку записи базы, пока удаляется весь архивируемый период
+    statement = sqlite_insert(EntryRollup)
+    statement = statement.on_conflict_do_update(
+        index_elements=['user_id', 'activity_id', 'category', 'day'],
+        set_={
+            'entries': EntryRollup.entries + statement.excluded.entries,
+            'minutes': EntryRollup.minutes + statement.excluded.minutes,
+        }
+    )
+    for key, rows in df.groupby(df['entry_date'].dt.strftime('%Y-%m')):
+        with Session(db_engine) as session, session.begin():
+            session.connection().execute(statement, _rollup_rows(rows))
+            head = head_seq(session)
+            # Записи, добавленные задним числом после выборки, дождутся следующего запуска
+            session.execute(delete(TimeEntry).where(
+                TimeEntry.entry_date >= month_start(key),
+                TimeEntry.entry_date < min(next_month_start(key), cutoff),
+                TimeEntry.id <= int(rows['id'].max())
+            ))
+            # В журнале это перенос, а не удаление: дашборд сохраняет записи в истории
+            mark_archived(session, head)
+        logger.info("В архив перенесен месяц %s: %d записей", key, len(rows))
+    return result
+
+def _localize(df: pd.DataFrame, zones: dict) -> pd.DataFrame:
+    """Заполняет local_date и local_hour по entry_date (UTC) в поясах пользователей"""
+    for user_id, index in df.groupby('user_id').groups.items():
+        local = df.loc[index, 'entry_date'].dt.tz_localize('UTC').dt.tz_convert(zones[user_id])
+        df.loc[index, 'local_date'] = local.dt.date
+        df.loc[index, 'local_hour'] = local.dt.hour
+    return df
+
+def upgrade_archive(db_engine: Engine, directory: str = ARCHIVE_DIR) -> List[int]:
+    """
+    Дописывает local_date и local_hour в годовые файлы, записанные до их появления
+
+    Пояс берется из текущих настроек пользователя (database/timezones.py).
+    Если файлы изменились, дневные итоги entry_rollups пересчитываются из
+    архива по локальным дням. Возвращает обновленные годы.
+    """
+    upgraded = []
+    for year in sorted(read_manifest(directory)['years']):
+        path = archive_path(directory, int(year))
+        if 'local_date' in pq.read_schema(path).names:
+            continue
+        df = read_parquet(path).to_pandas()
+        with db_engine.connect() as connection:
+            zones = {user_id: get_timezone(connection, int(user_id)) for user_id in df['user_id'].unique()}
+        table = to_table(_localize(df, zones))
+        replace_file(path, lambda temporary: pq.write_table(table, temporary, compression='zstd'))
+        upgraded.append(int(year))
+        logger.info("Годовой файл архива %s дополнен локальными датами", year)
+
+    if upgraded:
+        tables = archive_tables(directory)
+        rows = _rollup_rows(pa.concat_tables(tables).to_pandas())
+        with Session(db_engine) as session, session.begin():
+            session.execute(delete(EntryRollup))
+            session.connection().execute(insert(EntryRollup), rows)
+    return upgraded
+
+def archive_tables(directory: str = ARCHIVE_DIR) -> List[pa.Table]:
+    """Годовые файлы архива, открытые через отображение в память"""
+    years = sorted(read_manifest(directory)['years'])
+    return [read_parquet(archive_path(directory, int(year))) for year in years]
+
+def load_history(session, snapshot_dir: str = SNAPSHOT_DIR, archive_dir: str = ARCHIVE_DIR) -> Optional[pd.DataFrame]:
+    """
+    Все записи с производными колонками: архив, снимок и хвост базы
+
+    Возвращает None, если нет ни архива, ни снимка - тогда записи читаются
+    из базы целиком.
+    """
+    cutoff = archive_cutoff(archive_dir)
+    if cutoff is None:
+        return load_snapshot(session, snapshot_dir)
+    recent = snapshot_table(session, snapshot_dir, since=cutoff)
+    if recent is None:
+        recent = to_table(query_entries(session, since=cutoff))
+    return add_derived_columns(pa.concat_tables(archive_tables(archive_dir) + [recent]).to_pandas())
+
+def verify_archive(db_engine: Engine, directory: str = ARCHIVE_DIR) -> List[str]:
+    """Сверяет дневные итоги файлов архива с entry_rollups, возвращает расхождения"""
+    problems = []
+    tables = archive_tables(directory)
+    archived = pa.concat_tables(tables).to_pandas() if tables else pd.DataFrame()
+    expected = pd.DataFrame(_rollup_rows(archived)) if not archived.empty else pd.DataFrame()
+
+    with Session(db_engine) as session:
+        rollups = pd.DataFrame(
+            session.execute(select(
+                EntryRollup.user_id, EntryRollup.activity_id, EntryRollup.category,
+                EntryRollup.day, EntryRollup.entries, EntryRollup.minutes
+            )).mappings().all()
+        )
+        cutoff = archive_cutoff(directory)
+        if cutoff is not None:
+            pending = session.execute(
+                select(func.count(TimeEntry.id)).where(TimeEntry.entry_date < cutoff)
+            ).scalar()
+            if pending:
+                problems.append(f"В базе {pending} записей до границы {cutoff.date()}: ждут следующего запуска")
+
+    if expected.empty and rollups.empty:
+        return problems
+    keys = ['user_id', 'activity_id', 'category', 'day']
+    if not rollups.empty:
+        # NULL в activity_id не участвует в уникальном ключе: такие итоги могут повторяться
+        rollups = rollups.assign(category=rollups['category'].map(lambda category: category.value))
+        rollups = rollups.groupby(keys, dropna=False, as_index=False)[['entries', 'minutes']].sum()
+    if not expected.empty:
+        expected = expected.assign(category=expected['category'].map(lambda category: category.value))
+    merged = expected.merge(rollups, on=keys, how='outer', suffixes=('_archive', '_rollup'), indicator=True)
+    mismatched = merged[
+        (merged['_merge'] != 'both') |
+        (merged['entries_archive'] != merged['entries_rollup']) |
+        (merged['minutes_archive'] != merged['minutes_rollup'])
+    ]
+    for row in mismatched.head(10).itertuples(index=False):
+        problems.append(
+            f"{row.day} пользователь {row.user_id} задача {row.activity_id}: "
+            f"архив {row.entries_archive}/{row.minutes_archive}, итоги {row.entries_rollup}/{row.minutes_rollup}"
+        )
+    if len(mismatched) > 10:
+        problems.append(f"... и еще {len(mismatched) - 10} расхождений")
+    return problems
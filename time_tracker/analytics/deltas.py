@@ -0,0 +1,81 @@
+"""
+Догрузка изменений записей из журнала entry_events
+
+Дашборд загружает записи целиком один раз (архив, снимок и хвост базы), а
+при каждом обновлении читает только новые события журнала и применяет их
+к уже загруженной таблице: добавленные и измененные записи заменяются,
+удаленные убираются. Перенос в архив (archive) таблицу не меняет.
+"""
+
+import logging
+import threading
+from typing import Callable, List, Optional
+
+import pandas as pd
+
+from analytics.aggregates import add_derived_columns, load_entries
+from analytics.snapshot import to_table
+from database.events import compacted_seq, has_event_log, head_seq, read_events
+from database.models import EntryEvent
+
+logger = logging.getLogger(__name__)
+
+def apply_events(df: pd.DataFrame, events: List[EntryEvent]) -> pd.DataFrame:
+    """Применяет события к записям с производными колонками, возвращает новую таблицу"""
+    changes = pd.DataFrame(
+        [(event.op, event.entry_id, event.user_id, event.activity_id, event.category,
+          event.duration_minutes, event.entry_date, event.local_date, event.local_hour)
+         for event in events if event.op in ('insert', 'update', 'delete')],
+        columns=['op', 'id', 'user_id', 'activity_id', 'category', 'duration_minutes', 'entry_date',
+                 'local_date', 'local_hour']
+    )
+    # Важно только последнее изменение каждой записи
+    changes = changes.drop_duplicates('id', keep='last')
+    if changes.empty:
+        return df
+
+    upserts = changes[changes['op'] != 'delete'].drop(columns='op')
+    if not upserts.empty:
+        upserts = upserts.assign(
+            category=upserts['category'].map(lambda category: category.value),
+            entry_date=pd.to_datetime(upserts['entry_date'])
+        )
+    rows = add_derived_columns(to_table(upserts).to_pandas())
+    kept = df[~df['id'].isin(changes['id'])] if not df.empty else df
+    if rows.empty:
+        return kept
+    if kept.empty:
+        return rows
+    return pd.concat([kept, rows], ignore_index=True)
+
+class DeltaLoader:
+    """Записи для дашборда: полная загрузка один раз, затем только события журнала"""
+
+    def __init__(self, load_full: Callable[..., Optional[pd.DataFrame]]):
+        # load_full(session) возвращает записи или None, тогда читается база целиком
+        self.load_full = load_full
+        self.frame: Optional[pd.DataFrame] = None
+        self.offset = 0
+        self._lock = threading.Lock()
+
+    def refresh(self, session) -> pd.DataFrame:
+        """Актуальные записи; полная загрузка - в первый раз, после уплотнения журнала и после восстановления базы"""
+        with self._lock:
+            if not has_event_log(session):
+                # Бот с журналом еще не запускался на этой базе - загружаем целиком
+                df = self.load_full(session)
+                return df if df is not None else load_entries(session)
+            # Голова журнала позади смещения - базу подменили (восстановили из копии)
+            if self.frame is None or self.offset < compacted_seq(session) or head_seq(session) < self.offset:
+                # Голова журнала - до загрузки: события после нее применятся повторно без вреда
+                self.offset = head_seq(session)
+                df = self.load_full(session)
+                self.frame = df if df is not None else load_entries(session)
+                return self.frame
+
+            events = read_events(session, self.offset)
+            if events:
+                self.frame = apply_events(self.frame, events)
+                self.offset = events[-1].seq
+                logger.info("Применено событий журнала: %d, записей %d", len(events), len(self.frame))
+            return self.frame
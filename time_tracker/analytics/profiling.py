@@ -0,0 +1,131 @@
+"""
+Замеры времени перерисовки дашборда
+
+`RunProfiler` собирает время секций (загрузка, фильтры, вкладки) одного
+прогона скрипта и по запросу снимает профиль cProfile или pyinstrument.
+Итоги пишутся в лог одной JSON-строкой и показываются в панели дашборда.
+"""
+
+import cProfile
+import io
+import json
+import logging
+import pstats
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:
+    PyinstrumentProfiler = None
+
+logger = logging.getLogger(__name__)
+
+# Значения параметра ?profile=, включающие профилировщик
+PROFILE_CPROFILE = 'cprofile'
+PROFILE_PYINSTRUMENT = 'pyinstrument'
+
+class RunProfiler:
+    """Время секций одного прогона и необязательный профиль"""
+
+    def __init__(self, profile: Optional[str] = None):
+        self.timings: List[Tuple[str, float]] = []
+        self.total = 0.0
+        self.profile = profile
+        if profile == PROFILE_PYINSTRUMENT and PyinstrumentProfiler is None:
+            logger.warning("pyinstrument не установлен, используется cProfile")
+            self.profile = PROFILE_CPROFILE
+        self._profiler = None
+        self._started: Optional[float] = None
+
+    @classmethod
+    def from_query_params(cls, params) -> 'RunProfiler':
+        """
+        Создает профилировщик по параметрам адреса
+
+        `?profile=1` или `?profile=cprofile` - cProfile,
+        `?profile=pyinstrument` - pyinstrument, иначе только замеры секций.
+        """
+        value = str(params.get('profile', '')).lower()
+        if value in ('1', 'true', PROFILE_CPROFILE):
+            return cls(PROFILE_CPROFILE)
+        if value == PROFILE_PYINSTRUMENT:
+            return cls(PROFILE_PYINSTRUMENT)
+        return cls()
+
+    def __enter__(self):
+        if self.profile == PROFILE_CPROFILE:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == PROFILE_PYINSTRUMENT:
+            self._profiler = PyinstrumentProfiler()
+            self._profiler.start()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.total = time.perf_counter() - self._started
+        if self.profile == PROFILE_CPROFILE:
+            self._profiler.disable()
+        elif self.profile == PROFILE_PYINSTRUMENT:
+            self._profiler.stop()
+        return False
+
+    @contextmanager
+    def section(self, name: str):
+        """Замеряет время блока"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.append((name, time.perf_counter() - started))
+
+    def summary(self) -> Dict[str, float]:
+        """Время секций в миллисекундах (повторяющиеся секции суммируются)"""
+        result: Dict[str, float] = {}
+        for name, seconds in self.timings:
+            result[name] = result.get(name, 0.0) + seconds * 1000
+        return result
+
+    def hot_spots(self, limit: int = 15) -> List[dict]:
+        """Самые затратные функции по собственному времени (только cProfile)"""
+        if self.profile != PROFILE_CPROFILE or self._profiler is None:
+            return []
+        stats = pstats.Stats(self._profiler)
+        rows = []
+        for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+            rows.append({
+                'function': f"{function} ({filename.rsplit('/', 1)[-1]}:{line})",
+                'calls': calls,
+                'own_ms': own * 1000,
+                'cumulative_ms': cumulative * 1000,
+            })
+        rows.sort(key=lambda row: row['own_ms'], reverse=True)
+        return rows[:limit]
+
+    def report_text(self) -> str:
+        """Текстовый отчет профилировщика"""
+        if self._profiler is None:
+            return ''
+        if self.profile == PROFILE_PYINSTRUMENT:
+            return self._profiler.output_text(unicode=True)
+        output = io.StringIO()
+        pstats.Stats(self._profiler, stream=output).sort_stats('cumulative').print_stats(40)
+        return output.getvalue()
+
+    def log(self, **extra):
+        """Пишет итоги прогона в лог одной JSON-строкой"""
+        record = {
+            'event': 'dashboard_run',
+            'total_ms': round(self.total * 1000, 1),
+            'sections': {name: round(ms, 1) for name, ms in self.summary().items()},
+            'profile': self.profile,
+            **extra,
+        }
+        hot_spots = self.hot_spots(limit=5)
+        if hot_spots:
+            record['hot_spots'] = [
+                {'function': row['function'], 'own_ms': round(row['own_ms'], 1)} for row in hot_spots
+            ]
+        logger.info(json.dumps(record, ensure_ascii=False))
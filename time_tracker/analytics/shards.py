@@ -0,0 +1,116 @@
+"""
+Записи всех шардов для дашборда
+
+У каждого шарда свой журнал изменений, поэтому записи догружает отдельный
+DeltaLoader на шард; шарды читаются параллельно, а результаты склеиваются.
+Номера записей и задач в разных шардах пересекаются, поэтому в общей
+таблице к ним прибавляется номер шарда, сдвинутый на SHARD_ID_SHIFT бит
+(у основной базы номера не меняются).
+"""
+
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from analytics.archive import ARCHIVE_DIR, load_history
+from analytics.deltas import DeltaLoader
+from analytics.snapshot import SNAPSHOT_DIR
+from database.activities import fetch_activity_names
+from database.models import TimeEntry
+from database.queries import activity_time_totals
+from database.search import search_activities
+from database.shards import ShardRouter, shard_directory
+
+# Номера в SQLite не доходят до 2^40, сдвиг оставляет место для 2^23 шардов
+SHARD_ID_SHIFT = int(os.getenv('SHARD_ID_SHIFT', '40'))
+
+def id_offset(index: int) -> int:
+    return index << SHARD_ID_SHIFT
+
+def namespace_ids(df: pd.DataFrame, index: int) -> pd.DataFrame:
+    """Сдвигает номера записей и задач шарда index в его диапазон"""
+    if index == 0 or df.empty:
+        return df
+    offset = id_offset(index)
+    return df.assign(id=df['id'] + offset, activity_id=df['activity_id'] + offset)
+
+class ShardedLoader:
+    """Записи всех шардов: DeltaLoader на каждый шард и склейка их таблиц"""
+
+    def __init__(self, router: ShardRouter, snapshot_dir: str = SNAPSHOT_DIR, archive_dir: str = ARCHIVE_DIR):
+        self.router = router
+        self.loaders = {
+            name: DeltaLoader(self._history(shard_directory(snapshot_dir, name), shard_directory(archive_dir, name)))
+            for name in router.names
+        }
+        self._parts: Dict[str, Tuple[pd.DataFrame, pd.DataFrame]] = {}
+        self._merged: Optional[Tuple[tuple, pd.DataFrame]] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _history(snapshot_dir: str, archive_dir: str):
+        return lambda session: load_history(session, snapshot_dir, archive_dir)
+
+    def _load(self, name: str, db_engine: Engine) -> pd.DataFrame:
+        with Session(db_engine) as session:
+            frame = self.loaders[name].refresh(session)
+        # Таблица шарда без новых событий - тот же объект, сдвиг не пересчитываем
+        cached = self._parts.get(name)
+        if cached is None or cached[0] is not frame:
+            cached = self._parts[name] = (frame, namespace_ids(frame, self.router.index(name)))
+        return cached[1]
+
+    def refresh(self) -> pd.DataFrame:
+        """Актуальные записи всех шардов"""
+        with self._lock:
+            frames = self.router.map(self._load)
+            key = tuple(id(frame) for frame in frames.values())
+            if self._merged is None or self._merged[0] != key:
+                parts = [frame for frame in frames.values() if not frame.empty]
+                merged = pd.concat(parts, ignore_index=True) if len(parts) > 1 else (
+                    parts[0] if parts else next(iter(frames.values())))
+                self._merged = (key, merged)
+            return self._merged[1]
+
+def shard_activity_names(router: ShardRouter) -> Dict[int, str]:
+    """Названия задач всех шардов с номерами из общей таблицы"""
+    def names(name: str, db_engine: Engine) -> Dict[int, str]:
+        offset = id_offset(router.index(name))
+        with db_engine.connect() as connection:
+            return {activity_id + offset: title for activity_id, title in fetch_activity_names(connection).items()}
+
+    merged = {}
+    for shard_names in router.map(names).values():
+        merged.update(shard_names)
+    return merged
+
+def shard_search_activities(router: ShardRouter, query: str) -> List[int]:
+    """Поиск задач по индексам всех шардов, номера - из общей таблицы"""
+    def search(name: str, db_engine: Engine) -> List[int]:
+        offset = id_offset(router.index(name))
+        with db_engine.connect() as connection:
+            return [activity_id + offset for activity_id in search_activities(connection, query)]
+
+    return [activity_id for found in router.map(search).values() for activity_id in found]
+
+def shard_activity_time_totals(router: ShardRouter) -> List[Tuple[int, int]]:
+    """Время задач всех шардов по убыванию, номера - из общей таблицы"""
+    def totals(name: str, db_engine: Engine) -> List[Tuple[int, int]]:
+        offset = id_offset(router.index(name))
+        with db_engine.connect() as connection:
+            return [(activity_id + offset, minutes) for activity_id, minutes in activity_time_totals(connection)]
+
+    merged = [item for found in router.map(totals).values() for item in found]
+    return sorted(merged, key=lambda item: (-item[1], item[0]))
+
+def count_entries(router: ShardRouter) -> int:
+    """Число записей во всех шардах"""
+    def count(name: str, db_engine: Engine) -> int:
+        with db_engine.connect() as connection:
+            return connection.execute(select(func.count(TimeEntry.id))).scalar()
+    return sum(router.map(count).values())
@@ -0,0 +1,225 @@
+"""
+Снимок записей в Parquet по месяцам
+
+Таблица time_entries выгружается в data/snapshot/month=ГГГГ-ММ/part.parquet.
+Прошедшие месяцы запечатываются: их файлы больше не переписываются, и при
+каждом запуске переписывается только текущий месяц, если в нем что-то
+изменилось. Состояние месяцев (число записей, последний id, сумма минут)
+хранится в _manifest.json вместе с версией схемы: снимок старой версии
+дашборд не читает, а при следующем запуске он переписывается целиком.
+
+Дашборд читает запечатанные месяцы из файлов через отображение в память, а
+из SQLite загружает только хвост - записи после последнего запечатанного
+месяца. Запечатанный месяц, измененный в базе задним числом (например,
+импортом истории), помечается в манифесте как stale и читается из SQLite,
+пока его не перепишут (--rebuild).
+"""
+
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from analytics.aggregates import ENTRY_FIELDS, add_derived_columns, query_entries
+from database.models import EntryEvent, TimeEntry
+
+logger = logging.getLogger(__name__)
+
+# Каталог снимка
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join('data', 'snapshot'))
+MANIFEST_FILE = '_manifest.json'
+# Версия схемы файлов; 2 - добавлены local_date и local_hour
+SCHEMA_VERSION = 2
+
+SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('user_id', pa.int64()),
+    ('activity_id', pa.int64()),
+    ('category', pa.string()),
+    ('duration_minutes', pa.int64()),
+    ('entry_date', pa.timestamp('us')),
+    ('local_date', pa.date32()),
+    ('local_hour', pa.int64()),
+])
+
+def month_key(value: datetime) -> str:
+    """Ключ месяца: ГГГГ-ММ"""
+    return f"{value.year:04d}-{value.month:02d}"
+
+def month_start(key: str) -> datetime:
+    year, month = map(int, key.split('-'))
+    return datetime(year, month, 1)
+
+def next_month_start(key: str) -> datetime:
+    start = month_start(key)
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+def partition_path(directory: str, key: str) -> str:
+    return os.path.join(directory, f"month={key}", 'part.parquet')
+
+def read_manifest(directory: str) -> dict:
+    """Состояние месяцев снимка; пустое, если снимка еще нет"""
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'months': {}, 'version': SCHEMA_VERSION}
+    with open(path, encoding='utf-8') as file:
+        manifest = json.load(file)
+    manifest.setdefault('version', 1)
+    return manifest
+
+def replace_file(path: str, write):
+    """Пишет во временный файл и атомарно подменяет им старый"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.tmp"
+    write(temporary)
+    os.replace(temporary, path)
+
+def _write_manifest(directory: str, manifest: dict):
+    def write(path):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, ensure_ascii=False, indent=2, sort_keys=True)
+    replace_file(os.path.join(directory, MANIFEST_FILE), write)
+
+def month_signatures(session, since: Optional[datetime] = None) -> Dict[str, dict]:
+    """Число записей, последний id и сумма минут по месяцам в базе (начиная с since)"""
+    month = func.strftime('%Y-%m', TimeEntry.entry_date)
+    query = select(month, func.count(TimeEntry.id), func.max(TimeEntry.id), func.sum(TimeEntry.duration_minutes))
+    if since is not None:
+        query = query.where(TimeEntry.entry_date >= since)
+    rows = session.execute(query.group_by(month)).all()
+    return {key: {'rows': count, 'max_id': max_id, 'total_minutes': total} for key, count, max_id, total in rows}
+
+def event_months(session, after: int) -> Set[str]:
+    """Месяцы, записи которых менялись после события after журнала entry_events"""
+    months = set()
+    for column in (EntryEvent.entry_date, EntryEvent.old_entry_date):
+        month = func.strftime('%Y-%m', column)
+        months.update(session.execute(
+            select(month).where(EntryEvent.seq > after, EntryEvent.op != 'archive', column.isnot(None)).distinct()
+        ).scalars())
+    return months
+
+def to_table(df: pd.DataFrame) -> pa.Table:
+    """Записи из query_entries в таблицу Arrow со схемой снимка"""
+    if df.empty:
+        return SCHEMA.empty_table()
+    return pa.Table.from_pandas(df[ENTRY_FIELDS], schema=SCHEMA, preserve_index=False)
+
+def write_snapshot(db_engine: Engine, directory: str = SNAPSHOT_DIR, now: Optional[datetime] = None,
+                   rebuild: Iterable[str] = (), check_sealed: bool = False,
+                   drop_before: Optional[datetime] = None, changed: Iterable[str] = ()) -> dict:
+    """
+    Обновляет снимок и возвращает список переписанных месяцев
+
+    Месяцы раньше текущего (по UTC, как entry_date) запечатываются. Обычно
+    база читается только после последнего запечатанного месяца (по индексу
+    entry_date). С check_sealed сверяются и запечатанные месяцы: изменившиеся
+    не переписываются, а помечаются в манифесте как stale (их читают из
+    базы) - переписать их можно через rebuild. Запечатанные месяцы из
+    changed (изменения по журналу событий) помечаются stale без сверки.
+    Месяцы раньше drop_before (граница архива, см. analytics/archive.py)
+    удаляются из снимка.
+    """
+    manifest = read_manifest(directory)
+    months = manifest['months']
+    current = month_key(now or datetime.utcnow())
+    rebuild, changed = set(rebuild), set(changed)
+    upgraded = manifest['version'] != SCHEMA_VERSION
+    if upgraded:
+        logger.info("Снимок версии %s переписывается в версию %s", manifest['version'], SCHEMA_VERSION)
+        rebuild.update(months)
+        manifest['version'] = SCHEMA_VERSION
+    written, stale, marked = [], [], False
+    sealed_keys = sorted(key for key, state in months.items() if state['sealed'])
+    since = None if check_sealed or rebuild or not sealed_keys else next_month_start(sealed_keys[-1])
+
+    with Session(db_engine) as session:
+        signatures = month_signatures(session, since)
+        for key, signature in sorted(signatures.items()):
+            if drop_before and month_start(key) < drop_before:
+                # Записи, ожидающие следующего запуска архивации
+                continue
+            state = months.get(key, {})
+            sealed = key < current
+            unchanged = all(state.get(name) == value for name, value in signature.items())
+            if key not in rebuild:
+                if state.get('sealed'):
+                    if not unchanged or key in changed:
+                        stale.append(key)
+                        marked = marked or not state.get('stale')
+                        state['stale'] = True
+                    continue
+                if unchanged and state.get('sealed') == sealed:
+                    continue
+
+            table = to_table(query_entries(session, month_start(key), next_month_start(key)))
+            replace_file(partition_path(directory, key), lambda path: pq.write_table(table, path))
+            months[key] = {**signature, 'sealed': sealed, 'written_at': datetime.utcnow().isoformat(timespec='seconds')}
+            written.append(key)
+
+    # Незапечатанные месяцы, из которых удалены все записи (все они позже since),
+    # и месяцы, перенесенные в архив
+    for key in [
+        key for key, state in months.items()
+        if (key not in signatures and not state['sealed']) or (drop_before and month_start(key) < drop_before)
+    ]:
+        os.remove(partition_path(directory, key))
+        os.rmdir(os.path.dirname(partition_path(directory, key)))
+        del months[key]
+        written.append(key)
+
+    if stale:
+        logger.warning("Запечатанные месяцы изменились в базе: %s (переписать: --rebuild)", ', '.join(stale))
+    if written or marked or upgraded or not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        _write_manifest(directory, manifest)
+    return {'written': written, 'stale': stale}
+
+def sealed_months(directory: str) -> List[str]:
+    """Запечатанные месяцы снимка; у снимка старой версии - ни одного"""
+    manifest = read_manifest(directory)
+    if manifest['version'] != SCHEMA_VERSION:
+        return []
+    return sorted(key for key, state in manifest['months'].items() if state['sealed'])
+
+def stale_months(directory: str) -> List[str]:
+    """Запечатанные месяцы, файлы которых отстали от базы"""
+    manifest = read_manifest(directory)
+    return sorted(key for key, state in manifest['months'].items() if state['sealed'] and state.get('stale'))
+
+def read_parquet(path: str) -> pa.Table:
+    """Читает файл снимка или архива через отображение в память (недостающие колонки - пустые)"""
+    return pq.read_table(path, memory_map=True, schema=SCHEMA)
+
+def snapshot_table(session, directory: str = SNAPSHOT_DIR, since: Optional[datetime] = None) -> Optional[pa.Table]:
+    """
+    Записи начиная с since: запечатанные месяцы из снимка, хвост из базы
+
+    Файлы Parquet открываются через отображение в память: колонки
+    декодируются прямо из страниц файла, без чтения в промежуточные буферы.
+    Устаревшие (stale) месяцы читаются из базы. Возвращает None, если
+    подходящих запечатанных месяцев нет.
+    """
+    sealed = [key for key in sealed_months(directory) if since is None or month_start(key) >= since]
+    if not sealed:
+        return None
+    stale = set(stale_months(directory))
+    tables = [
+        to_table(query_entries(session, month_start(key), next_month_start(key))) if key in stale
+        else read_parquet(partition_path(directory, key))
+        for key in sealed
+    ]
+    tail = query_entries(session, since=next_month_start(sealed[-1]))
+    return pa.concat_tables(tables + [to_table(tail)])
+
+def load_snapshot(session, directory: str = SNAPSHOT_DIR) -> Optional[pd.DataFrame]:
+    """Записи с производными колонками из снимка и хвоста базы (None без снимка)"""
+    table = snapshot_table(session, directory)
+    return None if table is None else add_derived_columns(table.to_pandas())
@@ -0,0 +1,44 @@
+"""
+Резервное копирование базы по расписанию внутри процесса бота
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from database.backup import BACKUP_DIR, BACKUP_KEEP, database_path, latest_backup, run_backup
+from database.engine import DATABASE_URL
+from .metrics import BACKUP_DURATION, BACKUP_ERRORS, BACKUP_LAST_SUCCESS
+
+logger = logging.getLogger(__name__)
+
+class BackupManager:
+    def __init__(self, interval_hours: float, url: str = DATABASE_URL,
+                 directory: str = BACKUP_DIR, keep: int = BACKUP_KEEP):
+        self.interval = interval_hours * 3600
+        self.path = database_path(url)
+        self.directory = directory
+        self.keep = keep
+
+    def seconds_until_next(self) -> float:
+        """Сколько ждать до следующей копии: отсчет от последней, а не от запуска бота"""
+        latest = latest_backup(self.directory)
+        if latest is None:
+            return 0.0
+        return max(0.0, os.path.getmtime(latest) + self.interval - time.time())
+
+    async def start_backup_loop(self):
+        """Запускает цикл резервного копирования"""
+        while True:
+            await asyncio.sleep(self.seconds_until_next())
+            try:
+                # Копирование и сжатие - в отдельном потоке, чтобы не останавливать цикл событий
+                result = await asyncio.to_thread(run_backup, self.path, self.directory, self.keep)
+                BACKUP_DURATION.set(result['copy_s'], stage='copy')
+                BACKUP_DURATION.set(result['compress_s'], stage='compress')
+                BACKUP_LAST_SUCCESS.set(time.time())
+            except Exception as e:
+                BACKUP_ERRORS.inc()
+                logger.error("Ошибка резервного копирования: %s", e)
+                await asyncio.sleep(min(self.interval, 3600))  # Повторим не раньше чем через час
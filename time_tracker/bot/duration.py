@@ -0,0 +1,115 @@
+"""
+Безопасный разбор продолжительности, введенной пользователем
+
+Поддерживаются целые и дробные числа, арифметика `+ - * /`, скобки
+и единицы измерения: `90`, `45+30`, `1h30m`, `1.5ч`, `90м`, `2ч 15мин`.
+Выражение разбирается через AST с белым списком узлов и ограничениями
+на длину ввода, глубину дерева и размер операндов, поэтому стоимость
+вычисления ограничена для любого ввода.
+"""
+
+import ast
+import math
+import operator
+import re
+
+# Ограничения на ввод
+MAX_INPUT_LENGTH = 64
+MAX_DEPTH = 16
+MAX_VALUE = 1_000_000
+
+# Единицы измерения и их множители в минутах
+_HOUR_UNITS = r"ч(?:ас(?:а|ов)?)?|h(?:ours?|rs?)?"
+_MINUTE_UNITS = r"м(?:ин(?:ут[аы]?)?)?|m(?:in(?:utes?|s)?)?"
+
+_UNIT_TERM = (
+    r"(\d+(?:[.,]\d+)?)\s*"
+    rf"(?:({_HOUR_UNITS})|({_MINUTE_UNITS}))"
+    r"(?![a-zа-яё])"
+)
+_UNIT_TERM_RE = re.compile(_UNIT_TERM, re.IGNORECASE)
+_UNIT_SEQUENCE_RE = re.compile(rf"{_UNIT_TERM}(?:\s*{_UNIT_TERM})*", re.IGNORECASE)
+_DECIMAL_COMMA_RE = re.compile(r"(?<=\d),(?=\d)")
+_ALLOWED_CHARS_RE = re.compile(r"^[\d\s.+\-*/()]+$")
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+_UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+def _expand_units(match: re.Match) -> str:
+    """Заменяет последовательность вида `1ч 30м` на выражение в минутах"""
+    terms = []
+    for term in _UNIT_TERM_RE.finditer(match.group(0)):
+        number = term.group(1).replace(',', '.')
+        factor = 60 if term.group(2) else 1
+        terms.append(f"{number}*{factor}")
+    return "(" + "+".join(terms) + ")"
+
+def _check_value(value: float) -> float:
+    """Проверяет, что промежуточный результат не выходит за пределы"""
+    if not math.isfinite(value) or abs(value) > MAX_VALUE:
+        raise ValueError("Слишком большое значение")
+    return value
+
+def _evaluate(node: ast.AST, depth: int = 0) -> float:
+    """Вычисляет узел AST, разрешая только арифметику над числами"""
+    if depth > MAX_DEPTH:
+        raise ValueError("Слишком сложное выражение")
+
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body, depth + 1)
+
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ValueError("Недопустимое значение")
+        return _check_value(node.value)
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        operand = _evaluate(node.operand, depth + 1)
+        return _check_value(_UNARY_OPERATORS[type(node.op)](operand))
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        left = _evaluate(node.left, depth + 1)
+        right = _evaluate(node.right, depth + 1)
+        if isinstance(node.op, ast.Div) and right == 0:
+            raise ValueError("Деление на ноль")
+        return _check_value(_BINARY_OPERATORS[type(node.op)](left, right))
+
+    raise ValueError("Недопустимое выражение")
+
+def parse_duration(text: str) -> int:
+    """
+    Преобразует ввод пользователя в количество минут
+
+    Raises:
+        ValueError: если ввод не является допустимым выражением
+    """
+    if text is None:
+        raise ValueError("Пустой ввод")
+
+    text = text.strip()
+    if not text:
+        raise ValueError("Пустой ввод")
+    if len(text) > MAX_INPUT_LENGTH:
+        raise ValueError("Слишком длинный ввод")
+
+    expression = _UNIT_SEQUENCE_RE.sub(_expand_units, text)
+    expression = _DECIMAL_COMMA_RE.sub('.', expression)
+
+    if not _ALLOWED_CHARS_RE.match(expression):
+        raise ValueError("Недопустимые символы")
+
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except (SyntaxError, ValueError):
+        raise ValueError("Не удалось разобрать выражение")
+
+    return int(round(_evaluate(tree)))
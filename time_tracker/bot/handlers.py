@@ -1,41 +1,41 @@
 from aiogram import Router, F
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from .states import Form
+from .duration import parse_duration
+from .importer import import_entries, ImportResult
+from .suggestions import activity_suggestions
 from database.models import TimeEntry, ActivityCategory
-from database.engine import get_session, close_session, force_save
-import os
-from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from database.classifier import classify_activity
+from database.queries import activity_totals, entries_for_day, recent_entries
+from database.search import search_activities
+from database.shards import UserMoving
+from database.timezones import get_timezone, local_now, parse_timezone, set_timezone
+from sqlalchemy.orm import Session
+from datetime import datetime
 import asyncio
+import os
+import tempfile
+import time
 
-# Загружаем переменные окружения
-load_dotenv()
-
+# Доступ к обработчикам проверяет AccessMiddleware (см. bot/middlewares.py)
 router = Router()
 
-# Получаем ID администратора из переменных окружения
-ADMIN_USER_ID = int(os.getenv('ADMIN_USER_ID'))
-
-def is_admin(user_id: int) -> bool:
-    """Проверяет, является ли пользователь администратором"""
-    return user_id == ADMIN_USER_ID
-
 @router.message(Command("start"))
 async def cmd_start(message: Message):
     """Обработчик команды /start"""
-    if not is_admin(message.from_user.id):
-        await message.answer("У вас нет доступа к этому боту.")
-        return
-    
     await message.answer(
         "Привет! Я бот для учета времени.\n\n"
         "Доступные команды:\n"
         "📝 /add - Добавить новую запись о потраченном времени\n"
+        "⚡ /a <задача> - Быстрое добавление, категория определится сама\n"
         "📊 /stats - Статистика за сегодня\n"
         "🔔 /remind - Управление напоминаниями\n"
+        "🔎 /find <текст> - Найти записи по названию задачи\n"
+        "🕐 /tz - Часовой пояс для статистики за день\n"
+        "📥 /import - Импорт записей из CSV/JSON файла\n"
         "❌ /cancel - Отменить текущую операцию\n\n"
         "Категории активности:\n"
         "💼 Работа - профессиональная деятельность\n"
@@ -43,24 +43,53 @@ async def cmd_start(message: Message):
         "😴 Отдых - личное время и восстановление"
     )
 
-def get_category_keyboard():
+CATEGORY_BUTTONS = {
+    ActivityCategory.WORK: "💼 Работа",
+    ActivityCategory.STUDY: "📚 Учеба",
+    ActivityCategory.REST: "😴 Отдых"
+}
+
+def get_category_keyboard(prefix: str = "category", selected: ActivityCategory = None):
     """Создает клавиатуру для выбора категории"""
+    def button(category):
+        text = CATEGORY_BUTTONS[category]
+        if category == selected:
+            text = f"✅ {text}"
+        return InlineKeyboardButton(text=text, callback_data=f"{prefix}_{category.value}")
+    
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="💼 Работа", callback_data="category_work"),
-            InlineKeyboardButton(text="📚 Учеба", callback_data="category_study")
+            button(ActivityCategory.WORK),
+            button(ActivityCategory.STUDY)
         ],
         [
-            InlineKeyboardButton(text="😴 Отдых", callback_data="category_rest")
+            button(ActivityCategory.REST)
         ]
     ])
     return keyboard
 
+def quick_add_text(activity_name: str, category: ActivityCategory, automatic: bool = True) -> str:
+    """Текст быстрого добавления с выбранной категорией"""
+    hint = "выбрана автоматически, при необходимости смените ее кнопками ниже" if automatic else "изменена"
+    return (
+        f"📝 Задача: {activity_name}\n"
+        f"{CATEGORY_BUTTONS[category]} - категория {hint}\n\n"
+        f"Сколько минут это заняло?"
+    )
+
 @router.message(Command("a"))
-async def cmd_add(message: Message, state: FSMContext):
-    """Обработчик команды /add"""
-    if not is_admin(message.from_user.id):
-        await message.answer("У вас нет доступа к этому боту.")
+async def cmd_add(message: Message, state: FSMContext, command: CommandObject):
+    """Обработчик команды /add (с названием задачи - быстрое добавление)"""
+    if command.args and command.args.strip():
+        # Быстрое добавление: категорию определяем по ключевым словам
+        category = classify_activity(command.args)
+        activity_name = activity_suggestions.canonical_name(message.from_user.id, category, command.args)
+        await state.update_data(category=category, activity_name=activity_name)
+        await state.set_state(Form.waiting_for_duration)
+        await message.answer(
+            quick_add_text(activity_name, category),
+            reply_markup=get_category_keyboard(prefix="recategory", selected=category)
+        )
         return
     
     await state.set_state(Form.waiting_for_category)
@@ -69,13 +98,25 @@ async def cmd_add(message: Message, state: FSMContext):
         reply_markup=get_category_keyboard()
     )
 
+@router.callback_query(Form.waiting_for_duration, F.data.startswith('recategory_'))
+async def process_category_change(callback: CallbackQuery, state: FSMContext):
+    """Обработчик смены автоматически выбранной категории"""
+    try:
+        category = ActivityCategory(callback.data.split('_')[1])
+    except ValueError:
+        await callback.answer("Неверная категория!")
+        return
+    
+    data = await state.get_data()
+    await state.update_data(category=category)
+    await callback.message.edit_text(
+        quick_add_text(data.get('activity_name'), category, automatic=False),
+        reply_markup=get_category_keyboard(prefix="recategory", selected=category)
+    )
+
 @router.message(Command("cancel"))
 async def cmd_cancel(message: Message, state: FSMContext):
     """Обработчик команды /cancel"""
-    if not is_admin(message.from_user.id):
-        await message.answer("У вас нет доступа к этому боту.")
-        return
-    
     current_state = await state.get_state()
     if current_state is None:
         await message.answer("Нет активной операции для отмены.")
@@ -85,22 +126,16 @@ async def cmd_cancel(message: Message, state: FSMContext):
     await message.answer("Операция отменена.")
 
 @router.message(Command("stats"))
-async def cmd_stats(message: Message):
+async def cmd_stats(message: Message, session: Session):
     """Обработчик команды /stats - показывает статистику за сегодня"""
-    if not is_admin(message.from_user.id):
-        await message.answer("У вас нет доступа к этому боту.")
-        return
-    
-    session = get_session()
     try:
-        today = datetime.now().date()
+        # "Сегодня" - по часовому поясу пользователя (см. /tz)
+        today = local_now(session, message.from_user.id).date()
         
         # Получаем записи за сегодня
-        today_entries = session.query(TimeEntry).filter(
-            TimeEntry.user_id == message.from_user.id,
-            TimeEntry.entry_date >= today,
-            TimeEntry.entry_date < today + timedelta(days=1)
-        ).all()
+        today_entries = entries_for_day(session, message.from_user.id, today)
+        # Возвращаем соединение в пул до ответа, чтобы не держать его во время await
+        session.close()
         
         if not today_entries:
             await message.answer("📊 Сегодня еще нет записей о времени.")
@@ -139,16 +174,65 @@ async def cmd_stats(message: Message):
     except Exception as e:
         await message.answer("❌ Ошибка при получении статистики.")
         print(f"Error getting stats: {e}")
-    finally:
-        close_session(session)
+
+# Сколько задач и последних записей показывать в ответе /find
+FIND_ACTIVITIES_LIMIT = 10
+FIND_RECENT_LIMIT = 5
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes//60}ч {minutes%60}мин" if minutes >= 60 else f"{minutes}мин"
+
+@router.message(Command("find"))
+async def cmd_find(message: Message, command: CommandObject, session: Session):
+    """Обработчик команды /find - ищет записи по названию задачи"""
+    query = (command.args or '').strip()
+    if not query:
+        await message.answer(
+            "🔎 Укажите, что искать: /find код ревью\n"
+            "Слова ищутся по началу: «прог» найдет «Программирование»."
+        )
+        return
+    
+    user_id = message.from_user.id
+    try:
+        # Задачи - по индексу полнотекстового поиска, итоги - вместе с архивом
+        activity_ids = search_activities(session.connection(), query, user_id=user_id)
+        totals = activity_totals(session, user_id, activity_ids)
+        recent = recent_entries(session, user_id, activity_ids, FIND_RECENT_LIMIT)
+        session.close()
+    except Exception as e:
+        await message.answer("❌ Ошибка при поиске.")
+        print(f"Error searching entries: {e}")
+        return
+    
+    if not totals:
+        await message.answer(f"🔎 По запросу «{query}» ничего не найдено.")
+        return
+    
+    total_minutes = sum(total['minutes'] for total in totals)
+    total_entries = sum(total['entries'] for total in totals)
+    text = (
+        f"🔎 «{query}»: задач {len(totals)}\n"
+        f"⏰ Общее время: {format_minutes(total_minutes)}\n"
+        f"📝 Записей: {total_entries}\n\n"
+    )
+    for total in totals[:FIND_ACTIVITIES_LIMIT]:
+        emoji = CATEGORY_BUTTONS[total['category']].split()[0]
+        last = f", последняя {total['last'].strftime('%d.%m.%Y')}" if total['last'] else ""
+        text += f"{emoji} {total['name']}: {format_minutes(total['minutes'])} ({total['entries']} записей{last})\n"
+    if len(totals) > FIND_ACTIVITIES_LIMIT:
+        text += f"…и еще задач: {len(totals) - FIND_ACTIVITIES_LIMIT}\n"
+    if recent:
+        text += "\n🕐 Последние записи:\n"
+        for entry in recent:
+            day = entry.local_date or entry.entry_date.date()
+            text += f"{day.strftime('%d.%m.%Y')} {entry.activity_name} - {format_minutes(entry.duration_minutes)}\n"
+    
+    await message.answer(text)
 
 @router.message(Command("remind"))
 async def cmd_remind(message: Message):
     """Обработчик команды /remind - включает/выключает напоминания"""
-    if not is_admin(message.from_user.id):
-        await message.answer("У вас нет доступа к этому боту.")
-        return
-    
     # Здесь можно добавить логику для управления напоминаниями
     await message.answer(
         "🔔 Управление напоминаниями:\n\n"
@@ -157,14 +241,120 @@ async def cmd_remind(message: Message):
         "Используйте /add для добавления записей."
     )
 
+@router.message(Command("tz"))
+async def cmd_timezone(message: Message, command: CommandObject, session: Session):
+    """Обработчик команды /tz - показывает или меняет часовой пояс"""
+    user_id = message.from_user.id
+    if not command.args:
+        zone = get_timezone(session, user_id)
+        session.close()
+        await message.answer(
+            f"🕐 Ваш часовой пояс: {zone.key}\n"
+            f"Сейчас: {datetime.now(zone).strftime('%d.%m.%Y %H:%M')}\n\n"
+            "Изменить: /tz Europe/Moscow (название из базы IANA)"
+        )
+        return
+    
+    try:
+        zone = parse_timezone(command.args)
+    except ValueError:
+        await message.answer(
+            f"❌ Не знаю часовой пояс «{command.args.strip()}».\n"
+            "Примеры: Europe/Moscow, Asia/Yekaterinburg, UTC"
+        )
+        return
+    
+    bind = session.get_bind()
+    session.close()
+    try:
+        # Пересчет дней всех записей пользователя - в потоке, чтобы не держать цикл событий
+        updated = await asyncio.to_thread(set_timezone, bind, user_id, zone)
+    except Exception as e:
+        await message.answer("❌ Не удалось сохранить часовой пояс.")
+        print(f"Error setting timezone: {e}")
+        return
+    
+    await message.answer(
+        f"✅ Часовой пояс: {zone.key}\n"
+        f"Сейчас: {datetime.now(zone).strftime('%d.%m.%Y %H:%M')}\n"
+        f"📝 Пересчитано записей: {updated}"
+    )
+
+# Максимальный размер файла, который Bot API позволяет скачать
+MAX_IMPORT_FILE_SIZE = 20 * 1024 * 1024
+
+@router.message(Command("import"))
+async def cmd_import(message: Message):
+    """Обработчик команды /import - подсказка по формату файла"""
+    await message.answer(
+        "📥 Импорт записей\n\n"
+        "Отправьте файл .csv или .json (массив объектов или JSON Lines).\n"
+        "Подходит CSV, выгруженный из дашборда, или колонки:\n"
+        "activity_name, category, duration_minutes, entry_date\n\n"
+        "Категория: work, study или rest. Время: минуты или 1ч 30мин."
+    )
+
+def format_import_result(result: ImportResult, finished: bool) -> str:
+    """Формирует текст о ходе импорта"""
+    title = "✅ Импорт завершен" if finished else "⏳ Импорт..."
+    text = f"{title}\n\n📝 Добавлено: {result.imported}\n❌ Ошибок: {result.failed}"
+    if finished and result.errors:
+        text += "\n\n" + "\n".join(result.errors)
+        if result.failed > len(result.errors):
+            text += f"\n... и еще {result.failed - len(result.errors)}"
+    return text
+
+@router.message(F.document)
+async def process_import_document(message: Message):
+    """Обработчик загруженного файла для импорта"""
+    document = message.document
+    file_name = (document.file_name or '').lower()
+    if file_name.endswith('.csv'):
+        file_format = 'csv'
+    elif file_name.endswith(('.json', '.jsonl', '.ndjson')):
+        file_format = 'json'
+    else:
+        await message.answer("Поддерживаются только файлы .csv и .json")
+        return
+    
+    if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+        await message.answer("Файл слишком большой (максимум 20 МБ).")
+        return
+    
+    status = await message.answer("⏳ Загружаю файл...")
+    last_progress = time.monotonic()
+    
+    async def report_progress(result: ImportResult):
+        # Обновляем сообщение не чаще раза в 2 секунды, чтобы не упереться в лимиты API
+        nonlocal last_progress
+        if time.monotonic() - last_progress < 2:
+            return
+        last_progress = time.monotonic()
+        try:
+            await status.edit_text(format_import_result(result, finished=False))
+        except Exception as e:
+            print(f"Error updating import progress: {e}")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Файл скачивается на диск и читается потоково
+        path = os.path.join(tmp_dir, 'import')
+        try:
+            await message.bot.download(document, destination=path)
+            with open(path, encoding='utf-8-sig', newline='') as file:
+                result = await import_entries(file, file_format, message.from_user.id, progress=report_progress)
+        except UserMoving:
+            await status.edit_text("⏳ Ваши данные переносятся, повторите импорт через минуту.")
+            return
+        except Exception as e:
+            await status.edit_text(f"❌ Не удалось импортировать файл: {e}")
+            print(f"Error importing file: {e}")
+            return
+    
+    await status.edit_text(format_import_result(result, finished=True))
+
 @router.callback_query(lambda c: c.data.startswith('category_'))
 async def process_category_selection(callback: CallbackQuery, state: FSMContext):
     """Обработчик выбора категории"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("У вас нет доступа к этому боту.")
-        await state.clear()
-        return
-    
     # Извлекаем категорию из callback_data
     category_str = callback.data.split('_')[1]
     category_mapping = {
@@ -191,42 +381,77 @@ async def process_category_selection(callback: CallbackQuery, state: FSMContext)
         ActivityCategory.REST: "😴 Примеры: Физические упражнения, Чтение книг, Медитация, Хобби"
     }
     
+    # Частые задачи пользователя берутся из памяти, без запроса к базе
+    suggestions = activity_suggestions.top(callback.from_user.id, category)
+    await state.update_data(suggestions=suggestions)
+    
+    hint = "👇 Выберите недавнюю задачу или введите новую" if suggestions else examples[category]
     await callback.message.edit_text(
         f"Выбрана категория: {category.value.upper()}\n\n"
-        f"{examples[category]}\n\n"
-        f"На какую задачу ты потратил(а) время?"
+        f"{hint}\n\n"
+        f"На какую задачу ты потратил(а) время?",
+        reply_markup=get_suggestions_keyboard(suggestions)
     )
 
+def get_suggestions_keyboard(suggestions):
+    """Создает клавиатуру с частыми задачами (по две в ряд)"""
+    if not suggestions:
+        return None
+    buttons = [
+        InlineKeyboardButton(text=name[:64], callback_data=f"activity_{i}")
+        for i, name in enumerate(suggestions)
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[buttons[i:i + 2] for i in range(0, len(buttons), 2)])
+
+@router.callback_query(Form.waiting_for_activity_name, F.data.startswith('activity_'))
+async def process_activity_suggestion(callback: CallbackQuery, state: FSMContext):
+    """Обработчик выбора задачи из подсказок"""
+    data = await state.get_data()
+    suggestions = data.get('suggestions') or []
+    index = callback.data.split('_')[1]
+    if not index.isdigit() or int(index) >= len(suggestions):
+        await callback.answer("Подсказка устарела, введите задачу текстом.")
+        return
+    
+    activity_name = suggestions[int(index)]
+    await state.update_data(activity_name=activity_name)
+    await state.set_state(Form.waiting_for_duration)
+    await callback.message.edit_text(f"📝 Задача: {activity_name}\n\nСколько минут это заняло?")
+
 @router.message(Form.waiting_for_activity_name)
 async def process_activity_name(message: Message, state: FSMContext):
     """Обработчик ввода названия активности"""
-    if not is_admin(message.from_user.id):
-        await message.answer("У вас нет доступа к этому боту.")
-        await state.clear()
+    if not message.text:
+        await message.answer("Пожалуйста, введите название задачи текстом.")
         return
     
+    # Используем уже известное написание задачи, чтобы не плодить дубликаты
+    data = await state.get_data()
+    activity_name = activity_suggestions.canonical_name(
+        message.from_user.id, data.get('category'), message.text
+    )
+    
     # Сохраняем название активности
-    await state.update_data(activity_name=message.text)
+    await state.update_data(activity_name=activity_name)
     
     # Переходим к следующему состоянию
     await state.set_state(Form.waiting_for_duration)
     await message.answer("Сколько минут это заняло?")
 
 @router.message(Form.waiting_for_duration)
-async def process_duration(message: Message, state: FSMContext):
+async def process_duration(message: Message, state: FSMContext, session: Session):
     """Обработчик ввода продолжительности"""
-    if not is_admin(message.from_user.id):
-        await message.answer("У вас нет доступа к этому боту.")
-        await state.clear()
-        return
-    
     try:
-        duration = int(eval(message.text))
-        if duration <= 0:
-            await message.answer("Продолжительность должна быть положительным числом. Попробуйте еще раз.")
-            return
+        duration = parse_duration(message.text)
     except ValueError:
-        await message.answer("Пожалуйста, введите число минут. Попробуйте еще раз.")
+        await message.answer(
+            "Пожалуйста, введите число минут. Попробуйте еще раз.\n"
+            "Можно использовать выражения и единицы: 45+30, 1h30m, 1.5ч, 90м"
+        )
+        return
+    
+    if duration <= 0:
+        await message.answer("Продолжительность должна быть положительным числом. Попробуйте еще раз.")
         return
     
     # Получаем данные из состояния
@@ -235,7 +460,6 @@ async def process_duration(message: Message, state: FSMContext):
     category = data.get('category')
     
     # Сохраняем запись в базу данных
-    session = get_session()
     try:
         time_entry = TimeEntry(
             user_id=message.from_user.id,
@@ -244,13 +468,11 @@ async def process_duration(message: Message, state: FSMContext):
             duration_minutes=duration
         )
         session.add(time_entry)
+        # Коммитим до ответа: транзакция с блокировкой записи SQLite не должна
+        # оставаться открытой на время await, иначе запись другого пользователя
+        # ждет busy_timeout прямо в цикле событий
         session.commit()
-        
-        # Принудительно сохраняем изменения
-        force_save()
-        
-        # Закрываем сессию
-        close_session(session)
+        activity_suggestions.record(message.from_user.id, category, activity_name)
         
         category_emoji = {
             ActivityCategory.WORK: "💼",
@@ -269,8 +491,6 @@ async def process_duration(message: Message, state: FSMContext):
         session.rollback()
         await message.answer("❌ Произошла ошибка при сохранении записи.")
         print(f"Error saving time entry: {e}")
-    finally:
-        close_session(session)
     
     # Очищаем состояние
     await state.clear() 
\ No newline at end of file
@@ -0,0 +1,240 @@
+"""
+Массовый импорт записей из CSV/JSON файла
+
+Файл читается потоково: строки проверяются по одной и вставляются пачками
+в отдельных транзакциях, поэтому в памяти находится только текущая пачка.
+Шард пользователя определяется один раз в начале импорта: если его данные
+переносятся, импорт сразу завершается с UserMoving.
+Поддерживаются колонки экспорта дашборда (`Задача`, `Категория`, `Время`,
+`Дата и время`) и имена полей модели (`activity_name`, `category`,
+`duration_minutes`, `entry_date`).
+"""
+
+import asyncio
+import csv
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from database.activities import ActivityResolver
+from database.shards import shard_router, user_session_scope
+from database.models import TimeEntry, ActivityCategory
+from .duration import parse_duration
+from .suggestions import activity_suggestions
+
+# Размер пачки для одной транзакции
+CHUNK_SIZE = 500
+# Сколько ошибок по строкам показывать пользователю
+MAX_REPORTED_ERRORS = 20
+# Максимальный размер одной записи JSON, чтобы битый файл не читался в память целиком
+MAX_JSON_RECORD_SIZE = 1024 * 1024
+
+# Возможные названия колонок: экспорт дашборда и поля модели
+NAME_COLUMNS = ('activity_name', 'Задача')
+CATEGORY_COLUMNS = ('category', 'Категория')
+DURATION_COLUMNS = ('duration_minutes', 'Время (мин)', 'Время')
+DATE_COLUMNS = ('entry_date', 'Дата и время')
+
+DATE_FORMATS = ('%d.%m.%Y %H:%M', '%d.%m.%Y %H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+@dataclass
+class ImportResult:
+    """Итоги импорта"""
+    imported: int = 0
+    failed: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def add_error(self, position: str, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"{position}: {message}")
+
+def _pick(row: Dict[str, Any], columns: Tuple[str, ...]) -> Any:
+    """Возвращает значение первой найденной колонки"""
+    for column in columns:
+        value = row.get(column)
+        if value not in (None, ''):
+            return value
+    return None
+
+def _parse_category(value: Any) -> ActivityCategory:
+    text = str(value).strip().lower()
+    for category in ActivityCategory:
+        if text in (category.value, category.name.lower()):
+            return category
+    raise ValueError(f"неизвестная категория '{value}'")
+
+def _parse_date(value: Any) -> datetime:
+    text = str(value).strip()
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    raise ValueError(f"не удалось разобрать дату '{value}'")
+
+def parse_row(row: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    """Проверяет строку файла и превращает ее в значения для вставки"""
+    if not isinstance(row, dict):
+        raise ValueError("запись должна быть объектом")
+
+    activity_name = _pick(row, NAME_COLUMNS)
+    if activity_name is None or not str(activity_name).strip():
+        raise ValueError("не указана задача")
+    activity_name = str(activity_name).strip()
+    if len(activity_name) > 255:
+        raise ValueError("слишком длинное название задачи")
+
+    category = _pick(row, CATEGORY_COLUMNS)
+    if category is None:
+        raise ValueError("не указана категория")
+
+    duration = _pick(row, DURATION_COLUMNS)
+    if duration is None:
+        raise ValueError("не указано время")
+    duration_minutes = parse_duration(str(duration))
+    if duration_minutes <= 0:
+        raise ValueError("время должно быть положительным")
+
+    entry_date = _pick(row, DATE_COLUMNS)
+    if entry_date is None:
+        raise ValueError("не указана дата")
+
+    return {
+        'user_id': user_id,
+        'activity_name': activity_name,
+        'category': _parse_category(category),
+        'duration_minutes': duration_minutes,
+        'entry_date': _parse_date(entry_date),
+    }
+
+def iter_csv_rows(file: TextIO) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Построчно читает CSV, возвращая номер строки и словарь значений"""
+    reader = csv.DictReader(file)
+    for row in reader:
+        yield f"Строка {reader.line_num}", row
+
+def iter_json_rows(file: TextIO, chunk_size: int = 64 * 1024) -> Iterator[Tuple[str, Any]]:
+    """
+    Потоково читает JSON: массив объектов или JSON Lines
+
+    Массив разбирается по одному элементу через `raw_decode`, не загружая
+    файл целиком. Файл должен поддерживать `seek`.
+    """
+    head = file.read(chunk_size).lstrip()
+    if not head.startswith('['):
+        # JSON Lines: один объект на строку
+        file.seek(0)
+        for line_number, line in enumerate(file, start=1):
+            if line.strip():
+                try:
+                    yield f"Строка {line_number}", json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield f"Строка {line_number}", ValueError(f"некорректный JSON: {e.msg}")
+        return
+
+    decoder = json.JSONDecoder()
+    buffer = head[1:]
+    record_number = 0
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(','):
+            buffer = buffer[1:].lstrip()
+        if buffer.startswith(']'):
+            return
+        if buffer:
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof or len(buffer) > MAX_JSON_RECORD_SIZE:
+                    raise ValueError(f"некорректный JSON после записи {record_number}")
+            else:
+                record_number += 1
+                buffer = buffer[end:]
+                yield f"Запись {record_number}", record
+                continue
+        elif eof:
+            raise ValueError("неожиданный конец JSON")
+
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+def _read_error_message(error: Exception, last_position: Optional[str]) -> str:
+    """Причина, по которой файл не дочитан"""
+    if isinstance(error, (UnicodeDecodeError, csv.Error)):
+        reason = "файл не в кодировке UTF-8" if isinstance(error, UnicodeDecodeError) else f"некорректный CSV: {error}"
+        # Ошибки JSON уже называют запись, после которой файл сломан
+        if last_position:
+            reason += f" после: {last_position.lower()}"
+        return reason
+    return str(error)
+
+def _insert_chunk(rows: List[Dict[str, Any]], resolver: ActivityResolver, sessions: Callable[[], Session]):
+    """Вставляет пачку записей в одной транзакции в шарде пользователя"""
+    with user_session_scope(rows[0]['user_id'], sessions) as session:
+        resolver.assign(session.connection(), rows)
+        session.execute(insert(TimeEntry), rows)
+
+async def import_entries(
+    file: TextIO,
+    file_format: str,
+    user_id: int,
+    progress: Optional[Callable[[ImportResult], Awaitable[None]]] = None,
+    chunk_size: int = CHUNK_SIZE
+) -> ImportResult:
+    """Импортирует записи из открытого файла формата `csv` или `json`"""
+    # UserMoving здесь, до первой пачки: перенос не прервет импорт на середине
+    sessions = await asyncio.to_thread(shard_router.pin, user_id)
+    rows_iter = iter_csv_rows(file) if file_format == 'csv' else iter_json_rows(file)
+    result = ImportResult()
+    resolver = ActivityResolver()
+    chunk: List[Dict[str, Any]] = []
+
+    async def flush():
+        # Запись в SQLite блокирующая, выполняем ее вне цикла событий
+        await asyncio.to_thread(_insert_chunk, chunk, resolver, sessions)
+        for row in chunk:
+            activity_suggestions.record(row['user_id'], row['category'], row['activity_name'], at=row['entry_date'])
+        result.imported += len(chunk)
+        chunk.clear()
+        if progress:
+            await progress(result)
+
+    last_position = None
+    while True:
+        # Ошибка чтения файла (битый JSON, не UTF-8, некорректный CSV) останавливает
+        # чтение: прочитанные записи сохраняются, а ошибка попадает в итоги импорта,
+        # чтобы пользователь видел, что уже добавлено
+        try:
+            position, row = next(rows_iter)
+        except StopIteration:
+            break
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            result.add_error("Чтение файла", f"{_read_error_message(e, last_position)}; остаток файла не импортирован")
+            break
+        last_position = position
+
+        try:
+            if isinstance(row, Exception):
+                raise row
+            chunk.append(parse_row(row, user_id))
+        except ValueError as e:
+            result.add_error(position, str(e))
+            continue
+
+        if len(chunk) >= chunk_size:
+            await flush()
+
+    if chunk:
+        await flush()
+    return result
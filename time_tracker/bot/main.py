@@ -1,13 +1,21 @@
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
 from dotenv import load_dotenv
+from sqlalchemy.orm import Session
 import os
 
 from .handlers import router
+from .middlewares import AccessList, AccessMiddleware, DbSessionMiddleware, setup_access_middleware
 from .reminders import ReminderManager
-from database.engine import create_tables
+from .backups import BackupManager
+from .webhook import run_webhook
+from .metrics import instrument_engine, monitor_event_loop_lag, setup_metrics, start_metrics_server
+from .suggestions import activity_suggestions
+from database.backup import BACKUP_DIR
+from database.engine import engine
+from database.shards import shard_directory, shard_router
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -26,15 +34,40 @@ async def main():
     # Создаем экземпляры бота и диспетчера
     bot = Bot(token=bot_token)
     storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+    # Обновления одного пользователя обрабатываются по очереди, чтобы не путать FSM
+    dp = Dispatcher(storage=storage, events_isolation=SimpleEventIsolation())
+    
+    # Проверка доступа и ограничение частоты до маршрутизации и загрузки FSM
+    access_middleware = AccessMiddleware(
+        AccessList(ttl=float(os.getenv('ACCESS_CACHE_TTL', '300'))),
+        rate=float(os.getenv('THROTTLE_RATE', '1')),
+        burst=float(os.getenv('THROTTLE_BURST', '5')),
+        notice_window=float(os.getenv('REJECT_NOTICE_WINDOW', '60'))
+    )
+    setup_access_middleware(dp, access_middleware)
+    
+    # Одна сессия базы данных на каждое обновление
+    dp.update.middleware(DbSessionMiddleware())
     
     # Регистрируем роутер с обработчиками
     dp.include_router(router)
     
-    # Создаем таблицы в базе данных
+    # Метрики обработчиков, запросов к Telegram и базы данных
+    setup_metrics(dp, bot, engine)
+    for name in shard_router.names[1:]:
+        instrument_engine(shard_router.engine(name))
+    
+    # Создаем таблицы в базе данных и во всех шардах (SHARD_COUNT)
     try:
-        create_tables()
+        shard_router.create_all()
         print("✅ База данных инициализирована")
+        if shard_router.sharded:
+            print(f"🗂 Шардов: {len(shard_router.names)}")
+        
+        # Прогреваем подсказки частых задач
+        for name in shard_router.names:
+            with Session(shard_router.engine(name)) as session:
+                activity_suggestions.warm_up(session)
     except Exception as e:
         print(f"❌ Ошибка при инициализации базы данных: {e}")
         print("💡 Убедитесь, что у вас есть права на создание директории 'data'")
@@ -50,8 +83,28 @@ async def main():
         # Запускаем напоминания в фоне
         reminder_task = asyncio.create_task(reminder_manager.start_reminder_loop())
         
-        # Запускаем бота
-        await dp.start_polling(bot)
+        # Резервные копии файла SQLite по расписанию (BACKUP_INTERVAL_HOURS=0 отключает)
+        # Копии шардов - в подкаталогах BACKUP_DIR с их именами
+        backup_hours = float(os.getenv('BACKUP_INTERVAL_HOURS', '24'))
+        backup_tasks = []
+        for name, url in shard_router.urls.items():
+            if backup_hours > 0 and url.startswith('sqlite:///'):
+                manager = BackupManager(backup_hours, url=url, directory=shard_directory(BACKUP_DIR, name))
+                backup_tasks.append(asyncio.create_task(manager.start_backup_loop()))
+        if backup_tasks:
+            print(f"💾 Резервные копии базы каждые {backup_hours:g} ч")
+        
+        # Метрики в формате Prometheus на локальном порту (METRICS_PORT=0 отключает)
+        metrics_port = int(os.getenv('METRICS_PORT', '9101'))
+        if metrics_port:
+            metrics_runner = await start_metrics_server(os.getenv('METRICS_HOST', '127.0.0.1'), metrics_port)
+            loop_lag_task = asyncio.create_task(monitor_event_loop_lag())
+        
+        # Запускаем бота в выбранном режиме: polling (по умолчанию) или webhook
+        if os.getenv('BOT_MODE', 'polling').lower() == 'webhook':
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
     except KeyboardInterrupt:
         print("\n🛑 Бот остановлен пользователем")
     except Exception as e:
@@ -60,6 +113,11 @@ async def main():
         # Отменяем задачу напоминаний
         if 'reminder_task' in locals():
             reminder_task.cancel()
+        for backup_task in locals().get('backup_tasks', []):
+            backup_task.cancel()
+        if 'metrics_runner' in locals():
+            loop_lag_task.cancel()
+            await metrics_runner.cleanup()
         await bot.session.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,280 @@
+"""
+Метрики процесса бота в текстовом формате Prometheus
+
+Небольшой реестр счетчиков, показателей и гистограмм без внешних
+зависимостей. Метрики собираются middleware обработчиков и запросов к
+Telegram, слушателями движка базы данных, циклами напоминаний и резервного
+копирования и фоновым замером задержки цикла событий; сервер отдает их по
+адресу /metrics.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import TelegramObject
+from aiohttp import web
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+class _Metric(ABC):
+    """Общая часть метрик: имя, описание и имена меток"""
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labels}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    @abstractmethod
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """Строки метрики: суффикс имени, метки и значение"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return '\n'.join(lines)
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        return [('', _format_labels(self.labels, key), value) for key, value in self._values.items()]
+
+class Gauge(_Metric):
+    """Текущее значение; может вычисляться функцией в момент чтения"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._collect = collect
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def samples(self):
+        values = self._collect() if self._collect else self._values
+        return [('', _format_labels(self.labels, key), value) for key, value in values.items()]
+
+class Histogram(_Metric):
+    """Распределение значений по накопительным корзинам"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        # Корзины, затем сумма и количество
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self):
+        result = []
+        for key, series in self._series.items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labels + ('le',), key + (_format_value(bound),))
+                result.append(('_bucket', labels, cumulative))
+            labels = _format_labels(self.labels, key)
+            result.append(('_sum', labels, series[-2]))
+            result.append(('_count', labels, series[-1]))
+        return result
+
+class Registry:
+    """Набор метрик, отдаваемый одним ответом"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+
+registry = Registry()
+
+HANDLER_DURATION = registry.register(Histogram(
+    'bot_handler_duration_seconds', 'Время обработчика по имени и состоянию FSM', ('handler', 'state')
+))
+HANDLER_ERRORS = registry.register(Counter(
+    'bot_handler_errors_total', 'Исключения в обработчиках', ('handler',)
+))
+DB_QUERY_DURATION = registry.register(Histogram(
+    'bot_db_query_duration_seconds', 'Время SQL-запросов по типу оператора', ('statement',)
+))
+DB_COMMITS = registry.register(Counter('bot_db_commits_total', 'Коммиты транзакций базы данных'))
+DB_ROLLBACKS = registry.register(Counter('bot_db_rollbacks_total', 'Откаты транзакций базы данных'))
+API_REQUEST_DURATION = registry.register(Histogram(
+    'bot_api_request_duration_seconds', 'Время запросов к Telegram Bot API', ('method',)
+))
+API_REQUEST_ERRORS = registry.register(Counter(
+    'bot_api_request_errors_total', 'Ошибки запросов к Telegram Bot API', ('method',)
+))
+REMINDER_LOOP_LAG = registry.register(Gauge(
+    'bot_reminder_loop_lag_seconds', 'Опоздание последнего пробуждения цикла напоминаний'
+))
+REMINDERS_SENT = registry.register(Counter('bot_reminders_sent_total', 'Отправленные напоминания'))
+BACKUP_DURATION = registry.register(Gauge(
+    'bot_backup_duration_seconds', 'Время последнего резервного копирования по этапам', ('stage',)
+))
+BACKUP_LAST_SUCCESS = registry.register(Gauge(
+    'bot_backup_last_success_timestamp_seconds', 'Время последней успешной резервной копии (Unix)'
+))
+BACKUP_ERRORS = registry.register(Counter('bot_backup_errors_total', 'Неудачные резервные копирования'))
+EVENT_LOOP_LAG = registry.register(Histogram(
+    'bot_event_loop_lag_seconds', 'Опоздание цикла событий относительно запланированного пробуждения'
+))
+EVENT_LOOP_LAG_LAST = registry.register(Gauge(
+    'bot_event_loop_lag_last_seconds', 'Последнее измеренное опоздание цикла событий'
+))
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: время и ошибки обработчиков"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+        state = data.get('raw_state') or 'none'
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_DURATION.observe(time.perf_counter() - started, handler=name, state=state)
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии Bot: время запросов к Telegram"""
+
+    async def __call__(self, make_request, bot: Bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            API_REQUEST_ERRORS.inc(method=name)
+            raise
+        finally:
+            API_REQUEST_DURATION.observe(time.perf_counter() - started, method=name)
+
+def instrument_engine(db_engine: Engine):
+    """Подключает к движку замер запросов и счетчики коммитов/откатов"""
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_start_time', []).append(time.perf_counter())
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_start_time'].pop()
+        # Тип оператора вместо текста запроса, чтобы не раздувать число рядов
+        DB_QUERY_DURATION.observe(elapsed, statement=statement.lstrip().split(' ', 1)[0].upper())
+
+    event.listen(db_engine, 'before_cursor_execute', before)
+    event.listen(db_engine, 'after_cursor_execute', after)
+    event.listen(db_engine, 'commit', lambda conn: DB_COMMITS.inc())
+    event.listen(db_engine, 'rollback', lambda conn: DB_ROLLBACKS.inc())
+
+def track_fsm_states(storage: MemoryStorage):
+    """Показатель числа пользователей в каждом состоянии FSM"""
+    def collect() -> Dict[LabelValues, float]:
+        counts: Dict[LabelValues, float] = {}
+        for record in list(storage.storage.values()):
+            if record.state:
+                key = (str(record.state),)
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    registry.register(Gauge('bot_fsm_states', 'Пользователи в состояниях FSM', ('state',), collect=collect))
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Фоново измеряет, насколько позже запланированного просыпается цикл событий"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - started - interval)
+        EVENT_LOOP_LAG.observe(lag)
+        EVENT_LOOP_LAG_LAST.set(lag)
+
+def setup_metrics(dp: Dispatcher, bot: Bot, db_engine: Engine):
+    """Подключает сбор метрик к диспетчеру, сессии Bot и движку базы данных"""
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+    bot.session.middleware(RequestMetricsMiddleware())
+    instrument_engine(db_engine)
+    if isinstance(dp.storage, MemoryStorage):
+        track_fsm_states(dp.storage)
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Запускает HTTP-сервер с /metrics, возвращает runner для остановки"""
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Метрики доступны на http://%s:%d/metrics", host, port)
+    return runner
@@ -0,0 +1,223 @@
+"""
+Промежуточные обработчики (middleware) диспетчера
+"""
+
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.fsm.middleware import FSMContextMiddleware
+from aiogram.types import TelegramObject, Update, User
+
+from database.engine import get_session, close_session, track_queries
+from database.shards import UserMoving, shard_router
+
+logger = logging.getLogger(__name__)
+
+async def reply_to_update(bot: Bot, event: TelegramObject, text: str):
+    """Короткий ответ на сообщение или нажатие кнопки вне обработчиков"""
+    if isinstance(event, Update) and event.callback_query:
+        await bot.answer_callback_query(event.callback_query.id, text=text)
+    elif isinstance(event, Update) and event.message:
+        await bot.send_message(event.message.chat.id, text)
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Открывает одну сессию базы данных на каждое обновление
+
+    Сессия передается обработчикам в аргументе `session`. Коммит выполняется
+    один раз после обработчика, при исключении изменения откатываются.
+    Обработчик, который отвечает пользователю после работы с базой, сам
+    завершает транзакцию до ответа (commit или close): во время await нельзя
+    держать ни блокировку записи SQLite, ни соединение из пула - иначе
+    другие обновления ждут их синхронно, останавливая цикл событий.
+    Время работы с базой записывается в лог для каждого обновления.
+
+    Сессия открывается в шарде пользователя (database/shards.py). Пока его
+    данные переносятся в другой шард, обновления не обрабатываются.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        started = time.perf_counter()
+        user: Optional[User] = data.get('event_from_user')
+        try:
+            session = shard_router.session_for(user.id) if user else get_session()
+        except UserMoving as e:
+            logger.info("Обновление отклонено: %s", e)
+            await reply_to_update(data['bot'], event, "⏳ Ваши данные переносятся, повторите через минуту.")
+            return None
+        data['session'] = session
+
+        with track_queries() as stats:
+            try:
+                result = await handler(event, data)
+                commit_started = time.perf_counter()
+                session.commit()
+                stats['commit_time'] = time.perf_counter() - commit_started
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                close_session(session)
+
+        logger.info(
+            "update %s: %d queries, db %.1f ms, commit %.1f ms, total %.1f ms",
+            getattr(event, 'update_id', '-'),
+            stats['queries'],
+            stats['db_time'] * 1000,
+            stats.get('commit_time', 0.0) * 1000,
+            (time.perf_counter() - started) * 1000
+        )
+        return result
+
+def load_allowed_users_from_env() -> Set[int]:
+    """Загружает список пользователей с доступом из переменных окружения"""
+    allowed = {int(os.getenv('ADMIN_USER_ID'))}
+    for user_id in os.getenv('ALLOWED_USER_IDS', '').split(','):
+        if user_id.strip():
+            allowed.add(int(user_id))
+    return allowed
+
+class AccessList:
+    """
+    Кэшируемый список пользователей с доступом к боту
+
+    Список загружается функцией `loader` (из конфигурации или базы данных)
+    и перечитывается не чаще одного раза в `ttl` секунд.
+    """
+
+    def __init__(self, loader: Callable[[], Iterable[int]] = load_allowed_users_from_env, ttl: float = 300):
+        self.loader = loader
+        self.ttl = ttl
+        self._allowed: Set[int] = set()
+        self._loaded_at: Optional[float] = None
+
+    def __contains__(self, user_id: int) -> bool:
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at > self.ttl:
+            try:
+                self._allowed = set(self.loader())
+            except Exception as e:
+                # При ошибке загрузки продолжаем работать со старым списком
+                logger.error("Не удалось обновить список доступа: %s", e)
+            self._loaded_at = now
+        return user_id in self._allowed
+
+class TokenBucket:
+    """Ограничитель частоты запросов по алгоритму token bucket"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def consume(self, now: float) -> bool:
+        """Забирает один токен, если он есть"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class AccessMiddleware(BaseMiddleware):
+    """
+    Проверка доступа и ограничение частоты до маршрутизации обновления
+
+    Регистрируется как внешний middleware для `dp.update` функцией
+    `setup_access_middleware`, чтобы отказ происходил до загрузки состояния FSM.
+    Отклоненным и ограниченным пользователям отвечаем не чаще одного раза
+    за `notice_window` секунд, остальные их обновления отбрасываются молча.
+    """
+
+    # Сколько записей хранить в таблицах, прежде чем чистить устаревшие
+    MAX_TRACKED_USERS = 10000
+
+    def __init__(
+        self,
+        access_list: AccessList,
+        rate: float = 1.0,
+        burst: float = 5.0,
+        notice_window: float = 60.0
+    ):
+        self.access_list = access_list
+        self.rate = rate
+        self.burst = burst
+        self.notice_window = notice_window
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._notified_at: Dict[Tuple[int, str], float] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user: Optional[User] = data.get('event_from_user')
+        if user is None:
+            return None
+
+        now = time.monotonic()
+
+        if user.id not in self.access_list:
+            await self._notify(event, data, user.id, 'denied', "У вас нет доступа к этому боту.", now)
+            return None
+
+        bucket = self._buckets.get(user.id)
+        if bucket is None:
+            self._prune(self._buckets, lambda b: now - b.updated_at > self.burst / self.rate)
+            bucket = self._buckets[user.id] = TokenBucket(self.rate, self.burst)
+        if not bucket.consume(now):
+            await self._notify(event, data, user.id, 'throttled', "⏳ Слишком много запросов, подождите немного.", now)
+            return None
+
+        return await handler(event, data)
+
+    def _prune(self, table: dict, is_stale: Callable[[Any], bool]):
+        """Удаляет устаревшие записи, когда таблица разрастается"""
+        if len(table) >= self.MAX_TRACKED_USERS:
+            for key in [key for key, value in table.items() if is_stale(value)]:
+                del table[key]
+
+    async def _notify(self, event: TelegramObject, data: Dict[str, Any], user_id: int, reason: str, text: str, now: float):
+        """Отвечает на отклоненное обновление не чаще одного раза за окно"""
+        key = (user_id, reason)
+        last = self._notified_at.get(key)
+        if last is not None and now - last < self.notice_window:
+            return
+
+        self._prune(self._notified_at, lambda at: now - at >= self.notice_window)
+        self._notified_at[key] = now
+
+        try:
+            await reply_to_update(data['bot'], event, text)
+        except Exception as e:
+            logger.warning("Не удалось отправить уведомление пользователю %s: %s", user_id, e)
+
+def setup_access_middleware(dp: Dispatcher, middleware: AccessMiddleware):
+    """
+    Регистрирует проверку доступа сразу после UserContextMiddleware
+
+    Встроенные внешние middleware диспетчера загружают состояние FSM,
+    поэтому проверку ставим перед FSMContextMiddleware.
+    """
+    observer = dp.update.outer_middleware
+    registered = list(observer)
+    position = next(
+        (i for i, m in enumerate(registered) if isinstance(m, FSMContextMiddleware)),
+        len(registered)
+    )
+    following = registered[position:]
+    for m in following:
+        observer.unregister(m)
+    observer.register(middleware)
+    for m in following:
+        observer.register(m)
@@ -3,10 +3,12 @@
 """
 
 import asyncio
-from datetime import datetime, timedelta
+import time
 from aiogram import Bot
-from database.engine import get_session, close_session
-from database.models import TimeEntry
+from database.shards import user_session_scope
+from database.queries import entries_for_day
+from database.timezones import local_now
+from .metrics import REMINDER_LOOP_LAG, REMINDERS_SENT
 import os
 from dotenv import load_dotenv
 
@@ -25,14 +27,18 @@ class ReminderManager:
             try:
                 await self.check_and_send_reminder()
                 # Проверяем каждую минуту
+                started = time.monotonic()
                 await asyncio.sleep(60)
+                REMINDER_LOOP_LAG.set(max(0.0, time.monotonic() - started - 60))
             except Exception as e:
                 print(f"Ошибка в цикле напоминаний: {e}")
                 await asyncio.sleep(300)  # Ждем 5 минут при ошибке
     
     async def check_and_send_reminder(self):
         """Проверяет, нужно ли отправить напоминание"""
-        now = datetime.now()
+        # 21:00 - по часовому поясу получателя (см. /tz)
+        with user_session_scope(self.admin_user_id) as session:
+            now = local_now(session, self.admin_user_id)
         
         # Проверяем, что сейчас время напоминания
         if now.hour == self.reminder_hour and now.minute == self.reminder_minute:
@@ -41,20 +47,15 @@ class ReminderManager:
     async def send_daily_reminder(self):
         """Отправляет ежедневное напоминание"""
         try:
-            session = get_session()
-            
             # Проверяем, есть ли записи за сегодня
-            today = datetime.now().date()
-            today_entries = session.query(TimeEntry).filter(
-                TimeEntry.user_id == self.admin_user_id,
-                TimeEntry.entry_date >= today,
-                TimeEntry.entry_date < today + timedelta(days=1)
-            ).all()
+            with user_session_scope(self.admin_user_id) as session:
+                today = local_now(session, self.admin_user_id).date()
+                today_entries = entries_for_day(session, self.admin_user_id, today)
+                total_time = sum(entry.duration_minutes for entry in today_entries)
             
             reminder_text = "🔔 Ежедневное напоминание!\n\n"
             
             if today_entries:
-                total_time = sum(entry.duration_minutes for entry in today_entries)
                 reminder_text += f"📊 Сегодня вы уже добавили {len(today_entries)} записей\n"
                 reminder_text += f"⏰ Общее время: {total_time//60}ч {total_time%60}мин\n\n"
             else:
@@ -71,11 +72,10 @@ class ReminderManager:
             )
             
             await self.bot.send_message(self.admin_user_id, reminder_text)
+            REMINDERS_SENT.inc()
             
         except Exception as e:
             print(f"Ошибка при отправке напоминания: {e}")
-        finally:
-            close_session(session)
     
     async def send_manual_reminder(self):
         """Отправляет ручное напоминание (для тестирования)"""
@@ -0,0 +1,110 @@
+"""
+Подсказки часто используемых задач
+
+Для каждой пары (пользователь, категория) в памяти хранится таблица частот
+с экспоненциальным затуханием: недавние задачи весят больше старых.
+Таблица обновляется при каждой новой записи и прогревается из базы при
+запуске, поэтому клавиатура подсказок строится без запросов к базе.
+"""
+
+import heapq
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database.models import TimeEntry, ActivityCategory, normalize_activity_name
+
+def _timestamp(moment: datetime) -> float:
+    """Переводит время записи (UTC без часового пояса) в секунды"""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+class _Counter:
+    """Затухающий счетчик одной задачи"""
+    __slots__ = ('name', 'score', 'updated_at')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.score = 0.0
+        self.updated_at = 0.0
+
+    def value_at(self, moment: float, decay: float) -> float:
+        return self.score * math.exp(-decay * max(0.0, moment - self.updated_at))
+
+    def add(self, weight: float, moment: float, decay: float):
+        if moment >= self.updated_at:
+            self.score = self.value_at(moment, decay) + weight
+            self.updated_at = moment
+        else:
+            # Запись из прошлого (импорт): добавляем уже затухший вес
+            self.score += weight * math.exp(-decay * (self.updated_at - moment))
+
+class ActivitySuggestions:
+    """Топ задач пользователя по категориям с экспоненциальным затуханием"""
+
+    def __init__(self, half_life_days: float = 14, max_per_category: int = 200):
+        self.decay = math.log(2) / (half_life_days * 86400)
+        self.max_per_category = max_per_category
+        self._counters: Dict[Tuple[int, ActivityCategory], Dict[str, _Counter]] = {}
+
+    def record(self, user_id: int, category: ActivityCategory, activity_name: str,
+               at: Optional[datetime] = None, weight: float = 1.0):
+        """Учитывает новую запись"""
+        moment = _timestamp(at) if at is not None else time.time()
+        counters = self._counters.setdefault((user_id, category), {})
+        key = normalize_activity_name(activity_name)
+
+        counter = counters.get(key)
+        if counter is None:
+            if len(counters) >= self.max_per_category:
+                self._evict(counters, moment)
+            counter = counters[key] = _Counter(activity_name.strip())
+        counter.add(weight, moment, self.decay)
+
+    def top(self, user_id: int, category: ActivityCategory, k: int = 6) -> List[str]:
+        """Возвращает k самых частых недавних задач"""
+        counters = self._counters.get((user_id, category))
+        if not counters:
+            return []
+        now = time.time()
+        best = heapq.nlargest(k, counters.values(), key=lambda c: c.value_at(now, self.decay))
+        return [counter.name for counter in best]
+
+    def canonical_name(self, user_id: int, category: ActivityCategory, activity_name: str) -> str:
+        """Возвращает уже известное написание задачи, если оно есть"""
+        counters = self._counters.get((user_id, category), {})
+        counter = counters.get(normalize_activity_name(activity_name))
+        return counter.name if counter else activity_name.strip()
+
+    def warm_up(self, session: Session, days: int = 90):
+        """Заполняет таблицу частот записями за последние `days` дней"""
+        since = datetime.utcnow() - timedelta(days=days)
+        day = func.date(TimeEntry.entry_date)
+        rows = session.query(
+            TimeEntry.user_id,
+            TimeEntry.category,
+            TimeEntry.activity_name,
+            day,
+            func.count(TimeEntry.id)
+        ).filter(
+            TimeEntry.entry_date >= since
+        ).group_by(
+            TimeEntry.user_id, TimeEntry.category, TimeEntry.activity_name, day
+        ).order_by(day)
+
+        for user_id, category, activity_name, entry_day, count in rows.yield_per(1000):
+            self.record(user_id, category, activity_name,
+                        at=datetime.fromisoformat(str(entry_day)), weight=count)
+
+    def _evict(self, counters: Dict[str, _Counter], moment: float):
+        """Удаляет самую редкую задачу, чтобы ограничить память"""
+        weakest = min(counters, key=lambda key: counters[key].value_at(moment, self.decay))
+        del counters[weakest]
+
+# Общий экземпляр для обработчиков бота
+activity_suggestions = ActivitySuggestions()
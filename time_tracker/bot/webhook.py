@@ -0,0 +1,127 @@
+"""
+Режим webhook: встроенный aiohttp-сервер для приема обновлений
+
+Сервер проверяет секретный токен Telegram, сразу отвечает 200 и обрабатывает
+обновление в фоне. Одновременно обрабатывается не больше `max_concurrency`
+обновлений; если очередь переполнена, сервер отвечает 503 и Telegram
+повторит доставку позже.
+"""
+
+import asyncio
+import logging
+import os
+import secrets
+from typing import Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class WebhookServer:
+    """Принимает обновления по HTTP и передает их диспетчеру"""
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        secret_token: str,
+        path: str = "/webhook",
+        max_concurrency: int = 16,
+        max_pending: Optional[int] = None
+    ):
+        self.dp = dp
+        self.bot = bot
+        self.secret_token = secret_token
+        self.path = path
+        self.max_pending = max_pending or max_concurrency * 8
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        """Обновления, принятые и еще не обработанные"""
+        return len(self._tasks)
+
+    def create_app(self) -> web.Application:
+        """Создает aiohttp-приложение с обработчиком webhook"""
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        app.on_shutdown.append(self._on_shutdown)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Принимает обновление и ставит его в обработку"""
+        # Сравниваем байты: строки не из ASCII compare_digest не принимает
+        token = request.headers.get(SECRET_HEADER, "").encode("utf-8", "surrogateescape")
+        if not secrets.compare_digest(token, self.secret_token.encode()):
+            return web.Response(status=401)
+
+        if self.pending >= self.max_pending:
+            logger.warning("Очередь webhook переполнена (%d), просим повторить позже", self.pending)
+            return web.Response(status=503)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning("Некорректное обновление: %s", e)
+            return web.Response(status=400)
+
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update):
+        """Обрабатывает обновление с ограничением параллельности"""
+        async with self._semaphore:
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logger.exception("Ошибка при обработке обновления %s: %s", update.update_id, e)
+
+    async def wait_pending(self, timeout: float = 10):
+        """Ждет завершения обновлений, которые уже в обработке"""
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+
+    async def _on_shutdown(self, app: web.Application):
+        await self.wait_pending()
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Регистрирует webhook в Telegram и запускает сервер до остановки"""
+    base_url = os.getenv('WEBHOOK_URL')
+    if not base_url:
+        raise RuntimeError("WEBHOOK_URL не задан для режима webhook")
+
+    server = WebhookServer(
+        dp,
+        bot,
+        secret_token=os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32),
+        path=os.getenv('WEBHOOK_PATH', '/webhook'),
+        max_concurrency=int(os.getenv('WEBHOOK_MAX_CONCURRENCY', '16'))
+    )
+    runner = web.AppRunner(server.create_app())
+    await runner.setup()
+    site = web.TCPSite(
+        runner,
+        host=os.getenv('WEBHOOK_HOST', '0.0.0.0'),
+        port=int(os.getenv('WEBHOOK_PORT', '8080'))
+    )
+
+    try:
+        await site.start()
+        await bot.set_webhook(
+            base_url.rstrip('/') + server.path,
+            secret_token=server.secret_token,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        await dp.emit_startup(bot=bot)
+        print(f"🌐 Webhook запущен на порту {os.getenv('WEBHOOK_PORT', '8080')}")
+        await asyncio.Event().wait()
+    finally:
+        await dp.emit_shutdown(bot=bot)
+        await runner.cleanup()
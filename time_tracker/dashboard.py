@@ -3,10 +3,31 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from database.engine import get_session, close_session
+from analytics.aggregates import (
+    ACTIVITY_OPTIONS_LIMIT, ANALYTICS_BACKEND, ANALYTICS_SOURCE, HOUR_GROUP_LABELS, DuckDBAggregates, Filters,
+    PandasAggregates, connect_duckdb, filter_frame
+)
+from analytics.profiling import RunProfiler
+from analytics.archive import ARCHIVE_DIR, archive_cutoff, load_history
+from analytics.deltas import DeltaLoader
+from analytics.shards import (
+    ShardedLoader, count_entries, shard_activity_names, shard_activity_time_totals, shard_search_activities
+)
+from analytics.snapshot import SNAPSHOT_DIR
+from database.engine import DATABASE_URL, get_session, close_session
+from database.shards import shard_router
+from database.activities import fetch_activity_names
+from database.events import has_event_log, head_seq
+from database.queries import activity_time_totals
+from database.search import search_activities
 from database.models import TimeEntry
+from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 import numpy as np
+import logging
+
+# Итоги каждой перерисовки пишутся в лог (см. analytics.profiling)
+logging.basicConfig(level=logging.INFO)
 
 # Настройка страницы
 st.set_page_config(
@@ -24,39 +45,107 @@ if (datetime.now() - st.session_state.last_refresh).seconds > 30:
     st.cache_data.clear()
     st.session_state.last_refresh = datetime.now()
 
+@st.cache_resource
+def entries_loader():
+    """Записи, общие для всех сессий дашборда; обновляются по журналу изменений"""
+    # Старые записи - из архива, запечатанные месяцы - из снимка Parquet,
+    # из базы - только хвост
+    return DeltaLoader(lambda session: load_history(session, SNAPSHOT_DIR, ARCHIVE_DIR))
+
+@st.cache_resource
+def sharded_loader():
+    """Записи всех шардов (SHARD_COUNT > 1), шарды читаются параллельно"""
+    return ShardedLoader(shard_router, SNAPSHOT_DIR, ARCHIVE_DIR)
+
 @st.cache_data(ttl=30)  # Кэш на 30 секунд для автоматического обновления
 def load_data():
     """Загружает данные из базы данных и кэширует их"""
+    if shard_router.sharded:
+        try:
+            return sharded_loader().refresh()
+        except Exception as e:
+            st.error(f"Ошибка при загрузке данных: {e}")
+            return pd.DataFrame()
     session = get_session()
     try:
-        entries = session.query(TimeEntry).all()
-        data = []
-        for entry in entries:
-            data.append({
-                'id': entry.id,
-                'user_id': entry.user_id,
-                'activity_name': entry.activity_name,
-                'category': entry.category.value,
-                'duration_minutes': entry.duration_minutes,
-                'entry_date': entry.entry_date
-            })
-        df = pd.DataFrame(data)
-        if not df.empty and 'entry_date' in df.columns:
-            df['entry_date'] = pd.to_datetime(df['entry_date'])
-            # Добавляем дополнительные колонки для анализа
-            df['date'] = df['entry_date'].dt.date
-            df['hour'] = df['entry_date'].dt.hour
-            df['day_of_week'] = df['entry_date'].dt.day_name()
-            df['week'] = df['entry_date'].dt.isocalendar().week
-            df['month'] = df['entry_date'].dt.month
-            df['year'] = df['entry_date'].dt.year
-        return df
+        # После первой загрузки из базы читаются только новые события журнала
+        return entries_loader().refresh(session)
     except Exception as e:
         st.error(f"Ошибка при загрузке данных: {e}")
         return pd.DataFrame()
     finally:
         close_session(session)
 
+def data_version():
+    """Версия записей для кэшей списков фильтра: голова журнала изменений (каждого шарда)"""
+    def head(session):
+        # Без журнала (бот еще не запускался) версия неизвестна - кэши живут до ttl
+        return head_seq(session) if has_event_log(session) else None
+
+    def shard_head(name, db_engine):
+        with Session(db_engine) as session:
+            return head(session)
+
+    if shard_router.sharded:
+        return tuple(shard_router.map(shard_head).values())
+    session = get_session()
+    try:
+        return head(session)
+    finally:
+        close_session(session)
+
+@st.cache_resource(max_entries=4, ttl=300)
+def load_activity_names(version):
+    """Загружает названия задач из справочника для отображения"""
+    if shard_router.sharded:
+        return shard_activity_names(shard_router)
+    session = get_session()
+    try:
+        return fetch_activity_names(session.connection())
+    finally:
+        close_session(session)
+
+@st.cache_resource(max_entries=4, ttl=300)
+def activity_ranking(version):
+    """Задачи по убыванию времени: один запрос по индексу на каждое изменение записей"""
+    if shard_router.sharded:
+        return shard_activity_time_totals(shard_router)
+    session = get_session()
+    try:
+        return activity_time_totals(session.connection())
+    finally:
+        close_session(session)
+
+@st.cache_data(ttl=30)
+def find_activities(query):
+    """Id задач, найденных по индексу полнотекстового поиска"""
+    if shard_router.sharded:
+        return set(shard_search_activities(shard_router, query))
+    session = get_session()
+    try:
+        return set(search_activities(session.connection(), query))
+    finally:
+        close_session(session)
+
+@st.cache_resource
+def duckdb_connection(cutoff):
+    """Соединение DuckDB, общее для всех сессий дашборда; пересоздается при сдвиге границы архива"""
+    return connect_duckdb(ANALYTICS_SOURCE or DATABASE_URL, archive=(ARCHIVE_DIR, cutoff) if cutoff else None)
+
+def load_aggregates(version):
+    """Движок агрегатов по ANALYTICS_BACKEND (pandas по умолчанию)"""
+    if ANALYTICS_BACKEND == 'duckdb' and shard_router.sharded:
+        # DuckDB читает одну базу, а записи шардов склеиваются в pandas
+        st.sidebar.warning("⚠️ DuckDB не поддерживает шарды, используется pandas")
+    elif ANALYTICS_BACKEND == 'duckdb':
+        try:
+            return DuckDBAggregates(duckdb_connection(archive_cutoff(ARCHIVE_DIR)), load_activity_names(version))
+        except Exception as e:
+            # Например, duckdb не установлен или нет расширения sqlite
+            logging.getLogger(__name__).warning("DuckDB недоступен, используется pandas: %s", e)
+            st.sidebar.warning(f"⚠️ DuckDB недоступен, используется pandas: {e}")
+    return PandasAggregates(load_data(), load_activity_names(version))
+
 def format_duration(minutes):
     """Форматирует время в читаемый вид"""
     hours = minutes // 60
@@ -66,40 +155,41 @@ def format_duration(minutes):
     else:
         return f"{mins}мин"
 
-def show_general_statistics(df):
+def show_general_statistics(aggregates):
     """Показывает общую статистику"""
     st.header("📊 Общая статистика")
+    summary = aggregates.summary()
     
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        total_time = df['duration_minutes'].sum()
+        total_time = summary['sum']
         time_str = format_duration(total_time)
         st.metric("Общее время", time_str)
     
     with col2:
-        st.metric("Всего записей", len(df))
+        st.metric("Всего записей", summary['count'])
     
     with col3:
-        st.metric("Уникальных задач", df['activity_name'].nunique())
+        st.metric("Уникальных задач", summary['activities'])
     
     with col4:
-        avg_time = df['duration_minutes'].mean()
+        avg_time = summary['mean']
         st.metric("Среднее время", f"{avg_time:.1f} мин")
     
     # Дополнительные метрики
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        max_time = df['duration_minutes'].max()
+        max_time = summary['max']
         st.metric("Максимальная сессия", format_duration(max_time))
     
     with col2:
-        min_time = df['duration_minutes'].min()
+        min_time = summary['min']
         st.metric("Минимальная сессия", format_duration(min_time))
     
     with col3:
-        total_days = df['date'].nunique()
+        total_days = summary['days']
         st.metric("Дней активности", total_days)
     
     with col4:
@@ -109,15 +199,14 @@ def show_general_statistics(df):
         else:
             st.metric("Среднее в день", "0мин")
 
-def show_category_analysis(df):
+def show_category_analysis(aggregates):
     """Показывает анализ по категориям"""
     st.header("📂 Анализ по категориям")
     
     # Группировка по категориям
-    category_summary = df.groupby('category').agg({
-        'duration_minutes': ['sum', 'count', 'mean', 'max', 'min'],
-        'date': 'nunique'
-    }).round(1)
+    category_summary = aggregates.group(
+        ['category'], ['sum', 'count', 'mean', 'max', 'min', 'days']
+    ).set_index('category').round(1)
     
     category_summary.columns = ['Общее время (мин)', 'Количество записей', 'Среднее время (мин)', 'Макс время (мин)', 'Мин время (мин)', 'Дней активности']
     category_summary = category_summary.sort_values('Общее время (мин)', ascending=False)
@@ -202,15 +291,16 @@ def show_category_analysis(df):
                     f"{percentage:.1f}% от общего времени"
                 )
 
-def show_activity_analysis(df):
+def show_activity_analysis(aggregates):
     """Показывает анализ по задачам"""
     st.header("🍰 Анализ по задачам")
     
-    # Группировка по задачам
-    activity_summary = df.groupby('activity_name').agg({
-        'duration_minutes': ['sum', 'count', 'mean', 'max', 'min'],
-        'date': 'nunique'
-    }).round(1)
+    # Группировка по id задач, названия подставляются только для отображения
+    activity_summary = aggregates.group(
+        ['activity_id'], ['sum', 'count', 'mean', 'max', 'min', 'days']
+    ).set_index('activity_id').round(1)
+    activity_summary.index = activity_summary.index.map(aggregates.activity_names)
+    activity_summary.index.name = 'activity_name'
     
     activity_summary.columns = ['Общее время (мин)', 'Количество записей', 'Среднее время (мин)', 'Макс время (мин)', 'Мин время (мин)', 'Дней активности']
     activity_summary = activity_summary.sort_values('Общее время (мин)', ascending=False)
@@ -257,7 +347,7 @@ def show_activity_analysis(df):
         else:
             st.info("Нет данных для отображения столбчатой диаграммы")
 
-def show_time_analysis(df):
+def show_time_analysis(aggregates):
     """Показывает анализ по времени"""
     st.header("⏰ Анализ по времени")
     
@@ -269,7 +359,7 @@ def show_time_analysis(df):
         day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
         day_names_ru = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье']
         
-        daily_summary = df.groupby('day_of_week')['duration_minutes'].sum().reset_index()
+        daily_summary = aggregates.totals(['day_of_week'])
         if not daily_summary.empty:
             daily_summary['day_of_week'] = pd.Categorical(daily_summary['day_of_week'], categories=day_order, ordered=True)
             daily_summary = daily_summary.sort_values('day_of_week')
@@ -291,7 +381,7 @@ def show_time_analysis(df):
     
     with col2:
         st.subheader("🕐 Активность по часам")
-        hourly_summary = df.groupby('hour')['duration_minutes'].sum().reset_index()
+        hourly_summary = aggregates.totals(['hour'])
         
         if not hourly_summary.empty:
             fig_hour = px.bar(
@@ -309,9 +399,7 @@ def show_time_analysis(df):
     # Анализ по дням
     st.subheader("📈 Продуктивность по дням")
     
-    daily_time = df.groupby('date')['duration_minutes'].sum().reset_index()
-    daily_time['date'] = pd.to_datetime(daily_time['date'])
-    daily_time = daily_time.sort_values('date')
+    daily_time = aggregates.totals(['date'])
     
     if not daily_time.empty:
         fig_daily = px.line(
@@ -330,7 +418,7 @@ def show_time_analysis(df):
     st.subheader("🔥 Тепловая карта активности")
     
     # Создаем сводную таблицу: дни недели vs часы
-    df_pivot = df.groupby(['day_of_week', 'hour'])['duration_minutes'].sum().reset_index()
+    df_pivot = aggregates.totals(['day_of_week', 'hour'])
     
     if not df_pivot.empty:
         df_pivot['day_of_week'] = pd.Categorical(df_pivot['day_of_week'], categories=day_order, ordered=True)
@@ -350,36 +438,18 @@ def show_time_analysis(df):
     else:
         st.info("Нет данных для отображения тепловой карты")
 
-def show_detailed_data(df):
-    """Показывает детализированные данные"""
-    st.header("📋 Детализированные данные")
-    
-    # Фильтры для таблицы
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        sort_by = st.selectbox(
-            "Сортировка по:",
-            ['Дата (новые)', 'Дата (старые)', 'Время (больше)', 'Время (меньше)', 'Задача']
-        )
-    
-    with col2:
-        show_count = st.slider("Количество записей:", 10, 100, 50)
-    
-    # Сортируем данные
-    display_df = df.copy()
-    if sort_by == 'Дата (новые)':
-        display_df = display_df.sort_values('entry_date', ascending=False)
-    elif sort_by == 'Дата (старые)':
-        display_df = display_df.sort_values('entry_date', ascending=True)
-    elif sort_by == 'Время (больше)':
-        display_df = display_df.sort_values('duration_minutes', ascending=False)
-    elif sort_by == 'Время (меньше)':
-        display_df = display_df.sort_values('duration_minutes', ascending=True)
-    elif sort_by == 'Задача':
-        display_df = display_df.sort_values('activity_name')
-    
-    # Форматируем данные
+# Вариант сортировки -> колонка и направление
+SORT_ORDERS = {
+    'Дата (новые)': ('entry_date', False),
+    'Дата (старые)': ('entry_date', True),
+    'Время (больше)': ('duration_minutes', False),
+    'Время (меньше)': ('duration_minutes', True),
+    'Задача': ('activity_name', True),
+}
+
+def format_entries(display_df):
+    """Готовит записи к показу: форматы и русские названия колонок"""
+    display_df = display_df.copy()
     display_df['entry_date'] = display_df['entry_date'].dt.strftime('%d.%m.%Y %H:%M')
     display_df['duration_formatted'] = display_df['duration_minutes'].apply(format_duration)
     display_df['day_of_week'] = display_df['day_of_week'].map({
@@ -399,43 +469,58 @@ def show_detailed_data(df):
         'hour': 'Час'
     })
     
-    # Отображаем таблицу
     columns_to_show = ['ID', 'Задача', 'Категория', 'Время', 'Дата и время', 'День недели', 'Час']
-    st.dataframe(display_df[columns_to_show].head(show_count), use_container_width=True)
+    return display_df[columns_to_show]
+
+def show_detailed_data(aggregates):
+    """Показывает детализированные данные"""
+    st.header("📋 Детализированные данные")
     
-    # Экспорт данных
+    # Фильтры для таблицы
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        sort_by = st.selectbox(
+            "Сортировка по:",
+            list(SORT_ORDERS)
+        )
+    
+    with col2:
+        show_count = st.slider("Количество записей:", 10, 100, 50)
+    
+    # Загружаем только показываемые записи
+    order_by, ascending = SORT_ORDERS[sort_by]
+    display_df = format_entries(aggregates.entries(order_by, ascending, limit=show_count))
+    
+    # Отображаем таблицу
+    st.dataframe(display_df, use_container_width=True)
+    
+    # Экспорт данных: все записи выгружаются только по нажатию кнопки
     st.subheader("💾 Экспорт данных")
-    csv = display_df[columns_to_show].to_csv(index=False, encoding='utf-8-sig')
     st.download_button(
         label="📥 Скачать CSV",
-        data=csv,
+        data=lambda: format_entries(aggregates.entries(order_by, ascending)).to_csv(index=False, encoding='utf-8-sig'),
         file_name=f"time_tracker_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
         mime="text/csv"
     )
 
-def show_time_by_categories(df):
+def show_time_by_categories(aggregates):
     """Показывает анализ времени по категориям"""
     st.header("🕐 Анализ времени по категориям")
     
-    if df.empty:
+    if not aggregates.summary()['count']:
         st.info("Нет данных для анализа времени по категориям")
         return
     
-    # Группировка по категориям и времени дня
-    df['hour_group'] = pd.cut(df['hour'], bins=[0, 6, 12, 18, 24], labels=['Ночь (0-6)', 'Утро (6-12)', 'День (12-18)', 'Вечер (18-24)'])
-    
     # Анализ по времени дня для каждой категории
     st.subheader("⏰ Распределение времени по категориям и времени дня")
     
-    category_time_analysis = df.groupby(['category', 'hour_group'], observed=True).agg({
-        'duration_minutes': ['sum', 'count', 'mean']
-    }).round(1)
-    
-    category_time_analysis.columns = ['Общее время (мин)', 'Количество записей', 'Среднее время (мин)']
-    category_time_analysis = category_time_analysis.reset_index()
+    category_time_analysis = aggregates.group(['category', 'hour_group'], ['sum', 'count', 'mean']).round(1)
+    category_time_analysis.columns = ['category', 'hour_group', 'Общее время (мин)', 'Количество записей', 'Среднее время (мин)']
     
-    # Создаем тепловую карту
-    pivot_data = category_time_analysis.pivot(index='category', columns='hour_group', values='Общее время (мин)').fillna(0)
+    # Создаем тепловую карту (периоды дня по порядку, а не по алфавиту)
+    pivot_data = category_time_analysis.pivot(index='category', columns='hour_group', values='Общее время (мин)')
+    pivot_data = pivot_data[[label for label in HOUR_GROUP_LABELS if label in pivot_data.columns]].fillna(0)
     
     fig_heatmap = px.imshow(
         pivot_data,
@@ -475,12 +560,8 @@ def show_time_by_categories(df):
     # Анализ по дням недели для каждой категории
     st.subheader("📅 Активность по дням недели")
     
-    weekday_analysis = df.groupby(['category', 'day_of_week']).agg({
-        'duration_minutes': ['sum', 'count']
-    }).round(1)
-    
-    weekday_analysis.columns = ['Общее время (мин)', 'Количество записей']
-    weekday_analysis = weekday_analysis.reset_index()
+    weekday_analysis = aggregates.group(['category', 'day_of_week'], ['sum', 'count'])
+    weekday_analysis.columns = ['category', 'day_of_week', 'Общее время (мин)', 'Количество записей']
     
     # Создаем график
     fig_weekday = px.bar(
@@ -505,12 +586,8 @@ def show_time_by_categories(df):
     # Анализ по часам для каждой категории
     st.subheader("🕐 Распределение по часам дня")
     
-    hourly_analysis = df.groupby(['category', 'hour']).agg({
-        'duration_minutes': ['sum', 'count']
-    }).round(1)
-    
-    hourly_analysis.columns = ['Общее время (мин)', 'Количество записей']
-    hourly_analysis = hourly_analysis.reset_index()
+    hourly_analysis = aggregates.group(['category', 'hour'], ['sum', 'count'])
+    hourly_analysis.columns = ['category', 'hour', 'Общее время (мин)', 'Количество записей']
     
     # Создаем график
     fig_hourly = px.line(
@@ -536,15 +613,16 @@ def show_time_by_categories(df):
     # Статистика по категориям
     st.subheader("📊 Сводная статистика по категориям")
     
+    category_totals = aggregates.group(['category'], ['sum']).set_index('category')['sum']
+    
     col1, col2, col3 = st.columns(3)
     
     for i, category in enumerate(['work', 'study', 'rest']):
         with [col1, col2, col3][i]:
-            category_data = df[df['category'] == category]
-            if not category_data.empty:
-                total_time = category_data['duration_minutes'].sum()
-                avg_time = category_data['duration_minutes'].mean()
-                peak_hour = category_data.groupby('hour')['duration_minutes'].sum().idxmax()
+            category_hours = hourly_analysis[hourly_analysis['category'] == category]
+            if not category_hours.empty:
+                total_time = category_totals[category]
+                peak_hour = category_hours.set_index('hour')['Общее время (мин)'].idxmax()
                 
                 emoji = category_emoji.get(category, '📊')
                 st.metric(
@@ -556,21 +634,17 @@ def show_time_by_categories(df):
                 emoji = category_emoji.get(category, '📊')
                 st.metric(f"{emoji} {category.upper()}", "0мин", "Нет данных")
 
-def show_trends_analysis(df):
+def show_trends_analysis(aggregates):
     """Показывает анализ трендов"""
     st.header("📈 Анализ трендов")
     
-    if df.empty:
+    if not aggregates.summary()['count']:
         st.info("Нет данных для анализа трендов")
         return
     
     # Группировка по дням
-    daily_stats = df.groupby('date').agg({
-        'duration_minutes': ['sum', 'count', 'mean']
-    }).round(1)
-    
-    daily_stats.columns = ['Общее время (мин)', 'Количество записей', 'Среднее время (мин)']
-    daily_stats = daily_stats.reset_index()
+    daily_stats = aggregates.group(['date'], ['sum', 'count', 'mean']).round({'mean': 1})
+    daily_stats.columns = ['date', 'Общее время (мин)', 'Количество записей', 'Среднее время (мин)']
     
     # График общего времени по дням
     st.subheader("📊 Общее время по дням")
@@ -627,7 +701,7 @@ def show_trends_analysis(df):
     st.subheader("📊 Тренды по категориям")
     
     # Группировка по дням и категориям
-    daily_category_stats = df.groupby(['date', 'category'])['duration_minutes'].sum().reset_index()
+    daily_category_stats = aggregates.totals(['date', 'category'])
     
     if not daily_category_stats.empty:
         # График трендов по категориям
@@ -676,12 +750,7 @@ def show_trends_analysis(df):
     # Анализ по неделям
     st.subheader("📅 Анализ по неделям")
     
-    # Добавляем недели к данным
-    df_with_weeks = df.copy()
-    df_with_weeks['week'] = df_with_weeks['entry_date'].dt.isocalendar().week
-    df_with_weeks['year'] = df_with_weeks['entry_date'].dt.year
-    
-    weekly_stats = df_with_weeks.groupby(['year', 'week', 'category'])['duration_minutes'].sum().reset_index()
+    weekly_stats = aggregates.totals(['year', 'week', 'category'])
     
     if not weekly_stats.empty:
         weekly_stats['week_label'] = weekly_stats['year'].astype(str) + '-W' + weekly_stats['week'].astype(str)
@@ -709,7 +778,7 @@ def show_trends_analysis(df):
     # Анализ по месяцам
     st.subheader("📊 Анализ по месяцам")
     
-    monthly_stats = df.groupby(['year', 'month', 'category'])['duration_minutes'].sum().reset_index()
+    monthly_stats = aggregates.totals(['year', 'month', 'category'])
     
     if not monthly_stats.empty:
         monthly_stats['month_label'] = monthly_stats['year'].astype(str) + '-' + monthly_stats['month'].astype(str).str.zfill(2)
@@ -734,8 +803,43 @@ def show_trends_analysis(df):
         fig_monthly.update_xaxes(tickangle=45)
         st.plotly_chart(fig_monthly, use_container_width=True)
 
+def apply_filters(df, date_range, selected_categories, selected_activities, time_period):
+    """Применяет фильтры боковой панели к данным"""
+    return filter_frame(df, Filters.from_sidebar(date_range, selected_categories, selected_activities, time_period))
+
+def show_profiler_panel(profiler):
+    """Панель отладки в боковой панели: время секций и горячие точки"""
+    with st.sidebar.expander("🛠️ Производительность", expanded=False):
+        st.markdown(f"**Перерисовка:** {profiler.total * 1000:.0f} мс")
+        summary = profiler.summary()
+        if summary:
+            timings = pd.DataFrame(summary.items(), columns=['Секция', 'мс'])
+            timings['%'] = timings['мс'] / max(profiler.total * 1000, 1e-9) * 100
+            st.dataframe(timings.round(1), use_container_width=True, hide_index=True)
+        
+        hot_spots = profiler.hot_spots()
+        if hot_spots:
+            st.markdown("**Горячие точки (cProfile):**")
+            st.dataframe(pd.DataFrame(hot_spots).round(2), use_container_width=True, hide_index=True)
+        
+        report = profiler.report_text()
+        if report:
+            st.download_button("📥 Отчет профилировщика", report, file_name="dashboard_profile.txt")
+        elif not profiler.profile:
+            st.caption("Добавьте ?profile=1 (или ?profile=pyinstrument) к адресу, чтобы снять профиль")
+
 def main():
     """Основная функция дашборда"""
+    profiler = RunProfiler.from_query_params(st.query_params)
+    try:
+        with profiler:
+            render_dashboard(profiler)
+    finally:
+        profiler.log(rows=st.session_state.get('last_entry_count'))
+        show_profiler_panel(profiler)
+
+def render_dashboard(profiler):
+    """Строит страницу дашборда, замеряя время секций"""
     st.title("📊 Дашборд учета времени")
     
     # Кнопка обновления данных
@@ -758,24 +862,31 @@ def main():
     
     # Проверяем статус базы данных
     try:
-        session = get_session()
-        entry_count = session.query(TimeEntry).count()
+        if shard_router.sharded:
+            entry_count = count_entries(shard_router)
+        else:
+            session = get_session()
+            entry_count = session.query(TimeEntry).count()
+            close_session(session)
         st.sidebar.markdown(f"💾 Записей в базе: {entry_count}")
-        close_session(session)
     except Exception as e:
         st.sidebar.error(f"❌ Ошибка базы данных: {e}")
     
-    df = load_data()
+    with profiler.section('load_data'):
+        version = data_version()
+        aggregates = load_aggregates(version)
+        # Список задач для фильтра - отдельным запросом по индексу (activity_ranking)
+        options = aggregates.options(activities=False)
     
     # Проверяем новые записи
     if 'last_entry_count' not in st.session_state:
-        st.session_state.last_entry_count = len(df)
-    elif len(df) > st.session_state.last_entry_count:
-        new_entries = len(df) - st.session_state.last_entry_count
+        st.session_state.last_entry_count = options['rows']
+    elif options['rows'] > st.session_state.last_entry_count:
+        new_entries = options['rows'] - st.session_state.last_entry_count
         st.success(f"🎉 Добавлено {new_entries} новых записей!")
-        st.session_state.last_entry_count = len(df)
+        st.session_state.last_entry_count = options['rows']
     
-    if df.empty:
+    if not options['rows']:
         st.warning("📝 Данных пока нет. Добавьте записи через Telegram-бота.")
         st.info("💡 Используйте команду /add в боте для добавления первой записи.")
         return
@@ -784,8 +895,8 @@ def main():
     st.sidebar.header("🔍 Фильтры")
     
     # Фильтр по дате
-    min_date = df['entry_date'].min().date()
-    max_date = df['entry_date'].max().date()
+    min_date = options['min_date']
+    max_date = options['max_date']
     
     date_range = st.sidebar.date_input(
         "📅 Период",
@@ -795,7 +906,7 @@ def main():
     )
     
     # Фильтр по категориям
-    all_categories = sorted(df['category'].unique())
+    all_categories = options['categories']
     selected_categories = st.sidebar.multiselect(
         "📂 Категории",
         options=all_categories,
@@ -803,14 +914,40 @@ def main():
         help="Выберите категории для анализа"
     )
     
-    # Фильтр по задачам
-    all_activities = sorted(df['activity_name'].unique())
+    # Фильтр по задачам (значения - id, на экране - названия). В списке - задачи
+    # с наибольшим временем, остальные находит поиск; пустой выбор - все задачи
+    # без фильтра по activity_id
+    activity_names = aggregates.activity_names
+    ranking = [activity_id for activity_id, _ in activity_ranking(version)]
+    search_query = st.sidebar.text_input(
+        "🔎 Поиск задач",
+        help="Например, «прог ревью»: задачи, в названии которых есть слова, начинающиеся так"
+    )
+    found = None
+    if search_query.strip():
+        # Поиск по началу слов названия - по индексу FTS5 в базе, а не по строкам в pandas
+        found = find_activities(search_query.strip())
+        ranking = [activity_id for activity_id in ranking if activity_id in found]
+        st.sidebar.caption(f"Найдено задач: {len(ranking)}")
+    
+    # Выбранные задачи остаются в списке, даже если не попали в первые ACTIVITY_OPTIONS_LIMIT
+    chosen = st.session_state.get('activity_filter', [])
+    shown = chosen + [activity_id for activity_id in ranking[:ACTIVITY_OPTIONS_LIMIT] if activity_id not in chosen]
     selected_activities = st.sidebar.multiselect(
         "📝 Задачи",
-        options=all_activities,
-        default=all_activities,
-        help="Выберите задачи для анализа"
+        options=shown,
+        key='activity_filter',
+        format_func=lambda activity_id: activity_names.get(activity_id, str(activity_id)),
+        placeholder="Все задачи",
+        help=f"{ACTIVITY_OPTIONS_LIMIT} задач с наибольшим временем (по найденным - с учетом поиска). "
+             "Ничего не выбрано - все задачи"
     )
+    if selected_activities:
+        activity_filter = selected_activities
+    elif found is not None:
+        activity_filter = ranking
+    else:
+        activity_filter = None
     
     # Фильтр по времени дня
     time_period = st.sidebar.selectbox(
@@ -819,38 +956,14 @@ def main():
     )
     
     # Применяем фильтры
-    if len(date_range) == 2:
-        start_date, end_date = date_range
-        if start_date and end_date:
-            df_filtered = df[
-                (df['entry_date'].dt.date >= start_date) &
-                (df['entry_date'].dt.date <= end_date) &
-                (df['category'].isin(selected_categories)) &
-                (df['activity_name'].isin(selected_activities))
-            ]
-        else:
-            df_filtered = df[
-                (df['category'].isin(selected_categories)) &
-                (df['activity_name'].isin(selected_activities))
-            ]
-    else:
-        df_filtered = df[
-            (df['category'].isin(selected_categories)) &
-            (df['activity_name'].isin(selected_activities))
-        ]
-    
-    # Фильтр по времени дня
-    if time_period == "Утро (6-12)":
-        df_filtered = df_filtered[df_filtered['hour'].between(6, 11)]
-    elif time_period == "День (12-18)":
-        df_filtered = df_filtered[df_filtered['hour'].between(12, 17)]
-    elif time_period == "Вечер (18-24)":
-        df_filtered = df_filtered[df_filtered['hour'].between(18, 23)]
-    elif time_period == "Ночь (0-6)":
-        df_filtered = df_filtered[df_filtered['hour'].between(0, 5)]
+    with profiler.section('filters'):
+        aggregates = aggregates.with_filters(
+            Filters.from_sidebar(date_range, selected_categories, activity_filter, time_period)
+        )
+        has_data = aggregates.summary()['count'] > 0
     
     # Показываем статистику по отфильтрованным данным
-    if df_filtered.empty:
+    if not has_data:
         st.warning("📝 Нет данных для выбранных фильтров.")
         return
     
@@ -865,26 +978,26 @@ def main():
         "🕐 Время по категориям"
     ])
     
-    with tab1:
-        show_general_statistics(df_filtered)
+    with tab1, profiler.section('show_general_statistics'):
+        show_general_statistics(aggregates)
     
-    with tab2:
-        show_category_analysis(df_filtered)
+    with tab2, profiler.section('show_category_analysis'):
+        show_category_analysis(aggregates)
     
-    with tab3:
-        show_activity_analysis(df_filtered)
+    with tab3, profiler.section('show_activity_analysis'):
+        show_activity_analysis(aggregates)
     
-    with tab4:
-        show_time_analysis(df_filtered)
+    with tab4, profiler.section('show_time_analysis'):
+        show_time_analysis(aggregates)
     
-    with tab5:
-        show_detailed_data(df_filtered)
+    with tab5, profiler.section('show_detailed_data'):
+        show_detailed_data(aggregates)
     
-    with tab6:
-        show_trends_analysis(df_filtered)
+    with tab6, profiler.section('show_trends_analysis'):
+        show_trends_analysis(aggregates)
     
-    with tab7:
-        show_time_by_categories(df_filtered)
+    with tab7, profiler.section('show_time_by_categories'):
+        show_time_by_categories(aggregates)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
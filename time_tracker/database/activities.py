@@ -0,0 +1,185 @@
+"""
+Справочник задач: получение activity_id по названию
+
+Названия сравниваются по нормализованному ключу (см. normalize_activity_name),
+поэтому "Программирование" и "программирование " попадают в одну задачу.
+"""
+
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, event, func, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from .models import Activity, ActivityCategory, TimeEntry, normalize_activity_name
+
+ActivityKey = Tuple[int, ActivityCategory, str]
+
+def resolve_activity_id(connection: Connection, user_id: int, category: ActivityCategory, name: str) -> int:
+    """Возвращает id задачи, создавая ее при необходимости"""
+    key = normalize_activity_name(name)
+    activity_id = connection.execute(
+        select(Activity.id).where(
+            Activity.user_id == user_id,
+            Activity.category == category,
+            Activity.normalized_key == key
+        )
+    ).scalar()
+    if activity_id is None:
+        activity_id = connection.execute(
+            insert(Activity).values(user_id=user_id, category=category, name=name.strip(), normalized_key=key)
+        ).inserted_primary_key[0]
+    return activity_id
+
+@event.listens_for(TimeEntry, 'before_insert')
+def _assign_activity_id(mapper, connection, target: TimeEntry):
+    """Заполняет activity_id для записей, добавленных через ORM"""
+    if target.activity_id is None and target.activity is None and target.activity_name:
+        target.activity_id = resolve_activity_id(connection, target.user_id, target.category, target.activity_name)
+
+class ActivityResolver:
+    """
+    Заполняет activity_id для массовых вставок через Core
+
+    Найденные id кэшируются, поэтому на пачку строк приходится не больше
+    одного SELECT и одного INSERT для каждой новой пары (пользователь, категория).
+    """
+
+    def __init__(self):
+        self._cache: Dict[ActivityKey, int] = {}
+
+    def assign(self, connection: Connection, rows: List[Dict[str, Any]]):
+        """Проставляет `activity_id` в словарях строк"""
+        missing: Dict[Tuple[int, ActivityCategory], Dict[str, str]] = defaultdict(dict)
+        for row in rows:
+            key = normalize_activity_name(row['activity_name'])
+            if (row['user_id'], row['category'], key) not in self._cache:
+                missing[(row['user_id'], row['category'])].setdefault(key, row['activity_name'].strip())
+
+        for (user_id, category), names in missing.items():
+            self._load(connection, user_id, category, names)
+
+        for row in rows:
+            row['activity_id'] = self.get(row['user_id'], row['category'], row['activity_name'])
+
+    def get(self, user_id: int, category: ActivityCategory, name: str) -> int:
+        """Возвращает id задачи, уже загруженной через assign"""
+        return self._cache[(user_id, category, normalize_activity_name(name))]
+
+    def _load(self, connection: Connection, user_id: int, category: ActivityCategory, names: Dict[str, str]):
+        """Загружает id существующих задач и создает недостающие"""
+        def fetch():
+            found = connection.execute(
+                select(Activity.normalized_key, Activity.id).where(
+                    Activity.user_id == user_id,
+                    Activity.category == category,
+                    Activity.normalized_key.in_(list(names))
+                )
+            )
+            for key, activity_id in found:
+                self._cache[(user_id, category, key)] = activity_id
+
+        fetch()
+        new_keys = [key for key in names if (user_id, category, key) not in self._cache]
+        if new_keys:
+            connection.execute(insert(Activity), [
+                {'user_id': user_id, 'category': category, 'name': names[key], 'normalized_key': key}
+                for key in new_keys
+            ])
+            fetch()
+
+def backfill_activity_ids(
+    bind: Engine,
+    chunk_size: int = 50000,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> int:
+    """
+    Заполняет activity_id у существующих записей
+
+    Варианты написания с одинаковым ключом объединяются в одну задачу,
+    каноническим считается самое частое написание. Записи обновляются
+    диапазонами id, каждая пачка в своей транзакции.
+
+    Returns:
+        int: количество обновленных записей
+    """
+    entries = TimeEntry.__table__
+    # Записи без категории (до миграции категорий) пропускаем
+    unassigned = and_(entries.c.activity_id.is_(None), entries.c.category.isnot(None))
+    with bind.connect() as connection:
+        pending = connection.execute(
+            select(entries.c.id).where(unassigned).limit(1)
+        ).first()
+        if pending is None:
+            return 0
+
+        spellings = connection.execute(
+            select(entries.c.user_id, entries.c.category, entries.c.activity_name, func.count())
+            .where(unassigned)
+            .group_by(entries.c.user_id, entries.c.category, entries.c.activity_name)
+        ).all()
+
+        # Каноническое написание - самое частое среди вариантов с одним ключом
+        counts: Dict[ActivityKey, Counter] = defaultdict(Counter)
+        for user_id, category, name, count in spellings:
+            counts[(user_id, category, normalize_activity_name(name))][name.strip()] += count
+
+        resolver = ActivityResolver()
+        resolver.assign(connection, [
+            {'user_id': user_id, 'category': category, 'activity_name': variants.most_common(1)[0][0]}
+            for (user_id, category, _), variants in counts.items()
+        ])
+
+        connection.execute(text(
+            "CREATE TEMP TABLE activity_map ("
+            "user_id INTEGER, category VARCHAR, activity_name VARCHAR, activity_id INTEGER, "
+            "PRIMARY KEY (user_id, category, activity_name))"
+        ))
+        try:
+            connection.execute(
+                text("INSERT INTO activity_map VALUES (:user_id, :category, :activity_name, :activity_id)"),
+                [
+                    {
+                        'user_id': user_id,
+                        # Enum хранится в таблице по имени элемента
+                        'category': category.name,
+                        'activity_name': name,
+                        'activity_id': resolver.get(user_id, category, name)
+                    }
+                    for user_id, category, name, _ in spellings
+                ]
+            )
+            connection.commit()
+
+            min_id, max_id = connection.execute(
+                select(func.min(entries.c.id), func.max(entries.c.id)).where(unassigned)
+            ).one()
+            updated = 0
+            for low in range(min_id, max_id + 1, chunk_size):
+                high = low + chunk_size
+                result = connection.execute(text(
+                    "UPDATE time_entries SET activity_id = ("
+                    "SELECT m.activity_id FROM activity_map m "
+                    "WHERE m.user_id = time_entries.user_id "
+                    "AND m.category = time_entries.category "
+                    "AND m.activity_name = time_entries.activity_name) "
+                    "WHERE id >= :low AND id < :high AND activity_id IS NULL AND category IS NOT NULL"
+                ), {'low': low, 'high': high})
+                connection.commit()
+                updated += result.rowcount
+                if progress:
+                    progress(min(high - 1, max_id), max_id)
+
+            return updated
+        finally:
+            # Временная таблица живет на соединении из пула: после ошибки ее нужно убрать
+            connection.rollback()
+            connection.execute(text("DROP TABLE IF EXISTS activity_map"))
+            connection.commit()
+
+def fetch_activity_names(connection: Connection, ids: Optional[Iterable[int]] = None) -> Dict[int, str]:
+    """Возвращает названия задач для отображения"""
+    query = select(Activity.id, Activity.name)
+    if ids is not None:
+        query = query.where(Activity.id.in_(list(ids)))
+    return dict(connection.execute(query).all())
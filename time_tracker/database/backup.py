@@ -0,0 +1,245 @@
+"""
+Резервные копии SQLite через online backup API
+
+Копия снимается по BACKUP_STEP_PAGES страниц за шаг с паузой между шагами:
+блокировка чтения исходной базы держится только на время одного шага, а в
+режиме WAL запись бота не ждет даже ее. Если бот изменил базу между шагами,
+SQLite начинает копирование заново; после BACKUP_MAX_RESTARTS перезапусков
+оставшаяся часть копируется одним шагом. Готовая копия сжимается gzip в
+data/backups/tracker-ГГГГММДД-ЧЧММСС.db.gz, хранятся последние BACKUP_KEEP.
+
+Восстановление сначала проверяет копию (PRAGMA integrity_check) и сохраняет
+текущую базу отдельной копией. Номера журнала entry_events в восстановленной
+базе продолжаются после номеров текущей, а событие reset заставляет
+потребителей журнала (дашборд, снимок) загрузить записи заново.
+"""
+
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine
+
+from .events import reset_event_consumers
+
+logger = logging.getLogger(__name__)
+
+# Каталог копий и число хранимых поколений
+BACKUP_DIR = os.getenv('BACKUP_DIR', os.path.join('data', 'backups'))
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
+# Страниц за шаг копирования и пауза между шагами, секунды
+BACKUP_STEP_PAGES = int(os.getenv('BACKUP_STEP_PAGES', '256'))
+BACKUP_STEP_PAUSE = float(os.getenv('BACKUP_STEP_PAUSE', '0.01'))
+# Сколько раз копирование может начаться заново из-за записи в базу
+BACKUP_MAX_RESTARTS = int(os.getenv('BACKUP_MAX_RESTARTS', '3'))
+# Уровень сжатия gzip: 1 - втрое быстрее, копия примерно на 15% больше
+BACKUP_COMPRESS_LEVEL = int(os.getenv('BACKUP_COMPRESS_LEVEL', '6'))
+
+BACKUP_PREFIX = 'tracker-'
+BACKUP_SUFFIX = '.db.gz'
+
+class _TooManyRestarts(Exception):
+    pass
+
+def database_path(url: str) -> str:
+    """Путь к файлу базы из адреса sqlite:///..."""
+    if not url.startswith('sqlite:///') or ':memory:' in url:
+        raise ValueError(f"Резервное копирование поддерживает только файловую SQLite: {url}")
+    return url[len('sqlite:///'):]
+
+def _copy_pages(source: sqlite3.Connection, target: sqlite3.Connection, pages: int, pause: float,
+                max_restarts: int) -> dict:
+    """Копирует базу шагами по pages страниц, возвращает число шагов и перезапусков"""
+    state = {'steps': 0, 'restarts': 0, 'remaining': None}
+
+    def progress(status, remaining, total):
+        state['steps'] += 1
+        # Оставшихся страниц стало больше - SQLite начал копирование заново
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > max_restarts:
+                raise _TooManyRestarts()
+        state['remaining'] = remaining
+        if remaining and pause:
+            time.sleep(pause)
+
+    try:
+        source.backup(target, pages=pages, progress=progress)
+    except _TooManyRestarts:
+        # Один шаг держит только транзакцию чтения: в WAL запись не блокируется
+        logger.warning("База меняется быстрее, чем копируется: копирование одним шагом")
+        source.backup(target)
+        state['steps'] += 1
+    return {'steps': state['steps'], 'restarts': state['restarts']}
+
+def _compress(path: str, output: str):
+    temporary = f"{output}.tmp"
+    with open(path, 'rb') as source, gzip.open(temporary, 'wb', compresslevel=BACKUP_COMPRESS_LEVEL) as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    os.replace(temporary, output)
+
+def backup_database(path: str, directory: str = BACKUP_DIR, pages: int = BACKUP_STEP_PAGES,
+                    pause: float = BACKUP_STEP_PAUSE, max_restarts: int = BACKUP_MAX_RESTARTS,
+                    prefix: str = BACKUP_PREFIX) -> dict:
+    """Снимает сжатую копию базы, возвращает путь, размеры и время этапов"""
+    os.makedirs(directory, exist_ok=True)
+    output = os.path.join(directory, f"{prefix}{datetime.now().strftime('%Y%m%d-%H%M%S')}{BACKUP_SUFFIX}")
+    with tempfile.TemporaryDirectory(dir=directory) as work:
+        plain = os.path.join(work, 'backup.db')
+        started = time.perf_counter()
+        source = sqlite3.connect(path)
+        target = sqlite3.connect(plain)
+        try:
+            copy = _copy_pages(source, target, pages, pause, max_restarts)
+        finally:
+            target.close()
+            source.close()
+        copy_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        _compress(plain, output)
+        compress_s = time.perf_counter() - started
+        size = os.path.getsize(plain)
+
+    result = {
+        'path': output,
+        'bytes': size,
+        'compressed_bytes': os.path.getsize(output),
+        'copy_s': copy_s,
+        'compress_s': compress_s,
+        **copy,
+    }
+    logger.info("Резервная копия %s: %.1f МБ за %.2f с (%d шагов, перезапусков %d), сжатие %.2f с",
+                output, size / 2 ** 20, copy_s, copy['steps'], copy['restarts'], compress_s)
+    return result
+
+def list_backups(directory: str = BACKUP_DIR, prefix: str = BACKUP_PREFIX) -> List[str]:
+    """Копии от старых к новым"""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(
+        name for name in os.listdir(directory) if name.startswith(prefix) and name.endswith(BACKUP_SUFFIX)
+    )
+    return [os.path.join(directory, name) for name in names]
+
+def prune_backups(directory: str = BACKUP_DIR, keep: int = BACKUP_KEEP) -> List[str]:
+    """Удаляет копии сверх keep последних, возвращает удаленные"""
+    removed = list_backups(directory)[:-keep] if keep > 0 else []
+    for path in removed:
+        os.remove(path)
+    return removed
+
+def _decompress(path: str, output: str):
+    with gzip.open(path, 'rb') as source, open(output, 'wb') as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+
+def _check(path: str) -> Dict[str, int]:
+    """integrity_check и число строк в таблицах; ValueError при повреждении"""
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        result = [row[0] for row in connection.execute("PRAGMA integrity_check")]
+        if result != ['ok']:
+            raise ValueError(f"integrity_check: {'; '.join(result[:5])}")
+        tables = [row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )]
+        return {table: connection.execute(f'SELECT count(*) FROM "{table}"').fetchone()[0] for table in tables}
+    finally:
+        connection.close()
+
+def verify_backup(path: str) -> Dict[str, int]:
+    """Распаковывает копию во временный файл и проверяет ее, возвращает число строк по таблицам"""
+    with tempfile.TemporaryDirectory() as work:
+        plain = os.path.join(work, 'verify.db')
+        try:
+            _decompress(path, plain)
+        except (OSError, EOFError) as e:
+            raise ValueError(f"Не удалось распаковать {path}: {e}")
+        return _check(plain)
+
+def _has_event_log(connection: sqlite3.Connection) -> bool:
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entry_events'"
+    ).fetchone() is not None
+
+def _event_head(path: str) -> int:
+    """Последний выданный номер журнала entry_events (0, если журнала нет)"""
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        if not _has_event_log(connection):
+            return 0
+        # В sqlite_sequence - и номера событий, удаленных уплотнением
+        row = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'entry_events'").fetchone()
+        last = connection.execute("SELECT max(seq) FROM entry_events").fetchone()[0]
+        return max(row[0] if row else 0, last or 0)
+    finally:
+        connection.close()
+
+def _continue_event_log(path: str, head: int):
+    """
+    Продолжает номера журнала копии после head и пишет в нее событие reset
+
+    Иначе номера событий повторятся, и потребитель со смещением из текущей
+    базы пропустит новые события, а удаленные восстановлением записи оставит.
+    """
+    connection = sqlite3.connect(path)
+    try:
+        if not _has_event_log(connection):
+            return
+        with connection:
+            updated = connection.execute(
+                "UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'entry_events'", (head,)
+            ).rowcount
+            if not updated:
+                connection.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('entry_events', ?)", (head,))
+    finally:
+        connection.close()
+    restored = create_engine(f"sqlite:///{path}")
+    try:
+        reset_event_consumers(restored)
+    finally:
+        restored.dispose()
+
+def restore_backup(path: str, database: str, directory: str = BACKUP_DIR) -> dict:
+    """
+    Восстанавливает базу из копии
+
+    Копия проверяется до того, как база будет тронута; текущая база
+    сохраняется копией pre-restore-*. Бот на время восстановления лучше
+    остановить: его открытые транзакции будут ждать окончания записи.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=directory) as work:
+        plain = os.path.join(work, 'restore.db')
+        _decompress(path, plain)
+        tables = _check(plain)
+        safety = backup_database(database, directory, pages=-1, prefix='pre-restore-') if os.path.exists(database) else None
+        _continue_event_log(plain, _event_head(database) if os.path.exists(database) else 0)
+        # Через backup API: страницы пишутся под блокировкой базы, а WAL и
+        # соединения других процессов остаются согласованными
+        source = sqlite3.connect(plain)
+        target = sqlite3.connect(database)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+    logger.info("База %s восстановлена из %s", database, path)
+    return {'tables': tables, 'safety': safety['path'] if safety else None}
+
+def run_backup(path: str, directory: str = BACKUP_DIR, keep: int = BACKUP_KEEP) -> dict:
+    """Копия, проверка и удаление старых поколений - один проход расписания"""
+    result = backup_database(path, directory)
+    result['tables'] = verify_backup(result['path'])
+    result['removed'] = prune_backups(directory, keep)
+    return result
+
+def latest_backup(directory: str = BACKUP_DIR) -> Optional[str]:
+    backups = list_backups(directory)
+    return backups[-1] if backups else None
@@ -0,0 +1,152 @@
+"""
+Автоматическое определение категории задачи по ключевым словам
+
+Все ключевые слова собраны в один автомат Ахо-Корасик, поэтому название
+просматривается за один проход независимо от размера словаря. Результат
+для нормализованного названия кэшируется (LRU), так что повторяющиеся
+названия при массовой переклассификации не разбираются заново.
+"""
+
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+from .models import ActivityCategory, normalize_activity_name
+
+# Маппинг активностей к категориям
+ACTIVITY_CATEGORY_MAPPING = {
+    # Работа
+    "программирование": ActivityCategory.WORK,
+    "код-ревью": ActivityCategory.WORK,
+    "встречи": ActivityCategory.WORK,
+    "планирование": ActivityCategory.WORK,
+    "отладка": ActivityCategory.WORK,
+    "тестирование": ActivityCategory.WORK,
+    "работа с базой данных": ActivityCategory.WORK,
+    "оптимизация": ActivityCategory.WORK,
+    "работа с api": ActivityCategory.WORK,
+    "настройка": ActivityCategory.WORK,
+    "документирование": ActivityCategory.WORK,
+    "git": ActivityCategory.WORK,
+    "deployment": ActivityCategory.WORK,
+    "code review": ActivityCategory.WORK,
+    "meetings": ActivityCategory.WORK,
+    "debugging": ActivityCategory.WORK,
+    "testing": ActivityCategory.WORK,
+    "database": ActivityCategory.WORK,
+    "optimization": ActivityCategory.WORK,
+    "api": ActivityCategory.WORK,
+    "setup": ActivityCategory.WORK,
+    "documentation": ActivityCategory.WORK,
+    
+    # Учеба
+    "изучение": ActivityCategory.STUDY,
+    "чтение": ActivityCategory.STUDY,
+    "английский": ActivityCategory.STUDY,
+    "видео": ActivityCategory.STUDY,
+    "алгоритмы": ActivityCategory.STUDY,
+    "фреймворки": ActivityCategory.STUDY,
+    "технологии": ActivityCategory.STUDY,
+    "документация": ActivityCategory.STUDY,
+    "курсы": ActivityCategory.STUDY,
+    "learning": ActivityCategory.STUDY,
+    "reading": ActivityCategory.STUDY,
+    "english": ActivityCategory.STUDY,
+    "video": ActivityCategory.STUDY,
+    "algorithms": ActivityCategory.STUDY,
+    "frameworks": ActivityCategory.STUDY,
+    "technologies": ActivityCategory.STUDY,
+    "courses": ActivityCategory.STUDY,
+    
+    # Отдых
+    "упражнения": ActivityCategory.REST,
+    "медитация": ActivityCategory.REST,
+    "прогулки": ActivityCategory.REST,
+    "хобби": ActivityCategory.REST,
+    "отдых": ActivityCategory.REST,
+    "книги": ActivityCategory.REST,
+    "физические": ActivityCategory.REST,
+    "exercise": ActivityCategory.REST,
+    "meditation": ActivityCategory.REST,
+    "walking": ActivityCategory.REST,
+    "hobby": ActivityCategory.REST,
+    "rest": ActivityCategory.REST,
+    "books": ActivityCategory.REST,
+    "physical": ActivityCategory.REST
+}
+
+class KeywordAutomaton:
+    """
+    Автомат Ахо-Корасик для поиска подстрок
+
+    Каждому ключевому слову соответствует приоритет (меньше - важнее).
+    `best_match` возвращает приоритет самого важного найденного слова.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._best: List[Optional[int]] = [None]
+
+        for priority, keyword in enumerate(keywords):
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(None)
+                state = next_state
+            if self._best[state] is None or priority < self._best[state]:
+                self._best[state] = priority
+
+        # Ссылки неудач строятся обходом в ширину; лучший приоритет
+        # наследуется от состояния, в которое ведет ссылка неудачи
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                fail_state = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = fail_state if fail_state != next_state else 0
+                inherited = self._best[self._fail[next_state]]
+                if inherited is not None and (self._best[next_state] is None or inherited < self._best[next_state]):
+                    self._best[next_state] = inherited
+
+    def best_match(self, text: str) -> Optional[int]:
+        """Возвращает наименьший приоритет среди слов, входящих в текст"""
+        goto, fail, best_at = self._goto, self._fail, self._best
+        state = 0
+        best = None
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            found = best_at[state]
+            if found is not None and (best is None or found < best):
+                best = found
+                if best == 0:
+                    break
+        return best
+
+_KEYWORDS = [normalize_activity_name(keyword) for keyword in ACTIVITY_CATEGORY_MAPPING]
+_CATEGORIES = list(ACTIVITY_CATEGORY_MAPPING.values())
+_AUTOMATON = KeywordAutomaton(_KEYWORDS)
+
+@lru_cache(maxsize=65536)
+def _match_normalized(key: str) -> Optional[ActivityCategory]:
+    priority = _AUTOMATON.best_match(key)
+    return _CATEGORIES[priority] if priority is not None else None
+
+def match_category(activity_name: str) -> Optional[ActivityCategory]:
+    """Определяет категорию по названию или возвращает None, если слов не найдено"""
+    return _match_normalized(normalize_activity_name(activity_name))
+
+def classify_activity(activity_name: str, default: ActivityCategory = ActivityCategory.WORK) -> ActivityCategory:
+    """Определяет категорию задачи; без совпадений возвращает `default`"""
+    return match_category(activity_name) or default
@@ -1,31 +1,122 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, Session
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
 from .models import Base
+from .activities import backfill_activity_ids
+from .events import drop_event_triggers, install_event_triggers, reset_event_consumers
+from .search import install_search_index
+from .timezones import backfill_local_dates, missing_local_dates
+from .query_log import query_log
 import os
+import time
 
 # Путь к файлу базы данных
-DATABASE_URL = "sqlite:///data/tracker.db"
+DATABASE_URL = os.getenv('DATABASE_URL', "sqlite:///data/tracker.db")
+
+# Настройки пула соединений
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+# Сколько миллисекунд SQLite ждет снятия блокировки перед ошибкой "database is locked"
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+
+# Статистика запросов текущего обновления (см. track_queries)
+_query_stats: ContextVar[Optional[dict]] = ContextVar('query_stats', default=None)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Настраивает каждое новое соединение SQLite"""
+    cursor = dbapi_connection.cursor()
+    # WAL позволяет дашборду читать, пока бот пишет
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+    stats = _query_stats.get()
+    if stats is not None:
+        stats['queries'] += 1
+        stats['db_time'] += elapsed
+    query_log.record(conn, cursor, statement, parameters, elapsed, executemany)
+
+def create_db_engine(url: str = DATABASE_URL) -> Engine:
+    """Создает движок базы данных с настроенным пулом соединений"""
+    options = {}
+    if url.startswith('sqlite'):
+        # Необходимо для SQLite в многопоточных приложениях
+        options['connect_args'] = {"check_same_thread": False}
+    if ':memory:' not in url:
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=True,
+        )
+
+    db_engine = create_engine(url, **options)
+    if url.startswith('sqlite'):
+        event.listen(db_engine, 'connect', _set_sqlite_pragmas)
+    event.listen(db_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(db_engine, 'after_cursor_execute', _after_cursor_execute)
+    return db_engine
 
 # Создание движка базы данных
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False}  # Необходимо для SQLite в многопоточных приложениях
-)
+engine = create_db_engine()
 
 # Создание фабрики сессий
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def create_tables():
-    """Создает все таблицы в базе данных"""
-    import os
-    
+def create_tables(bind: Optional[Engine] = None):
+    """Создает все таблицы в базе данных (по умолчанию - в основной)"""
     # Создаем директорию data, если её нет
     data_dir = os.path.join(os.getcwd(), 'data')
     if not os.path.exists(data_dir):
         os.makedirs(data_dir)
         print(f"✅ Создана директория: {data_dir}")
-    
-    Base.metadata.create_all(bind=engine)
+
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    upgrade_schema(bind)
+    backfill_activity_ids(bind)
+    # Заполнение локальных дат всех строк не пишется в журнал событий:
+    # после него потребители журнала загружают записи заново
+    local_backfill = missing_local_dates(bind)
+    if local_backfill:
+        drop_event_triggers(bind)
+        backfill_local_dates(bind)
+    install_event_triggers(bind)
+    if local_backfill:
+        reset_event_consumers(bind)
+    install_search_index(bind)
+
+# Индексы, замененные более широкими с тем же началом: удаляются при обновлении схемы
+_REPLACED_INDEXES = ('ix_time_entries_activity_id',)
+
+def upgrade_schema(bind: Engine):
+    """Добавляет в существующие таблицы недостающие колонки и индексы"""
+    inspector = inspect(bind)
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                    print(f"✅ Добавлена колонка {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        for name in _REPLACED_INDEXES:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
 
 def get_session() -> Session:
     """Возвращает сессию базы данных"""
@@ -35,15 +126,25 @@ def close_session(session: Session):
     """Закрывает сессию базы данных"""
     session.close()
 
-def force_save():
-    """Принудительно сохраняет все изменения в базу данных"""
+@contextmanager
+def session_scope():
+    """Единица работы: коммит при успехе, откат при ошибке"""
     session = get_session()
     try:
+        yield session
         session.commit()
-        return True
-    except Exception as e:
+    except Exception:
         session.rollback()
-        print(f"Ошибка при сохранении: {e}")
-        return False
+        raise
+    finally:
+        close_session(session)
+
+@contextmanager
+def track_queries():
+    """Собирает количество и суммарное время запросов внутри блока"""
+    stats = {'queries': 0, 'db_time': 0.0}
+    token = _query_stats.set(stats)
+    try:
+        yield stats
     finally:
-        close_session(session) 
\ No newline at end of file
+        _query_stats.reset(token)
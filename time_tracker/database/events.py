@@ -0,0 +1,199 @@
+"""
+Журнал изменений записей: entry_events и смещения потребителей
+
+Каждое добавление, изменение и удаление строки time_entries триггер SQLite
+дописывает в entry_events с возрастающим номером seq - независимо от того,
+кто пишет: бот, импорт, миграции или ручной SQL. Удаления при переносе в
+архив (analytics/archive.py) помечаются как archive: для истории запись
+не исчезла.
+
+Потребители (снимок Parquet, дашборд) хранят номер последнего обработанного
+события и читают только более новые. Начальное состояние потребитель берет
+из самой таблицы time_entries (или снимка): номер головы журнала читается
+до загрузки, а повторное применение событий после него ничего не меняет.
+
+Уплотнение удаляет события, которые уже прочитали все сохраненные
+потребители и которые старше EVENT_RETENTION_HOURS; номер последнего
+удаленного события хранится как смещение COMPACTION_MARK. Потребитель,
+отставший дальше этой отметки, загружает состояние заново. Так же после
+массовых изменений, прошедших мимо журнала (заполнение новых колонок при
+обновлении схемы), отметка сдвигается на событие reset.
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import delete, func, inspect, select, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .models import EntryEvent, EventOffset
+
+logger = logging.getLogger(__name__)
+
+# Сколько часов событий хранить после того, как их прочитали все потребители
+EVENT_RETENTION_HOURS = float(os.getenv('EVENT_RETENTION_HOURS', '24'))
+# Смещение, под которым хранится номер последнего удаленного уплотнением события
+COMPACTION_MARK = '_compacted'
+
+_COLUMNS = 'entry_id, user_id, activity_id, category, duration_minutes, entry_date, local_date, local_hour'
+
+def _trigger(name: str, timing: str, op: str, row: str, old_date: str = 'NULL') -> str:
+    return f"""
+        CREATE TRIGGER {name} AFTER {timing} ON time_entries
+        BEGIN
+            INSERT INTO entry_events (op, {_COLUMNS}, old_entry_date, created_at)
+            VALUES ('{op}', {row}.id, {row}.user_id, {row}.activity_id, {row}.category,
+                    {row}.duration_minutes, {row}.entry_date, {row}.local_date, {row}.local_hour,
+                    {old_date}, datetime('now'));
+        END
+    """
+
+TRIGGERS = {
+    'trg_time_entries_insert': _trigger('trg_time_entries_insert', 'INSERT', 'insert', 'NEW'),
+    'trg_time_entries_update': _trigger('trg_time_entries_update', 'UPDATE', 'update', 'NEW', 'OLD.entry_date'),
+    'trg_time_entries_delete': _trigger('trg_time_entries_delete', 'DELETE', 'delete', 'OLD'),
+}
+
+def install_event_triggers(bind: Engine):
+    """
+    Создает триггеры журнала или обновляет устаревшие (только SQLite)
+
+    Устаревший триггер удаляется и создается заново одним скриптом в
+    транзакции BEGIN IMMEDIATE, чтобы ни одна запись не прошла мимо журнала.
+    """
+    if bind.dialect.name != 'sqlite':
+        return
+    with bind.connect() as connection:
+        existing = dict(connection.execute(
+            text("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'time_entries'")
+        ).all())
+    changed = {
+        name: trigger for name, trigger in TRIGGERS.items()
+        if ' '.join((existing.get(name) or '').split()) != ' '.join(trigger.split())
+    }
+    if not changed:
+        return
+    script = ''.join(f"DROP TRIGGER IF EXISTS {name};{trigger};" for name, trigger in changed.items())
+    raw = bind.raw_connection()
+    try:
+        # executescript не оборачивается драйвером в свою транзакцию
+        raw.driver_connection.executescript(f"BEGIN IMMEDIATE;{script}COMMIT;")
+    finally:
+        raw.close()
+    logger.info("Триггеры журнала обновлены: %s", ', '.join(changed))
+
+def drop_event_triggers(bind: Engine):
+    """Удаляет триггеры журнала: на время пересчета, который не нужно записывать"""
+    if bind.dialect.name != 'sqlite':
+        return
+    with bind.begin() as connection:
+        for name in TRIGGERS:
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+
+def reset_event_consumers(bind: Engine):
+    """
+    Заставляет всех потребителей загрузить состояние заново
+
+    После изменений, прошедших мимо журнала, в него пишется событие reset, и
+    отметка уплотнения встает на него: смещение любого потребителя меньше
+    отметки, а более старые события больше не нужны.
+    """
+    with Session(bind) as session, session.begin():
+        marker = EntryEvent(op='reset', entry_id=0, created_at=datetime.utcnow())
+        session.add(marker)
+        session.flush()
+        seq = marker.seq
+        session.execute(delete(EntryEvent).where(EntryEvent.seq < seq))
+        offset = session.get(EventOffset, COMPACTION_MARK)
+        if offset is None:
+            session.add(EventOffset(consumer=COMPACTION_MARK, seq=seq))
+        else:
+            offset.seq = seq
+    logger.info("Потребители журнала загрузят записи заново с события %d", seq)
+
+def has_event_log(session) -> bool:
+    """Есть ли журнал в базе: его создает create_tables при запуске бота"""
+    return inspect(session.connection()).has_table(EntryEvent.__tablename__)
+
+def compacted_seq(session) -> int:
+    """Номер последнего события, удаленного уплотнением"""
+    seq = session.execute(select(EventOffset.seq).where(EventOffset.consumer == COMPACTION_MARK)).scalar()
+    return seq or 0
+
+def head_seq(session) -> int:
+    """Номер последнего события журнала"""
+    seq = session.execute(select(func.max(EntryEvent.seq))).scalar()
+    return seq if seq is not None else compacted_seq(session)
+
+def read_events(session, after: int, limit: Optional[int] = None) -> List[EntryEvent]:
+    """События с номером больше after по возрастанию"""
+    query = select(EntryEvent).where(EntryEvent.seq > after).order_by(EntryEvent.seq)
+    if limit:
+        query = query.limit(limit)
+    return list(session.execute(query).scalars())
+
+def mark_archived(session, after: int):
+    """Помечает удаления после after как перенос в архив (в транзакции удаления)"""
+    session.execute(
+        update(EntryEvent).where(EntryEvent.seq > after, EntryEvent.op == 'delete').values(op='archive')
+    )
+
+class EventConsumer:
+    """Потребитель журнала с сохраненным в event_offsets смещением"""
+
+    def __init__(self, name: str):
+        if name == COMPACTION_MARK:
+            raise ValueError(f"Имя {COMPACTION_MARK} зарезервировано")
+        self.name = name
+
+    def offset(self, session) -> Optional[int]:
+        """
+        Смещение потребителя или None, если он должен загрузить состояние
+        заново: еще не читал журнал или отстал дальше уплотнения
+        """
+        seq = session.execute(select(EventOffset.seq).where(EventOffset.consumer == self.name)).scalar()
+        if seq is None or seq < compacted_seq(session):
+            return None
+        return seq
+
+    def commit(self, session, seq: int):
+        """Сохраняет смещение (коммит транзакции - на вызывающем)"""
+        offset = session.get(EventOffset, self.name)
+        if offset is None:
+            session.add(EventOffset(consumer=self.name, seq=seq))
+        else:
+            offset.seq = seq
+
+def consumer_offsets(session) -> dict:
+    """Смещения всех потребителей (без отметки уплотнения)"""
+    rows = session.execute(
+        select(EventOffset.consumer, EventOffset.seq, EventOffset.updated_at).where(EventOffset.consumer != COMPACTION_MARK)
+    ).all()
+    return {consumer: {'seq': seq, 'updated_at': updated_at} for consumer, seq, updated_at in rows}
+
+def drop_consumer(session, name: str) -> bool:
+    """Удаляет потребителя, чтобы он не задерживал уплотнение"""
+    return session.execute(delete(EventOffset).where(EventOffset.consumer == name)).rowcount > 0
+
+def compact_events(db_engine: Engine, retention_hours: float = EVENT_RETENTION_HOURS,
+                   now: Optional[datetime] = None) -> dict:
+    """Удаляет события, прочитанные всеми потребителями и старше retention_hours"""
+    before = (now or datetime.utcnow()) - timedelta(hours=retention_hours)
+    with Session(db_engine) as session, session.begin():
+        offsets = [state['seq'] for state in consumer_offsets(session).values()]
+        old = session.execute(select(func.max(EntryEvent.seq)).where(EntryEvent.created_at <= before)).scalar() or 0
+        horizon = min(offsets + [old])
+        mark = compacted_seq(session)
+        if horizon <= mark:
+            return {'removed': 0, 'compacted_seq': mark}
+        removed = session.execute(delete(EntryEvent).where(EntryEvent.seq <= horizon)).rowcount
+        offset = session.get(EventOffset, COMPACTION_MARK)
+        if offset is None:
+            session.add(EventOffset(consumer=COMPACTION_MARK, seq=horizon))
+        else:
+            offset.seq = horizon
+    logger.info("Журнал событий уплотнен до %d: удалено %d событий", horizon, removed)
+    return {'removed': removed, 'compacted_seq': horizon}
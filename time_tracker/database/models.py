@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, BigInteger, DateTime, Enum
+from sqlalchemy import Column, Integer, String, BigInteger, Boolean, Date, DateTime, Enum, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
 
@@ -10,15 +11,139 @@ class ActivityCategory(enum.Enum):
     STUDY = "study"
     REST = "rest"
 
+def normalize_activity_name(name: str) -> str:
+    """Ключ для сравнения названий: без регистра, лишних пробелов и ё"""
+    return ' '.join(name.split()).casefold().replace('ё', 'е')
+
+class Activity(Base):
+    """Справочник задач пользователя: одна строка на задачу в категории"""
+    __tablename__ = 'activities'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'category', 'normalized_key', name='uq_activities_user_category_key'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, nullable=False)
+    category = Column(Enum(ActivityCategory), nullable=False)
+    name = Column(String(255), nullable=False)
+    normalized_key = Column(String(255), nullable=False)
+    
+    def __repr__(self):
+        return f"<Activity(id={self.id}, user_id={self.user_id}, name='{self.name}', category={self.category.value})>"
+
+def _local_date(context):
+    # Поздний импорт: модуль часовых поясов сам зависит от моделей
+    from .timezones import local_fields_default
+    return local_fields_default(context)[0]
+
+def _local_hour(context):
+    from .timezones import local_fields_default
+    return local_fields_default(context)[1]
+
+class UserSettings(Base):
+    """Настройки пользователя; пока только часовой пояс"""
+    __tablename__ = 'user_settings'
+    
+    user_id = Column(BigInteger, primary_key=True)
+    # Имя пояса IANA, например Europe/Moscow
+    timezone = Column(String(64), nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
 class TimeEntry(Base):
     __tablename__ = 'time_entries'
+    __table_args__ = (
+        # Записи пользователя за период: /stats и напоминания
+        Index('ix_time_entries_user_date', 'user_id', 'entry_date'),
+        # Записи всех пользователей за период: прогрев подсказок и срезы дашборда
+        Index('ix_time_entries_entry_date', 'entry_date'),
+        # Записи пользователя за его день: /stats и напоминания
+        Index('ix_time_entries_user_local_date', 'user_id', 'local_date'),
+        # Записи задачи и время по задачам без чтения строк: /find и список задач дашборда
+        Index('ix_time_entries_activity_duration', 'activity_id', 'duration_minutes'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(BigInteger, nullable=False)
+    # Название в том виде, как его ввели; для группировки используется activity_id
     activity_name = Column(String(255), nullable=False)
+    activity_id = Column(Integer, ForeignKey('activities.id'))
     category = Column(Enum(ActivityCategory), nullable=False)
     duration_minutes = Column(Integer, nullable=False)
     entry_date = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # День и час entry_date (UTC) в часовом поясе пользователя на момент записи
+    local_date = Column(Date, default=_local_date)
+    local_hour = Column(Integer, default=_local_hour)
+    
+    activity = relationship(Activity)
+    
+    def __repr__(self):
+        return f"<TimeEntry(id={self.id}, user_id={self.user_id}, activity='{self.activity_name}', category={self.category.value}, duration={self.duration_minutes}min, date={self.entry_date})>"
+
+class EntryRollup(Base):
+    """Дневные итоги записей, перенесенных в архив (см. analytics/archive.py)"""
+    __tablename__ = 'entry_rollups'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'activity_id', 'category', 'day', name='uq_entry_rollups_key'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, nullable=False)
+    activity_id = Column(Integer, ForeignKey('activities.id'))
+    category = Column(Enum(ActivityCategory), nullable=False)
+    day = Column(Date, nullable=False)
+    entries = Column(Integer, nullable=False)
+    minutes = Column(Integer, nullable=False)
     
     def __repr__(self):
-        return f"<TimeEntry(id={self.id}, user_id={self.user_id}, activity='{self.activity_name}', category={self.category.value}, duration={self.duration_minutes}min, date={self.entry_date})>" 
\ No newline at end of file
+        return f"<EntryRollup(user_id={self.user_id}, activity_id={self.activity_id}, day={self.day}, minutes={self.minutes})>"
+
+class EntryEvent(Base):
+    """Журнал изменений time_entries; заполняется триггерами (см. database/events.py)"""
+    __tablename__ = 'entry_events'
+    # AUTOINCREMENT: номера не переиспользуются и после уплотнения журнала
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    seq = Column(Integer, primary_key=True)
+    # insert, update, delete, archive (запись перенесена в архив) или reset (см. reset_event_consumers)
+    op = Column(String(10), nullable=False)
+    entry_id = Column(Integer, nullable=False)
+    # Значения после изменения, для delete и archive - до него
+    user_id = Column(BigInteger)
+    activity_id = Column(Integer)
+    category = Column(Enum(ActivityCategory))
+    duration_minutes = Column(Integer)
+    entry_date = Column(DateTime)
+    local_date = Column(Date)
+    local_hour = Column(Integer)
+    # Дата до изменения (только для update): запись могла перейти в другой месяц
+    old_entry_date = Column(DateTime)
+    created_at = Column(DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f"<EntryEvent(seq={self.seq}, op={self.op}, entry_id={self.entry_id})>"
+
+class EventOffset(Base):
+    """Сохраненное смещение потребителя журнала entry_events"""
+    __tablename__ = 'event_offsets'
+    
+    consumer = Column(String(100), primary_key=True)
+    seq = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+class UserShard(Base):
+    """Каталог шардов: в каком файле базы живут данные пользователя (см. database/shards.py)"""
+    __tablename__ = 'user_shards'
+    
+    user_id = Column(BigInteger, primary_key=True)
+    shard = Column(String(64), nullable=False)
+    # Данные переносятся в другой шард: запись в это время не принимается
+    moving = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+class MigrationCheckpoint(Base):
+    """Прогресс пакетных миграций для продолжения после сбоя"""
+    __tablename__ = 'migration_checkpoints'
+    
+    name = Column(String(100), primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
@@ -0,0 +1,92 @@
+"""
+Общие запросы к записям времени
+
+Запросы, которые выполняются часто (на каждую команду или при каждом
+запуске), собраны здесь, чтобы бот и scripts/check_query_plans.py
+проверяли один и тот же SQL.
+"""
+
+from datetime import date
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .models import Activity, EntryRollup, TimeEntry
+
+def entries_for_day(session: Session, user_id: int, day: date) -> List[TimeEntry]:
+    """Записи пользователя за его день (day - в поясе пользователя, индекс user_id + local_date)"""
+    return session.query(TimeEntry).filter(
+        TimeEntry.user_id == user_id,
+        TimeEntry.local_date == day
+    ).all()
+
+def activity_totals(session: Session, user_id: int, activity_ids: List[int]) -> List[Dict]:
+    """
+    Итоги по задачам пользователя: записи в базе плюс дневные итоги архива
+
+    Возвращает словари с activity_id, name, category, entries, minutes и
+    last (дата последней записи в базе или последний день в архиве),
+    по убыванию времени.
+    """
+    if not activity_ids:
+        return []
+    totals = {
+        activity_id: {'activity_id': activity_id, 'name': name, 'category': category,
+                      'entries': 0, 'minutes': 0, 'last': None}
+        for activity_id, name, category in session.execute(
+            select(Activity.id, Activity.name, Activity.category)
+            .where(Activity.id.in_(activity_ids), Activity.user_id == user_id)
+        )
+    }
+    live = session.execute(
+        select(TimeEntry.activity_id, func.count(TimeEntry.id), func.sum(TimeEntry.duration_minutes),
+               func.max(TimeEntry.local_date))
+        .where(TimeEntry.user_id == user_id, TimeEntry.activity_id.in_(list(totals)))
+        .group_by(TimeEntry.activity_id)
+    )
+    archived = session.execute(
+        select(EntryRollup.activity_id, func.sum(EntryRollup.entries), func.sum(EntryRollup.minutes),
+               func.max(EntryRollup.day))
+        .where(EntryRollup.user_id == user_id, EntryRollup.activity_id.in_(list(totals)))
+        .group_by(EntryRollup.activity_id)
+    )
+    for rows in (live, archived):
+        for activity_id, entries, minutes, last in rows:
+            total = totals[activity_id]
+            total['entries'] += entries
+            total['minutes'] += minutes or 0
+            if last is not None and (total['last'] is None or last > total['last']):
+                total['last'] = last
+    found = [total for total in totals.values() if total['entries']]
+    return sorted(found, key=lambda total: total['minutes'], reverse=True)
+
+def recent_entries(session: Session, user_id: int, activity_ids: List[int], limit: int = 5) -> List[TimeEntry]:
+    """Последние записи пользователя по задачам"""
+    return session.query(TimeEntry).filter(
+        TimeEntry.user_id == user_id,
+        TimeEntry.activity_id.in_(activity_ids)
+    ).order_by(TimeEntry.entry_date.desc()).limit(limit).all()
+
+def activity_time_totals(connection: Connection) -> List[Tuple[int, int]]:
+    """
+    Время всех задач в минутах (база и итоги архива) по убыванию: список задач дашборда
+
+    Группировка по activity_id читает только индекс (activity_id, duration_minutes).
+    """
+    minutes: Dict[int, int] = {}
+    live = connection.execute(
+        select(TimeEntry.activity_id, func.sum(TimeEntry.duration_minutes))
+        .where(TimeEntry.activity_id.isnot(None))
+        .group_by(TimeEntry.activity_id)
+    )
+    archived = connection.execute(
+        select(EntryRollup.activity_id, func.sum(EntryRollup.minutes))
+        .where(EntryRollup.activity_id.isnot(None))
+        .group_by(EntryRollup.activity_id)
+    )
+    for rows in (live, archived):
+        for activity_id, total in rows:
+            minutes[activity_id] = minutes.get(activity_id, 0) + total
+    return sorted(minutes.items(), key=lambda item: (-item[1], item[0]))
@@ -0,0 +1,110 @@
+"""
+Журнал запросов: время по отпечаткам и планы медленных запросов
+
+Движок (см. engine.py) передает сюда каждый выполненный запрос. Время
+накапливается по отпечатку - тексту запроса без литералов, - а запросы
+дольше порога попадают в лог вместе с EXPLAIN QUERY PLAN. Полный просмотр
+таблицы time_entries отмечается отдельно: на больших объемах это первый
+кандидат на индекс.
+"""
+
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Порог медленного запроса в миллисекундах
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+# Таблицы, полный просмотр которых считается проблемой
+WATCHED_TABLES = ('time_entries',)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:\?|__\[POSTCOMPILE_\w+\])(?:, ?\?)*\)', re.IGNORECASE)
+_EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> str:
+    """Текст запроса без литералов и с одним `?` вместо списков IN"""
+    text = ' '.join(statement.split())
+    text = _STRING.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    return _IN_LIST.sub('IN (?)', text)
+
+def explain_query_plan(dbapi_connection, statement: str, parameters=()) -> List[str]:
+    """Возвращает строки EXPLAIN QUERY PLAN для запроса SQLite"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+def full_scans(plan: Sequence[str], tables: Sequence[str] = WATCHED_TABLES) -> List[str]:
+    """Строки плана с полным просмотром отслеживаемых таблиц"""
+    pattern = re.compile(rf"^SCAN (?:TABLE )?(?:{'|'.join(map(re.escape, tables))})\b")
+    return [line for line in plan if pattern.match(line)]
+
+@dataclass
+class QueryStats:
+    """Накопленная статистика одного отпечатка"""
+    statement: str
+    count: int = 0
+    total_s: float = 0.0
+    max_s: float = 0.0
+    plan: List[str] = field(default_factory=list)
+    full_scans: List[str] = field(default_factory=list)
+
+class QueryLog:
+    """Время запросов по отпечаткам и EXPLAIN для медленных"""
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS):
+        self.threshold_ms = threshold_ms
+        self.stats: Dict[str, QueryStats] = {}
+
+    def record(self, conn, cursor, statement: str, parameters, elapsed: float, executemany: bool):
+        """Учитывает выполненный запрос; вызывается из after_cursor_execute"""
+        key = fingerprint(statement)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = QueryStats(key)
+        stats.count += 1
+        stats.total_s += elapsed
+        stats.max_s = max(stats.max_s, elapsed)
+
+        if elapsed * 1000 < self.threshold_ms or executemany:
+            return
+        if conn.dialect.name != 'sqlite' or not statement.lstrip().upper().startswith(_EXPLAINABLE):
+            logger.warning("Медленный запрос %.1f мс: %s", elapsed * 1000, key)
+            return
+
+        try:
+            stats.plan = explain_query_plan(cursor.connection, statement, parameters)
+        except Exception as e:
+            logger.warning("Не удалось получить план запроса: %s", e)
+            return
+        stats.full_scans = full_scans(stats.plan)
+        logger.warning(
+            "Медленный запрос %.1f мс%s: %s\n    план: %s",
+            elapsed * 1000,
+            " (ПОЛНЫЙ ПРОСМОТР time_entries)" if stats.full_scans else "",
+            key,
+            "; ".join(stats.plan)
+        )
+
+    def top(self, limit: int = 10, by: str = 'total_s') -> List[QueryStats]:
+        """Самые затратные отпечатки"""
+        return sorted(self.stats.values(), key=lambda stats: getattr(stats, by), reverse=True)[:limit]
+
+    def reset(self, threshold_ms: Optional[float] = None):
+        """Очищает статистику и, при необходимости, меняет порог"""
+        self.stats.clear()
+        if threshold_ms is not None:
+            self.threshold_ms = threshold_ms
+
+# Общий журнал для всех движков, созданных create_db_engine
+query_log = QueryLog()
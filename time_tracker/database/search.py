@@ -0,0 +1,131 @@
+"""
+Полнотекстовый поиск задач: индекс FTS5 над справочником activities
+
+Индексируется нормализованный ключ названия (см. normalize_activity_name):
+без регистра и с ё, замененной на е, поэтому "Ёлка" находится по "елк".
+Токенизатор unicode61 делит текст на слова по правилам Unicode - русский и
+английский одинаково; каждое слово запроса ищется как префикс ("прог"
+находит "Программирование"), все слова должны встретиться в названии.
+Индекс префиксов из 2 и 3 символов ускоряет короткие запросы.
+
+Индекс хранит только токены (external content): сами названия читаются
+из activities. Триггеры обновляют индекс при любой записи в справочник.
+Если SQLite собран без FTS5 или база не SQLite, поиск идет по LIKE.
+"""
+
+import logging
+import re
+from typing import List, Optional
+
+from sqlalchemy import and_, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+
+from .models import Activity, normalize_activity_name
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'activities_fts'
+
+_CREATE_INDEX = f"""
+    CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(
+        normalized_key,
+        content='activities',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+"""
+
+_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_activities_fts_insert AFTER INSERT ON activities
+    BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, normalized_key) VALUES (NEW.id, NEW.normalized_key);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_activities_fts_delete AFTER DELETE ON activities
+    BEGIN
+        INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, normalized_key) VALUES ('delete', OLD.id, OLD.normalized_key);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_activities_fts_update AFTER UPDATE OF normalized_key ON activities
+    BEGIN
+        INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, normalized_key) VALUES ('delete', OLD.id, OLD.normalized_key);
+        INSERT INTO {SEARCH_TABLE} (rowid, normalized_key) VALUES (NEW.id, NEW.normalized_key);
+    END
+    """,
+)
+
+def install_search_index(bind: Engine):
+    """Создает индекс поиска и триггеры; новый индекс заполняется из справочника (только SQLite)"""
+    if bind.dialect.name != 'sqlite':
+        return
+    created = False
+    try:
+        with bind.begin() as connection:
+            if not inspect(connection).has_table(SEARCH_TABLE):
+                connection.execute(text(_CREATE_INDEX))
+                connection.execute(text(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('rebuild')"))
+                created = True
+            for trigger in _TRIGGERS:
+                connection.execute(text(trigger))
+    except OperationalError as e:
+        # Например, SQLite собран без FTS5 - тогда поиск идет по LIKE
+        logger.warning("Индекс поиска задач не создан, поиск будет медленнее: %s", e)
+        return
+    if created:
+        print("✅ Создан индекс поиска задач")
+
+def rebuild_search_index(bind: Engine):
+    """Перестраивает индекс поиска по справочнику"""
+    with bind.begin() as connection:
+        connection.execute(text(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('rebuild')"))
+
+def has_search_index(connection: Connection) -> bool:
+    return connection.dialect.name == 'sqlite' and inspect(connection).has_table(SEARCH_TABLE)
+
+def search_terms(query: str) -> List[str]:
+    """Слова запроса в том же виде, что и в индексе"""
+    return re.findall(r'\w+', normalize_activity_name(query))
+
+def match_expression(terms: List[str]) -> str:
+    """Запрос FTS5: каждое слово - префикс, все слова обязательны"""
+    # Кавычки делают из слова строку: операторы FTS5 (AND, NEAR, ^) не срабатывают
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def search_activities(connection: Connection, query: str, user_id: Optional[int] = None,
+                      limit: Optional[int] = None) -> List[int]:
+    """
+    Id задач, в названии которых есть все слова запроса (по началу слова)
+
+    С индексом FTS5 задачи упорядочены по релевантности (bm25), без него -
+    по id. Пустой запрос ничего не находит.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    if has_search_index(connection):
+        sql = (
+            f"SELECT a.id FROM {SEARCH_TABLE} f JOIN activities a ON a.id = f.rowid "
+            f"WHERE {SEARCH_TABLE} MATCH :query"
+            + (" AND a.user_id = :user_id" if user_id is not None else "")
+            + " ORDER BY f.rank"
+            + (" LIMIT :limit" if limit else "")
+        )
+        parameters = {'query': match_expression(terms), 'user_id': user_id, 'limit': limit}
+        return list(connection.execute(text(sql), parameters).scalars())
+
+    # Без индекса: слово - начало ключа или слово после пробела
+    conditions = [
+        Activity.normalized_key.like(f"{term}%") | Activity.normalized_key.like(f"% {term}%")
+        for term in terms
+    ]
+    if user_id is not None:
+        conditions.append(Activity.user_id == user_id)
+    statement = select(Activity.id).where(and_(*conditions)).order_by(Activity.id)
+    if limit:
+        statement = statement.limit(limit)
+    return list(connection.execute(statement).scalars())
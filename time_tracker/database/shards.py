@@ -0,0 +1,374 @@
+"""
+Шарды хранилища: данные каждого пользователя живут в одном файле SQLite
+
+SQLite допускает одного писателя на файл, поэтому при многих пользователях
+их записи разносятся по SHARD_COUNT файлам: шард main - основная база
+DATABASE_URL, остальные - SHARD_DIR/shard-N.db. Записи разных шардов идут
+параллельно.
+
+Шард пользователя хранится в каталоге user_shards основной базы. Новому
+пользователю шард выбирается rendezvous-хешированием: при добавлении шарда
+на новое место должна переехать только доля пользователей 1/N. Пользователи
+с данными в основной базе (до включения шардов) остаются в main, пока их не
+перенесет scripts/shards.py.
+
+Процессы помнят шард пользователя SHARD_CACHE_SECONDS секунд. Перенос
+сначала помечает пользователя в каталоге (moving), ждет, пока устареют
+кэши, копирует данные, переключает каталог и только потом удаляет данные
+из старого шарда. Дневные итоги архива (entry_rollups) и файлы архива
+остаются в старом шарде вместе с задачами, на которые они ссылаются.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .engine import DATABASE_URL, SessionLocal, create_db_engine, create_tables, engine
+from .models import Activity, EntryRollup, TimeEntry, UserSettings, UserShard
+
+logger = logging.getLogger(__name__)
+
+# Число шардов вместе с основной базой; 1 - без шардов
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1'))
+# Каталог файлов шардов, кроме основного
+SHARD_DIR = os.getenv('SHARD_DIR', os.path.join('data', 'shards'))
+# Сколько секунд помнить шард пользователя; перенос ждет столько же после пометки
+SHARD_CACHE_SECONDS = float(os.getenv('SHARD_CACHE_SECONDS', '5'))
+# Потоков для запросов ко всем шардам сразу
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '4'))
+
+MAIN_SHARD = 'main'
+# Записей в одной вставке или удалении при переносе
+MOVE_CHUNK_SIZE = 10000
+
+class UserMoving(Exception):
+    """Данные пользователя сейчас переносятся в другой шард"""
+
+def shard_urls(count: int = SHARD_COUNT, directory: str = SHARD_DIR, main_url: str = DATABASE_URL) -> Dict[str, str]:
+    """Адреса шардов по порядку: основная база, затем shard-1 ... shard-(count-1)"""
+    urls = {MAIN_SHARD: main_url}
+    for index in range(1, count):
+        urls[f"shard-{index}"] = f"sqlite:///{os.path.join(directory, f'shard-{index}.db')}"
+    return urls
+
+def rendezvous_shard(user_id: int, names: List[str]) -> str:
+    """Шард с наибольшим хешем пары (шард, пользователь)"""
+    return max(names, key=lambda name: hashlib.blake2b(f"{name}:{user_id}".encode(), digest_size=8).digest())
+
+class ShardRouter:
+    """Соответствие пользователь -> шард и пул соединений каждого шарда"""
+
+    def __init__(self, urls: Dict[str, str], catalog: Engine, cache_seconds: float = SHARD_CACHE_SECONDS):
+        self.urls = urls
+        self.names = list(urls)
+        # Каталог user_shards - в основной базе, она же шард main
+        self.catalog = catalog
+        self.cache_seconds = cache_seconds
+        self._engines: Dict[str, Engine] = {MAIN_SHARD: catalog}
+        self._cache: Dict[int, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.names) > 1
+
+    def index(self, name: str) -> int:
+        """Номер шарда: main - 0"""
+        return self.names.index(name)
+
+    def engine(self, name: str) -> Engine:
+        """Движок шарда; создается при первом обращении и дальше общий для всех потоков"""
+        db_engine = self._engines.get(name)
+        if db_engine is None:
+            with self._lock:
+                db_engine = self._engines.get(name)
+                if db_engine is None:
+                    url = self.urls[name]
+                    if url.startswith('sqlite:///'):
+                        os.makedirs(os.path.dirname(os.path.abspath(url[len('sqlite:///'):])), exist_ok=True)
+                    db_engine = self._engines[name] = create_db_engine(url)
+        return db_engine
+
+    def create_all(self):
+        """Создает и обновляет таблицы во всех шардах"""
+        for name in self.names:
+            create_tables(self.engine(name))
+
+    def directory(self, user_id: int) -> UserShard:
+        """Строка каталога пользователя; новому пользователю назначается шард"""
+        with Session(self.catalog) as session:
+            row = session.get(UserShard, user_id)
+            if row is not None:
+                return row
+            # Данные, записанные до включения шардов, остаются в основной базе
+            legacy = session.execute(select(TimeEntry.id).where(TimeEntry.user_id == user_id).limit(1)).first()
+            shard = MAIN_SHARD if legacy else rendezvous_shard(user_id, self.names)
+            # Другой процесс мог назначить шард одновременно - тогда остается его выбор
+            session.execute(sqlite_insert(UserShard).values(user_id=user_id, shard=shard).on_conflict_do_nothing())
+            session.commit()
+            return session.get(UserShard, user_id)
+
+    def shard_for(self, user_id: int) -> str:
+        """Шард пользователя; UserMoving, если его данные сейчас переносятся"""
+        if not self.sharded:
+            return MAIN_SHARD
+        cached = self._cache.get(user_id)
+        now = time.monotonic()
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        row = self.directory(user_id)
+        if row.moving:
+            self._cache.pop(user_id, None)
+            raise UserMoving(f"данные пользователя {user_id} переносятся из шарда {row.shard}")
+        if row.shard not in self.urls:
+            raise KeyError(f"шард {row.shard} пользователя {user_id} не настроен (SHARD_COUNT={len(self.names)})")
+        self._cache[user_id] = (row.shard, now + self.cache_seconds)
+        return row.shard
+
+    def engine_for(self, user_id: int) -> Engine:
+        return self.engine(self.shard_for(user_id))
+
+    def session_for(self, user_id: int) -> Session:
+        """Сессия в шарде пользователя с теми же настройками, что у get_session"""
+        if not self.sharded:
+            # Без шардов - общая фабрика сессий (замеры подменяют в ней движок)
+            return SessionLocal()
+        return Session(bind=self.engine_for(user_id), autoflush=False)
+
+    def pin(self, user_id: int) -> Callable[[], Session]:
+        """
+        Фабрика сессий в шарде пользователя, определенном один раз
+
+        Для долгих операций (импорт): все их транзакции идут в один шард.
+        Каталог читается мимо кэша, поэтому уже начатый перенос дает
+        UserMoving сразу, а не посреди операции.
+        """
+        if not self.sharded:
+            return SessionLocal
+        self.forget(user_id)
+        db_engine = self.engine_for(user_id)
+        return lambda: Session(bind=db_engine, autoflush=False)
+
+    def forget(self, user_id: int):
+        self._cache.pop(user_id, None)
+
+    def map(self, function: Callable[[str, Engine], Any], names: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Выполняет function(имя, движок) во всех шардах параллельно, результаты - по именам"""
+        names = names or self.names
+        if len(names) == 1:
+            return {names[0]: function(names[0], self.engine(names[0]))}
+        with ThreadPoolExecutor(max_workers=min(SHARD_WORKERS, len(names))) as pool:
+            futures = {name: pool.submit(function, name, self.engine(name)) for name in names}
+            return {name: future.result() for name, future in futures.items()}
+
+# Общий маршрутизатор для бота, дашборда и скриптов
+shard_router = ShardRouter(shard_urls(), engine)
+
+@contextmanager
+def user_session_scope(user_id: int, sessions: Optional[Callable[[], Session]] = None):
+    """Единица работы в шарде пользователя (или из фабрики pin): коммит при успехе, откат при ошибке"""
+    session = sessions() if sessions else shard_router.session_for(user_id)
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def shard_users(db_engine: Engine) -> List[int]:
+    """Пользователи, у которых есть записи или настройки в шарде"""
+    with db_engine.connect() as connection:
+        users = set()
+        for table in (TimeEntry.__table__, UserSettings.__table__):
+            users.update(connection.execute(select(table.c.user_id).distinct()).scalars())
+    return sorted(users)
+
+def _copy_user(source: Engine, target: Engine, user_id: int) -> int:
+    """Копирует задачи, настройки и записи пользователя в target одной транзакцией"""
+    activities, entries, settings = Activity.__table__, TimeEntry.__table__, UserSettings.__table__
+    with source.connect() as connection:
+        source_activities = connection.execute(select(activities).where(activities.c.user_id == user_id)).mappings().all()
+        source_settings = connection.execute(select(settings).where(settings.c.user_id == user_id)).mappings().all()
+        source_entries = connection.execute(
+            select(entries).where(entries.c.user_id == user_id).order_by(entries.c.id)
+        ).mappings().all()
+
+    with target.begin() as connection:
+        # Остатки прерванного переноса: пользователь в этот шард еще не направлялся
+        connection.execute(delete(entries).where(entries.c.user_id == user_id))
+        connection.execute(delete(settings).where(settings.c.user_id == user_id))
+        # Задачи, оставшиеся от прежнего пребывания в шарде (на них ссылаются итоги архива)
+        existing = {
+            (category, key): activity_id for activity_id, category, key in connection.execute(
+                select(activities.c.id, activities.c.category, activities.c.normalized_key)
+                .where(activities.c.user_id == user_id)
+            )
+        }
+        activity_ids = {}
+        for activity in source_activities:
+            key = (activity['category'], activity['normalized_key'])
+            if key not in existing:
+                values = {name: value for name, value in activity.items() if name != 'id'}
+                existing[key] = connection.execute(insert(activities).values(values)).inserted_primary_key[0]
+            activity_ids[activity['id']] = existing[key]
+        if source_settings:
+            connection.execute(insert(settings), [dict(row) for row in source_settings])
+        rows = [
+            {**{name: value for name, value in entry.items() if name != 'id'},
+             'activity_id': activity_ids.get(entry['activity_id'])}
+            for entry in source_entries
+        ]
+        for start in range(0, len(rows), MOVE_CHUNK_SIZE):
+            connection.execute(insert(entries), rows[start:start + MOVE_CHUNK_SIZE])
+    return len(source_entries)
+
+def _delete_user(db_engine: Engine, user_id: int):
+    """Удаляет данные пользователя из шарда пачками; задачи с итогами архива остаются"""
+    entries = TimeEntry.__table__
+    with db_engine.connect() as connection:
+        while True:
+            ids = connection.execute(
+                select(entries.c.id).where(entries.c.user_id == user_id).limit(MOVE_CHUNK_SIZE)
+            ).scalars().all()
+            if not ids:
+                break
+            connection.execute(delete(entries).where(entries.c.id.in_(ids)))
+            connection.commit()
+        connection.execute(delete(UserSettings).where(UserSettings.user_id == user_id))
+        referenced = select(EntryRollup.activity_id).where(EntryRollup.activity_id.isnot(None))
+        connection.execute(delete(Activity).where(Activity.user_id == user_id, Activity.id.notin_(referenced)))
+        connection.commit()
+
+def _set_moving(router: ShardRouter, user_ids: List[int], moving: bool):
+    with Session(router.catalog) as session, session.begin():
+        session.execute(update(UserShard).where(UserShard.user_id.in_(user_ids)).values(moving=moving))
+    for user_id in user_ids:
+        router.forget(user_id)
+
+def move_users(router: ShardRouter, moves: List[Tuple[int, str]],
+               progress: Optional[Callable[[dict], None]] = None) -> List[dict]:
+    """
+    Переносит данные пользователей в другие шарды: moves - пары (пользователь, шард)
+
+    Пользователи помечаются в каталоге все сразу, поэтому ожидание кэшей
+    процессов - одно на всю пачку. Сбой посреди пачки оставляет каталог
+    указывать на полный шард-источник; неполная копия удаляется при повторе.
+    """
+    plan = []
+    for user_id, target in moves:
+        if target not in router.urls:
+            raise KeyError(f"неизвестный шард {target}")
+        source = router.directory(user_id).shard
+        if source != target:
+            plan.append((user_id, source, target))
+    if not plan:
+        return []
+
+    _set_moving(router, [user_id for user_id, _, _ in plan], True)
+    results = []
+    try:
+        # Процессы, запомнившие старый шард, перестают писать в него
+        time.sleep(router.cache_seconds)
+        for user_id, source, target in plan:
+            started = time.perf_counter()
+            moved = _copy_user(router.engine(source), router.engine(target), user_id)
+            with Session(router.catalog) as session, session.begin():
+                session.execute(
+                    update(UserShard).where(UserShard.user_id == user_id).values(shard=target, moving=False)
+                )
+            router.forget(user_id)
+            _delete_user(router.engine(source), user_id)
+            result = {'user_id': user_id, 'source': source, 'target': target, 'entries': moved,
+                      'seconds': time.perf_counter() - started}
+            logger.info("Пользователь %s перенесен из %s в %s: %d записей за %.2f с",
+                        user_id, source, target, moved, result['seconds'])
+            results.append(result)
+            if progress:
+                progress(result)
+    finally:
+        # Снимаем пометку с тех, до кого очередь не дошла
+        _set_moving(router, [user_id for user_id, _, _ in plan[len(results):]], False)
+    return results
+
+def placements(router: ShardRouter) -> Dict[int, str]:
+    """Шард каждого пользователя: из каталога, а без строки каталога - там, где его данные"""
+    with Session(router.catalog) as session:
+        placed = dict(session.execute(select(UserShard.user_id, UserShard.shard)).all())
+    for name, users in router.map(lambda name, db_engine: shard_users(db_engine)).items():
+        for user_id in users:
+            placed.setdefault(user_id, name)
+    return placed
+
+def rebalance_plan(router: ShardRouter) -> List[Tuple[int, str, str]]:
+    """Пользователи не на своем шарде по rendezvous-хешу: (пользователь, откуда, куда)"""
+    plan = []
+    for user_id, shard in sorted(placements(router).items()):
+        target = rendezvous_shard(user_id, router.names)
+        if shard != target:
+            plan.append((user_id, shard, target))
+    return plan
+
+def register_user(router: ShardRouter, user_id: int, shard: str):
+    """Записывает в каталог фактический шард пользователя, если строки еще нет"""
+    with Session(router.catalog) as session, session.begin():
+        session.execute(sqlite_insert(UserShard).values(user_id=user_id, shard=shard).on_conflict_do_nothing())
+
+def stray_data(router: ShardRouter) -> List[Tuple[int, str]]:
+    """Данные пользователей не в их шарде - остатки прерванного переноса: (пользователь, шард)"""
+    with Session(router.catalog) as session:
+        directory = {user_id: (shard, moving) for user_id, shard, moving in session.execute(
+            select(UserShard.user_id, UserShard.shard, UserShard.moving))}
+    stray = []
+    for name, users in router.map(lambda name, db_engine: shard_users(db_engine)).items():
+        for user_id in users:
+            shard, moving = directory.get(user_id, (name, False))
+            if shard != name and not moving:
+                stray.append((user_id, name))
+    return stray
+
+def remove_stray_data(router: ShardRouter, stray: List[Tuple[int, str]]):
+    for user_id, name in stray:
+        _delete_user(router.engine(name), user_id)
+
+def shard_directory(base: str, name: str) -> str:
+    """Каталог файлов шарда (снимок, архив, копии): у main - сам base, у остальных - подкаталог"""
+    return base if name == MAIN_SHARD else os.path.join(base, name)
+
+def _shard_totals(name: str, db_engine: Engine) -> dict:
+    with db_engine.connect() as connection:
+        users, entries = connection.execute(
+            select(func.count(func.distinct(TimeEntry.user_id)), func.count(TimeEntry.id))
+        ).one()
+        minutes = dict(connection.execute(
+            select(TimeEntry.category, func.sum(TimeEntry.duration_minutes)).group_by(TimeEntry.category)
+        ).all())
+    return {'users': users, 'entries': entries,
+            'minutes': {category.value: total for category, total in minutes.items()}}
+
+def shard_totals(router: ShardRouter) -> Tuple[Dict[str, dict], dict]:
+    """
+    Пользователи, записи и минуты по категориям: по каждому шарду и в сумме
+
+    Запросы ко всем шардам выполняются параллельно. Пользователь живет в
+    одном шарде, поэтому число пользователей тоже складывается.
+    """
+    per_shard = router.map(_shard_totals)
+    total = {'users': 0, 'entries': 0, 'minutes': {}}
+    for totals in per_shard.values():
+        total['users'] += totals['users']
+        total['entries'] += totals['entries']
+        for category, minutes in totals['minutes'].items():
+            total['minutes'][category] = total['minutes'].get(category, 0) + minutes
+    return per_shard, total
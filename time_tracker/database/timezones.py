@@ -0,0 +1,205 @@
+"""
+Часовые пояса пользователей и локальные день и час записей
+
+entry_date хранится в UTC. Чтобы "сегодня" в /stats, напоминаниях и на
+дашборде совпадало с днем пользователя, при вставке записи рядом с ней
+сохраняются local_date и local_hour в его часовом поясе (user_settings,
+без настройки - DEFAULT_TIMEZONE). Записи за день выбираются сравнением
+local_date на равенство по индексу (user_id, local_date).
+
+Локальные поля заполняются значениями по умолчанию колонок, поэтому их
+получают и вставки через ORM, и массовые вставки через Core. Изменение
+entry_date через ORM пересчитывает их, UPDATE через Core должен задавать
+их сам. При смене пояса они пересчитываются для всех записей пользователя.
+"""
+
+import logging
+import os
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+from zoneinfo import ZoneInfo, available_timezones
+
+from sqlalchemy import Integer, and_, bindparam, cast, event, func, inspect, select, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from .models import TimeEntry, UserSettings
+
+logger = logging.getLogger(__name__)
+
+# Часовой пояс пользователей без настройки
+DEFAULT_TIMEZONE = os.getenv('DEFAULT_TIMEZONE', 'UTC')
+
+# Пояса без смещения: для них локальные поля считаются в SQL
+_UTC_NAMES = ('UTC', 'Etc/UTC', 'Etc/UCT', 'UCT', 'GMT', 'Etc/GMT', 'Universal', 'Zulu')
+
+# Пояса пользователей; пишет их только бот (/tz), поэтому кэш не устаревает
+_zones: Dict[int, ZoneInfo] = {}
+
+@lru_cache(maxsize=1)
+def _zone_names() -> Dict[str, str]:
+    return {name.casefold(): name for name in available_timezones()}
+
+def parse_timezone(name: str) -> ZoneInfo:
+    """Пояс по имени IANA без учета регистра; ValueError для неизвестного"""
+    key = _zone_names().get(name.strip().casefold())
+    if key is None:
+        raise ValueError(f"неизвестный часовой пояс '{name}'")
+    return ZoneInfo(key)
+
+@lru_cache(maxsize=1)
+def default_timezone() -> ZoneInfo:
+    try:
+        return parse_timezone(DEFAULT_TIMEZONE)
+    except ValueError:
+        logger.warning("DEFAULT_TIMEZONE=%s не найден, используется UTC", DEFAULT_TIMEZONE)
+        return ZoneInfo('UTC')
+
+def is_utc(zone: ZoneInfo) -> bool:
+    return zone.key in _UTC_NAMES
+
+def get_timezone(connection, user_id: int) -> ZoneInfo:
+    """Пояс пользователя (connection - соединение или сессия)"""
+    zone = _zones.get(user_id)
+    if zone is None:
+        name = connection.execute(select(UserSettings.timezone).where(UserSettings.user_id == user_id)).scalar()
+        try:
+            zone = parse_timezone(name) if name else default_timezone()
+        except ValueError:
+            logger.warning("У пользователя %s неизвестный пояс %s, используется %s", user_id, name, DEFAULT_TIMEZONE)
+            zone = default_timezone()
+        _zones[user_id] = zone
+    return zone
+
+def local_now(connection, user_id: int) -> datetime:
+    """Текущее время в поясе пользователя"""
+    return datetime.now(get_timezone(connection, user_id))
+
+def local_fields(entry_date: datetime, zone: ZoneInfo) -> Tuple[date, int]:
+    """День и час entry_date в поясе zone; время без пояса считается UTC"""
+    if entry_date.tzinfo is None:
+        entry_date = entry_date.replace(tzinfo=timezone.utc)
+    local = entry_date.astimezone(zone)
+    return local.date(), local.hour
+
+def local_fields_default(context) -> Tuple[Optional[date], Optional[int]]:
+    """Значения по умолчанию local_date и local_hour для вставляемой строки"""
+    parameters = context.get_current_parameters()
+    entry_date, user_id = parameters.get('entry_date'), parameters.get('user_id')
+    if entry_date is None or user_id is None:
+        return None, None
+    return local_fields(entry_date, get_timezone(context.connection, user_id))
+
+@event.listens_for(TimeEntry, 'before_update')
+def _update_local_fields(mapper, connection, target: TimeEntry):
+    """Пересчитывает локальные поля, если через ORM изменили дату записи"""
+    if inspect(target).attrs.entry_date.history.has_changes():
+        target.local_date, target.local_hour = local_fields(target.entry_date, get_timezone(connection, target.user_id))
+
+def _fill_utc(connection: Connection, condition, low: int, high: int) -> int:
+    """Локальные поля для пользователей в UTC - одним UPDATE в SQLite"""
+    entries = TimeEntry.__table__
+    return connection.execute(
+        update(entries)
+        .where(condition, entries.c.id >= low, entries.c.id < high)
+        .values(
+            local_date=func.date(entries.c.entry_date),
+            local_hour=cast(func.strftime('%H', entries.c.entry_date), Integer)
+        )
+    ).rowcount
+
+def _fill_python(connection: Connection, condition, low: int, high: int) -> int:
+    """Локальные поля с переводом каждой даты в пояс пользователя"""
+    entries = TimeEntry.__table__
+    rows = connection.execute(
+        select(entries.c.id, entries.c.user_id, entries.c.entry_date)
+        .where(condition, entries.c.id >= low, entries.c.id < high)
+    ).all()
+    if not rows:
+        return 0
+    values = []
+    for entry_id, user_id, entry_date in rows:
+        local_date, local_hour = local_fields(entry_date, get_timezone(connection, user_id))
+        values.append({'entry_id': entry_id, 'new_date': local_date, 'new_hour': local_hour})
+    connection.execute(
+        update(entries)
+        .where(entries.c.id == bindparam('entry_id'))
+        .values(local_date=bindparam('new_date'), local_hour=bindparam('new_hour')),
+        values
+    )
+    return len(values)
+
+def _fill(connection: Connection, condition, fill, chunk_size: int,
+          progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """Заполняет локальные поля подходящих записей диапазонами id, пачка - транзакция"""
+    entries = TimeEntry.__table__
+    min_id, max_id = connection.execute(
+        select(func.min(entries.c.id), func.max(entries.c.id)).where(condition)
+    ).one()
+    connection.commit()
+    if min_id is None:
+        return 0
+    updated = 0
+    for low in range(min_id, max_id + 1, chunk_size):
+        updated += fill(connection, condition, low, low + chunk_size)
+        connection.commit()
+        if progress:
+            progress(min(low + chunk_size - 1, max_id), max_id)
+    return updated
+
+def _utc_users_condition():
+    """Условие "пояс пользователя - UTC" для записей time_entries"""
+    entries = TimeEntry.__table__
+    custom = select(UserSettings.user_id).where(UserSettings.timezone.notin_(_UTC_NAMES))
+    if is_utc(default_timezone()):
+        return entries.c.user_id.notin_(custom)
+    return entries.c.user_id.in_(select(UserSettings.user_id).where(UserSettings.timezone.in_(_UTC_NAMES)))
+
+def missing_local_dates(bind: Engine) -> bool:
+    """Есть ли записи без local_date (база до появления колонки)"""
+    entries = TimeEntry.__table__
+    with bind.connect() as connection:
+        return connection.execute(select(entries.c.id).where(entries.c.local_date.is_(None)).limit(1)).first() is not None
+
+def backfill_local_dates(
+    bind: Engine,
+    chunk_size: int = 50000,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> int:
+    """
+    Заполняет local_date и local_hour у записей, где их нет
+
+    Для пользователей в UTC поля вычисляются в SQL, для остальных - в
+    Python по правилам их пояса (с переходами на летнее время).
+
+    Returns:
+        int: количество обновленных записей
+    """
+    entries = TimeEntry.__table__
+    missing = entries.c.local_date.is_(None)
+    updated = 0
+    with bind.connect() as connection:
+        if bind.dialect.name == 'sqlite':
+            updated += _fill(connection, and_(missing, _utc_users_condition()), _fill_utc, chunk_size, progress)
+        updated += _fill(connection, missing, _fill_python, chunk_size, progress)
+    if updated:
+        print(f"✅ Заполнены локальные даты у {updated} записей")
+    return updated
+
+def set_timezone(bind: Engine, user_id: int, zone: ZoneInfo, chunk_size: int = 50000) -> int:
+    """Сохраняет пояс пользователя и пересчитывает локальные поля его записей"""
+    with Session(bind) as session, session.begin():
+        settings = session.get(UserSettings, user_id)
+        if settings is None:
+            session.add(UserSettings(user_id=user_id, timezone=zone.key))
+        else:
+            settings.timezone = zone.key
+    _zones[user_id] = zone
+
+    condition = TimeEntry.__table__.c.user_id == user_id
+    fill = _fill_utc if is_utc(zone) and bind.dialect.name == 'sqlite' else _fill_python
+    with bind.connect() as connection:
+        updated = _fill(connection, condition, fill, chunk_size)
+    logger.info("Пояс пользователя %s: %s, пересчитано записей: %d", user_id, zone.key, updated)
+    return updated
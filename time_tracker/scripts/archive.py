@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Перенос старых записей в архив Parquet (см. analytics/archive.py)
+
+Запускается по расписанию (например, раз в сутки из cron): записи старше
+ARCHIVE_AFTER_DAYS целыми месяцами переносятся из time_entries в годовые
+файлы, их дневные итоги - в entry_rollups. --dry-run только показывает,
+сколько записей будет перенесено, --verify сверяет файлы архива с итогами,
+--vacuum возвращает освободившееся место базы на диск. Годовые файлы,
+записанные до появления локальных дат, при запуске дополняются ими.
+"""
+
+import os
+import sys
+import argparse
+import logging
+import time
+
+from sqlalchemy import text
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics.archive import (
+    ARCHIVE_AFTER_DAYS, ARCHIVE_DIR, archive_entries, read_manifest, upgrade_archive, verify_archive
+)
+from database.engine import DATABASE_URL, create_db_engine, create_tables
+
+def verify(db_engine, directory: str) -> bool:
+    """Сверяет дневные итоги файлов архива с entry_rollups"""
+    problems = verify_archive(db_engine, directory)
+    for problem in problems:
+        print(f"❌ {problem}")
+    years = read_manifest(directory)['years']
+    if not problems:
+        rows = sum(state['rows'] for state in years.values())
+        print(f"✅ Архив совпадает с итогами: {rows:,} записей, лет {len(years)}")
+    return not problems
+
+def main():
+    parser = argparse.ArgumentParser(description='Перенос старых записей в архив Parquet')
+    parser.add_argument('--database', default=DATABASE_URL, help='Адрес базы данных')
+    parser.add_argument('--directory', default=ARCHIVE_DIR, help='Каталог архива')
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                        help='Переносить записи старше N дней (целыми месяцами)')
+    parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет перенесено')
+    parser.add_argument('--verify', action='store_true', help='Сверить архив с итогами в базе')
+    parser.add_argument('--vacuum', action='store_true', help='Сжать базу после переноса')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db_engine = create_db_engine(args.database)
+    # Таблица entry_rollups могла еще не появиться, если бот не перезапускался
+    create_tables(db_engine)
+
+    if not args.dry_run:
+        upgraded = upgrade_archive(db_engine, args.directory)
+        if upgraded:
+            print(f"✅ Локальные даты добавлены в годы архива: {', '.join(map(str, upgraded))}")
+
+    if args.verify:
+        sys.exit(0 if verify(db_engine, args.directory) else 1)
+
+    started = time.perf_counter()
+    try:
+        result = archive_entries(db_engine, args.directory, args.days, dry_run=args.dry_run)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - started
+
+    total = sum(result['years'].values())
+    by_year = ', '.join(f"{year}: {count:,}" for year, count in result['years'].items()) or 'нет'
+    if args.dry_run:
+        print(f"🔎 До {result['cutoff'].date()} будет перенесено {total:,} записей ({by_year})")
+        return
+    print(f"✅ До {result['cutoff'].date()} перенесено {total:,} записей за {elapsed:.2f} с ({by_year})")
+
+    if args.vacuum and total:
+        started = time.perf_counter()
+        with db_engine.connect() as connection:
+            connection.execution_options(isolation_level='AUTOCOMMIT').execute(text('VACUUM'))
+        print(f"🧹 База сжата за {time.perf_counter() - started:.2f} с")
+
+if __name__ == "__main__":
+    main()
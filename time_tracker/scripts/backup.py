@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Резервные копии базы (см. database/backup.py)
+
+Без параметров снимает одну сжатую копию, проверяет ее и удаляет поколения
+сверх --keep. --interval повторяет это каждые N часов (если копии не
+делает сам бот), --list показывает копии, --verify проверяет копию,
+--restore восстанавливает из нее базу.
+"""
+
+import os
+import sys
+import argparse
+import logging
+import time
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.backup import (
+    BACKUP_DIR, BACKUP_KEEP, database_path, latest_backup, list_backups, restore_backup, run_backup, verify_backup
+)
+from database.engine import DATABASE_URL
+
+def _resolve(directory: str, name: str) -> str:
+    """Путь к копии: latest, имя файла в каталоге копий или путь"""
+    if name == 'latest':
+        path = latest_backup(directory)
+        if path is None:
+            print(f"❌ В {directory} нет резервных копий")
+            sys.exit(1)
+        return path
+    candidate = os.path.join(directory, name)
+    return candidate if not os.path.exists(name) and os.path.exists(candidate) else name
+
+def _print_tables(tables: dict):
+    for table, rows in tables.items():
+        print(f"   {table:<24} {rows:>12,}")
+
+def backup_once(path: str, directory: str, keep: int):
+    result = run_backup(path, directory, keep)
+    print(f"✅ {result['path']}: {result['bytes'] / 2 ** 20:.1f} МБ -> {result['compressed_bytes'] / 2 ** 20:.1f} МБ, "
+          f"копирование {result['copy_s']:.2f} с ({result['steps']} шагов, перезапусков {result['restarts']}), "
+          f"сжатие {result['compress_s']:.2f} с")
+    for removed in result['removed']:
+        print(f"🗑️  Удалена старая копия {removed}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Резервные копии базы')
+    parser.add_argument('--database', default=DATABASE_URL, help='Адрес базы данных (sqlite:///...)')
+    parser.add_argument('--directory', default=BACKUP_DIR, help='Каталог копий')
+    parser.add_argument('--keep', type=int, default=BACKUP_KEEP, help='Сколько последних копий хранить')
+    parser.add_argument('--interval', type=float, default=0, help='Повторять каждые N часов (0 - один раз)')
+    parser.add_argument('--list', action='store_true', help='Показать копии')
+    parser.add_argument('--verify', metavar='КОПИЯ', help='Проверить копию (имя, путь или latest)')
+    parser.add_argument('--restore', metavar='КОПИЯ', help='Восстановить базу из копии (имя, путь или latest)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    path = database_path(args.database)
+
+    if args.list:
+        for backup in list_backups(args.directory):
+            print(f"💾 {backup}  {os.path.getsize(backup) / 2 ** 20:.1f} МБ")
+        return
+
+    if args.verify:
+        backup = _resolve(args.directory, args.verify)
+        try:
+            tables = verify_backup(backup)
+        except (ValueError, OSError) as e:
+            print(f"❌ Копия {backup} повреждена: {e}")
+            sys.exit(1)
+        print(f"✅ Копия {backup} цела")
+        _print_tables(tables)
+        return
+
+    if args.restore:
+        backup = _resolve(args.directory, args.restore)
+        try:
+            result = restore_backup(backup, path, args.directory)
+        except (ValueError, OSError) as e:
+            print(f"❌ База не тронута, копия {backup} не прошла проверку: {e}")
+            sys.exit(1)
+        print(f"✅ База {path} восстановлена из {backup}")
+        if result['safety']:
+            print(f"💾 Прежняя база сохранена в {result['safety']}")
+        _print_tables(result['tables'])
+        return
+
+    backup_once(path, args.directory, args.keep)
+    while args.interval > 0:
+        time.sleep(args.interval * 3600)
+        try:
+            backup_once(path, args.directory, args.keep)
+        except Exception as e:
+            print(f"❌ Ошибка резервного копирования: {e}")
+
+if __name__ == "__main__":
+    main()
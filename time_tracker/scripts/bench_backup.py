@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Замеры резервного копирования: скорость и влияние на запись бота
+
+На копии набора из data/fixtures/ поток-писатель добавляет записи так же,
+как бот (сессия SQLAlchemy, коммит на запись), и замеряет задержку каждого
+коммита. Сначала писатель работает один, затем во время копирования
+database/backup.py с разным размером шага. Для каждого режима сохраняются
+p50/p99/max задержки записи, скорость копирования и сжатия, число
+перезапусков копирования из-за записи и время проверки копии.
+"""
+
+import os
+import sys
+import argparse
+import logging
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_test_data import FIXTURES, FIRST_USER_ID, build_fixture, fixture_url
+from bench_utils import compare, new_report, save_report
+from database.backup import BACKUP_STEP_PAUSE, backup_database, verify_backup
+from database.engine import create_db_engine
+from database.models import ActivityCategory, TimeEntry
+
+# Режимы копирования: страниц за шаг (-1 - одним шагом)
+MODES = {'steps_256': 256, 'steps_4096': 4096, 'single_step': -1}
+
+class Writer(threading.Thread):
+    """Добавляет записи с заданным интервалом и замеряет время коммита"""
+
+    def __init__(self, db_engine, interval: float):
+        super().__init__(daemon=True)
+        self.db_engine = db_engine
+        self.interval = interval
+        self.latencies = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            started = time.perf_counter()
+            with Session(self.db_engine) as session:
+                session.add(TimeEntry(
+                    user_id=FIRST_USER_ID, activity_name='Резервное копирование',
+                    category=ActivityCategory.WORK, duration_minutes=15, entry_date=datetime.utcnow()
+                ))
+                session.commit()
+            self.latencies.append(time.perf_counter() - started)
+            self.stopped.wait(self.interval)
+
+    def stop(self) -> list:
+        self.stopped.set()
+        self.join()
+        return self.latencies
+
+def summarize_writes(latencies) -> dict:
+    values = np.array(latencies) * 1000
+    return {
+        'writes': len(values),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'max_ms': round(float(values.max()), 3),
+    }
+
+def bench_fixture(name: str, write_interval: float, baseline_s: float) -> dict:
+    """Замеряет режимы копирования на временной копии набора"""
+    path = fixture_url(name).replace('sqlite:///', '')
+    if not os.path.exists(path):
+        build_fixture(name, seed=42, end_date=datetime(2025, 1, 1), batch_size=100_000)
+
+    with tempfile.TemporaryDirectory() as directory:
+        copy = os.path.join(directory, f"{name}.db")
+        shutil.copyfile(path, copy)
+        db_engine = create_db_engine(f"sqlite:///{copy}")
+        with db_engine.connect() as connection:
+            rows = connection.execute(func.count(TimeEntry.id).select()).scalar()
+        size_mb = os.path.getsize(copy) / 2 ** 20
+        print(f"\n📦 Набор {name}: {rows:,} записей, {size_mb:.0f} МБ, запись каждые {write_interval * 1000:.0f} мс")
+
+        results = {}
+        writer = Writer(db_engine, write_interval)
+        writer.start()
+        time.sleep(baseline_s)
+        results['writes_only'] = summarize_writes(writer.stop())
+
+        for mode, pages in MODES.items():
+            writer = Writer(db_engine, write_interval)
+            writer.start()
+            backup = backup_database(copy, os.path.join(directory, 'backups'), pages=pages, pause=BACKUP_STEP_PAUSE)
+            latencies = writer.stop()
+            started = time.perf_counter()
+            verify_backup(backup['path'])
+            verify_s = time.perf_counter() - started
+            os.remove(backup['path'])
+            results[mode] = {
+                **summarize_writes(latencies),
+                'copy_s': round(backup['copy_s'], 3),
+                'copy_mb_s': round(backup['bytes'] / 2 ** 20 / backup['copy_s'], 1),
+                'compress_mb_s': round(backup['bytes'] / 2 ** 20 / backup['compress_s'], 1),
+                'ratio': round(backup['bytes'] / backup['compressed_bytes'], 2),
+                'steps': backup['steps'],
+                'restarts': backup['restarts'],
+                'verify_s': round(verify_s, 3),
+            }
+        db_engine.dispose()
+
+    for mode, result in results.items():
+        line = f"   {mode:<12} запись p50 {result['p50_ms']:>7.2f} мс  p99 {result['p99_ms']:>7.2f} мс  max {result['max_ms']:>8.2f} мс"
+        if 'copy_s' in result:
+            line += (f"  | копия {result['copy_s']:.2f} с ({result['copy_mb_s']:.0f} МБ/с, "
+                     f"шагов {result['steps']}, перезапусков {result['restarts']}), "
+                     f"сжатие {result['compress_mb_s']:.0f} МБ/с x{result['ratio']}, проверка {result['verify_s']:.2f} с")
+        print(line)
+    return {'rows': rows, 'results': results}
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры резервного копирования')
+    parser.add_argument('--sizes', nargs='+', choices=list(FIXTURES), default=['10k', '1m'],
+                        help='Наборы данных (создаются при отсутствии)')
+    parser.add_argument('--write-interval', type=float, default=0.05, help='Пауза между записями писателя, секунды')
+    parser.add_argument('--baseline', type=float, default=5, help='Секунд записи без копирования')
+    parser.add_argument('--output', help='Файл результатов (по умолчанию data/benchmarks/backup-<коммит>.json)')
+    parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--metric', default='p99_ms', choices=['p50_ms', 'p99_ms', 'max_ms'], help='Метрика для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Допустимое замедление, доля')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    report = new_report('backup', write_interval=args.write_interval, step_pause=BACKUP_STEP_PAUSE)
+    for name in args.sizes:
+        report['fixtures'][name] = bench_fixture(name, args.write_interval, args.baseline)
+    save_report(report, args.output)
+
+    if args.compare:
+        regressions = compare(args.compare, report, args.metric, args.threshold)
+        if regressions:
+            print(f"❌ Регрессий: {regressions}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Замеры задержки обработчиков бота без сети
+
+Настоящий `router` из bot/handlers.py с теми же middleware, что и в
+bot/main.py, получает синтетические обновления через `Dispatcher.feed_update`.
+Запросы к Telegram перехватывает заглушка сессии Bot. Замеряются p50/p99
+задержки и пропускная способность сценариев `/a` -> категория -> название ->
+время, `/stats` и ежедневного напоминания на копиях наборов data/fixtures/.
+"""
+
+import os
+import sys
+import argparse
+import asyncio
+import itertools
+import logging
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_test_data import FIXTURES, FIRST_USER_ID, build_fixture, fixture_url
+from bench_utils import compare, new_report, save_report
+
+# Напоминания отправляются первому пользователю набора
+os.environ['ADMIN_USER_ID'] = str(FIRST_USER_ID)
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
+from aiogram.methods import SendMessage, TelegramMethod
+from aiogram.types import Update
+from sqlalchemy import func
+
+from bot.handlers import router
+from bot.middlewares import AccessList, AccessMiddleware, DbSessionMiddleware, setup_access_middleware
+from bot.reminders import ReminderManager
+from bot.suggestions import activity_suggestions
+from database.engine import SessionLocal, create_db_engine, session_scope
+from database.models import TimeEntry
+
+class StubSession(BaseSession):
+    """Сессия Bot, которая отвечает на запросы без обращения к Telegram"""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = 0
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout=None):
+        self.requests += 1
+        if isinstance(method, SendMessage):
+            return method.__returning__.model_validate({
+                'message_id': self.requests,
+                'date': int(time.time()),
+                'chat': {'id': method.chat_id, 'type': 'private'},
+                'text': method.text,
+            })
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b''
+
+    async def close(self):
+        pass
+
+class UpdateFactory:
+    """Синтетические обновления от имени пользователя"""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': 'Bench'}
+
+    def message(self, user_id: int, text: str) -> Update:
+        message = {
+            'message_id': next(self._ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self._user(user_id),
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return Update.model_validate({'update_id': next(self._ids), 'message': message})
+
+    def callback(self, user_id: int, data: str) -> Update:
+        return Update.model_validate({
+            'update_id': next(self._ids),
+            'callback_query': {
+                'id': str(next(self._ids)),
+                'chat_instance': 'bench',
+                'data': data,
+                'from': self._user(user_id),
+                'message': {
+                    'message_id': next(self._ids),
+                    'date': int(time.time()),
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'from': {'id': 1, 'is_bot': True, 'first_name': 'Bot'},
+                    'text': 'Выберите категорию активности:',
+                },
+            },
+        })
+
+def create_dispatcher(user_ids) -> Dispatcher:
+    """Диспетчер с теми же middleware, что и в bot/main.py, без ограничения частоты"""
+    dp = Dispatcher(storage=MemoryStorage(), events_isolation=SimpleEventIsolation())
+    allowed = set(user_ids)
+    setup_access_middleware(dp, AccessMiddleware(AccessList(lambda: allowed), rate=1e9, burst=1e9))
+    dp.update.middleware(DbSessionMiddleware())
+    dp.include_router(router)
+    return dp
+
+def summarize(latencies, elapsed: float) -> dict:
+    """p50/p99 задержки в миллисекундах и пропускная способность в секунду"""
+    values = np.array(latencies) * 1000
+    return {
+        'count': len(values),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'max_ms': round(float(values.max()), 3),
+        'throughput': round(len(values) / elapsed, 1),
+    }
+
+async def run_users(user_ids, iterations: int, scenario) -> dict:
+    """Запускает сценарий параллельно для пользователей, собирает задержки по шагам"""
+    latencies = {}
+
+    async def worker(user_id):
+        for _ in range(iterations):
+            for step, seconds in await scenario(user_id):
+                latencies.setdefault(step, []).append(seconds)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(user_id) for user_id in user_ids))
+    elapsed = time.perf_counter() - started
+    return {step: summarize(values, elapsed) for step, values in latencies.items()}
+
+async def bench_database(db_url: str, iterations: int, concurrency: int) -> dict:
+    """Замеряет все сценарии на одной базе"""
+    db_engine = create_db_engine(db_url)
+    SessionLocal.configure(bind=db_engine)
+    user_ids = [FIRST_USER_ID + index for index in range(concurrency)]
+    updates = UpdateFactory()
+    bot = Bot('42:BENCH', session=StubSession())
+    dp = create_dispatcher(user_ids)
+    results = {}
+
+    async def feed(update: Update) -> float:
+        started = time.perf_counter()
+        await dp.feed_update(bot, update)
+        return time.perf_counter() - started
+
+    async def add_flow(user_id):
+        steps = [
+            ('add.command', await feed(updates.message(user_id, '/a'))),
+            ('add.category', await feed(updates.callback(user_id, 'category_work'))),
+            ('add.name', await feed(updates.message(user_id, 'Программирование'))),
+            ('add.duration', await feed(updates.message(user_id, '45'))),
+        ]
+        return steps + [('add_flow', sum(seconds for _, seconds in steps))]
+
+    async def quick_add(user_id):
+        return [
+            ('quick_add.command', await feed(updates.message(user_id, '/a Код-ревью'))),
+            ('quick_add.duration', await feed(updates.message(user_id, '30'))),
+        ]
+
+    async def stats(user_id):
+        return [('stats', await feed(updates.message(user_id, '/stats')))]
+
+    reminders = ReminderManager(bot)
+
+    async def reminder(user_id):
+        started = time.perf_counter()
+        await reminders.send_daily_reminder()
+        return [('reminder', time.perf_counter() - started)]
+
+    try:
+        started = time.perf_counter()
+        with session_scope() as session:
+            activity_suggestions.warm_up(session)
+        results['startup.warm_up'] = summarize([time.perf_counter() - started], time.perf_counter() - started)
+
+        with db_engine.connect() as connection:
+            before = connection.execute(func.count(TimeEntry.id).select()).scalar()
+
+        for scenario in (add_flow, quick_add, stats):
+            results.update(await run_users(user_ids, iterations, scenario))
+        results.update(await run_users(user_ids[:1], iterations, reminder))
+
+        with db_engine.connect() as connection:
+            added = connection.execute(func.count(TimeEntry.id).select()).scalar() - before
+        # Проверка, что сценарии действительно дошли до записи в базу
+        expected = 2 * iterations * concurrency
+        if added != expected:
+            print(f"⚠️  Ожидалось {expected} новых записей, добавлено {added}")
+        return results
+    finally:
+        await dp.storage.close()
+        db_engine.dispose()
+
+def bench_fixture(name: str, iterations: int, concurrency: int) -> dict:
+    """Замеряет сценарии на временной копии набора данных"""
+    path = fixture_url(name).replace('sqlite:///', '')
+    if not os.path.exists(path):
+        build_fixture(name, seed=42, end_date=datetime(2025, 1, 1), batch_size=100_000)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Сценарии добавляют записи, поэтому исходный набор не трогаем
+        copy = os.path.join(directory, f"{name}.db")
+        shutil.copyfile(path, copy)
+        db_engine = create_db_engine(f"sqlite:///{copy}")
+        with db_engine.connect() as connection:
+            rows = connection.execute(func.count(TimeEntry.id).select()).scalar()
+        db_engine.dispose()
+
+        print(f"\n📦 Набор {name}: {rows:,} записей, {concurrency} польз. x {iterations} итераций")
+        results = asyncio.run(bench_database(f"sqlite:///{copy}", iterations, concurrency))
+
+    for step, result in results.items():
+        print(f"   {step:<20} p50 {result['p50_ms']:>8.2f} мс  p99 {result['p99_ms']:>8.2f} мс  "
+              f"{result['throughput']:>8.1f}/с")
+    return {'rows': rows, 'results': results}
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры задержки обработчиков бота')
+    parser.add_argument('--sizes', nargs='+', choices=list(FIXTURES), default=['10k', '1m'],
+                        help='Наборы данных (создаются при отсутствии)')
+    parser.add_argument('--iterations', type=int, default=50, help='Повторов сценария на пользователя')
+    parser.add_argument('--concurrency', type=int, default=4, help='Пользователей, работающих одновременно')
+    parser.add_argument('--output', help='Файл результатов (по умолчанию data/benchmarks/bot-<коммит>.json)')
+    parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--metric', default='p50_ms', choices=['p50_ms', 'p99_ms'], help='Метрика для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Допустимое замедление, доля')
+    args = parser.parse_args()
+
+    # Лог каждого обновления из DbSessionMiddleware исказил бы замер
+    logging.basicConfig(level=logging.WARNING)
+
+    report = new_report('bot', iterations=args.iterations, concurrency=args.concurrency)
+    for name in args.sizes:
+        report['fixtures'][name] = bench_fixture(name, args.iterations, args.concurrency)
+    save_report(report, args.output)
+
+    if args.compare:
+        regressions = compare(args.compare, report, args.metric, args.threshold)
+        if regressions:
+            print(f"❌ Регрессий: {regressions}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Замеры производительности вычислений дашборда
+
+Каждая функция dashboard.py (загрузка, фильтры, show_*) запускается на
+наборах данных из data/fixtures/ разного размера с движком агрегатов pandas
+или DuckDB (--backend). Streamlit подменяется
+заглушкой: графики plotly строятся, но не отрисовываются, кэш отключен.
+Для каждой функции и размера сохраняются время и пик памяти в JSON,
+чтобы сравнивать результаты между коммитами (--compare).
+"""
+
+import os
+import sys
+import argparse
+import statistics
+import time
+import tracemalloc
+import types
+from datetime import datetime
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class _Block:
+    """Заглушка для элементов и контейнеров Streamlit"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return _noop
+
+def _noop(*args, **kwargs):
+    return _Block()
+
+def _cache(func=None, **kwargs):
+    """Кэш отключен, чтобы замерять реальную работу функции"""
+    def decorate(function):
+        function.clear = lambda: None
+        return function
+    return decorate(func) if callable(func) else decorate
+
+class _SessionState(dict):
+    __getattr__ = dict.get
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+class StreamlitStub(types.ModuleType):
+    """Модуль streamlit без отрисовки: виджеты возвращают значения по умолчанию"""
+
+    def __init__(self):
+        super().__init__('streamlit')
+        self.session_state = _SessionState()
+        self.query_params = {}
+        self.sidebar = self
+        self.cache_data = _cache
+        self.cache_data.clear = lambda: None
+        self.cache_resource = _cache
+
+    def __getattr__(self, name):
+        return _noop
+
+    def columns(self, spec, **kwargs):
+        return [_Block() for _ in range(spec if isinstance(spec, int) else len(spec))]
+
+    def tabs(self, labels):
+        return [_Block() for _ in labels]
+
+    def selectbox(self, label, options, index=0, **kwargs):
+        return list(options)[index]
+
+    radio = selectbox
+
+    def slider(self, label, min_value=None, max_value=None, value=None, **kwargs):
+        return value
+
+    def multiselect(self, label, options, default=None, **kwargs):
+        return list(default or [])
+
+    def date_input(self, label, value=None, **kwargs):
+        return value
+
+    def button(self, *args, **kwargs):
+        return False
+
+sys.modules['streamlit'] = StreamlitStub()
+
+from sqlalchemy import func
+
+import dashboard
+from analytics.aggregates import DuckDBAggregates, Filters, PandasAggregates, connect_duckdb
+from database.engine import SessionLocal, create_db_engine
+from database.models import TimeEntry
+from generate_test_data import FIXTURES, build_fixture, fixture_url
+from bench_utils import compare, new_report, save_report
+
+def _stages(aggregates, load, version):
+    """Функции дашборда в порядке выполнения при перерисовке"""
+    options = aggregates.options(activities=False)
+    date_range = (options['min_date'], options['max_date'])
+
+    def filtered(time_period):
+        # Сводка считается сразу, как в render_dashboard; задачи не выбраны - без фильтра по ним
+        result = aggregates.with_filters(
+            Filters.from_sidebar(date_range, options['categories'], None, time_period)
+        )
+        result.summary()
+        return result
+
+    view = filtered("Все время")
+    return {
+        'load_data': load,
+        'activity_options': lambda: dashboard.activity_ranking(version),
+        'apply_filters': lambda: filtered("Все время"),
+        'apply_filters_day': lambda: filtered("День (12-18)"),
+        'show_general_statistics': lambda: dashboard.show_general_statistics(view),
+        'show_category_analysis': lambda: dashboard.show_category_analysis(view),
+        'show_activity_analysis': lambda: dashboard.show_activity_analysis(view),
+        'show_time_analysis': lambda: dashboard.show_time_analysis(view),
+        'show_detailed_data': lambda: dashboard.show_detailed_data(view),
+        'show_trends_analysis': lambda: dashboard.show_trends_analysis(view),
+        'show_time_by_categories': lambda: dashboard.show_time_by_categories(view),
+    }
+
+def measure(function, repeat: int) -> dict:
+    """Время (медиана и минимум по повторам) и пик памяти одного вызова"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+
+    # Пик памяти отдельным запуском: tracemalloc замедляет выполнение
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'wall_s': round(statistics.median(timings), 6),
+        'min_s': round(min(timings), 6),
+        'peak_mb': round(peak / 1024 / 1024, 3),
+    }
+
+def bench_fixture(name: str, repeat: int, only=None, backend: str = 'pandas', source=None) -> dict:
+    """Замеряет все функции дашборда на одном наборе данных"""
+    path = fixture_url(name)
+    if not os.path.exists(path.replace('sqlite:///', '')):
+        build_fixture(name, seed=42, end_date=datetime(2025, 1, 1), batch_size=100_000)
+
+    db_engine = create_db_engine(path)
+    SessionLocal.configure(bind=db_engine)
+    try:
+        with db_engine.connect() as connection:
+            rows = connection.execute(func.count(TimeEntry.id).select()).scalar()
+        version = dashboard.data_version()
+        names = dashboard.load_activity_names(version)
+        if backend == 'duckdb':
+            # Для DuckDB "загрузка" - это подключение к источнику
+            load = lambda: connect_duckdb(source or path)
+            aggregates = DuckDBAggregates(load(), names)
+        else:
+            load = dashboard.load_data
+            aggregates = PandasAggregates(load(), names)
+
+        print(f"\n📦 Набор {name}: {rows:,} записей, движок {backend}")
+        results = {}
+        for stage, function in _stages(aggregates, load, version).items():
+            if only and stage not in only:
+                continue
+            results[stage] = measure(function, repeat)
+            print(f"   {stage:<26} {results[stage]['wall_s'] * 1000:>10.1f} мс {results[stage]['peak_mb']:>10.1f} МБ")
+        return {'rows': rows, 'results': results}
+    finally:
+        db_engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры производительности дашборда')
+    parser.add_argument('--sizes', nargs='+', choices=list(FIXTURES), default=['10k', '1m'],
+                        help='Наборы данных (создаются при отсутствии)')
+    parser.add_argument('--repeat', type=int, default=5, help='Повторов на функцию')
+    parser.add_argument('--only', nargs='+', help='Замерять только указанные функции')
+    parser.add_argument('--backend', choices=['pandas', 'duckdb'], default='pandas', help='Движок агрегатов')
+    parser.add_argument('--source', help='Источник DuckDB (по умолчанию - база набора)')
+    parser.add_argument('--output', help='Файл результатов (по умолчанию data/benchmarks/dashboard-<коммит>.json)')
+    parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Допустимое замедление, доля')
+    args = parser.parse_args()
+
+    # Отчеты движков сохраняются в разные файлы, но сравнимы по именам функций
+    benchmark = 'dashboard' if args.backend == 'pandas' else f'dashboard-{args.backend}'
+    report = new_report(benchmark, repeat=args.repeat, backend=args.backend)
+    for name in args.sizes:
+        report['fixtures'][name] = bench_fixture(name, args.repeat, args.only, args.backend, args.source)
+    save_report(report, args.output)
+
+    if args.compare:
+        # Минимум по повторам меньше всего зависит от шума
+        regressions = compare(args.compare, report, 'min_s', args.threshold)
+        if regressions:
+            print(f"❌ Регрессий: {regressions}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
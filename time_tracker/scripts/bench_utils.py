@@ -0,0 +1,70 @@
+"""
+Общие функции скриптов замеров: метаданные, сохранение и сравнение результатов
+
+Отчет замера - JSON вида {"fixtures": {<набор>: {"rows": ..., "results":
+{<замер>: {<метрика>: значение}}}}}; сравниваются одноименные замеры.
+"""
+
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime
+
+RESULTS_DIR = os.path.join('data', 'benchmarks')
+
+def git_commit() -> str:
+    """Короткий хэш текущего коммита или 'unknown'"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def new_report(benchmark: str, **params) -> dict:
+    """Заготовка отчета с метаданными прогона"""
+    return {
+        'benchmark': benchmark,
+        'commit': git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        **params,
+        'fixtures': {},
+    }
+
+def save_report(report: dict, output: str = None) -> str:
+    """Сохраняет отчет, по умолчанию в data/benchmarks/<замер>-<коммит>.json"""
+    output = output or os.path.join(RESULTS_DIR, f"{report['benchmark']}-{report['commit']}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"\n💾 Результаты сохранены: {output}")
+    return output
+
+def compare(baseline_path: str, current: dict, metric: str, threshold: float) -> int:
+    """
+    Печатает изменения метрики относительно прошлого прогона
+
+    Метрика считается "чем меньше, тем лучше" (время, задержка).
+
+    Returns:
+        int: количество замеров, ухудшившихся больше чем на threshold
+    """
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = json.load(file)
+
+    print(f"\n📊 Сравнение {metric} с {baseline.get('commit', '?')} (порог {threshold:.0%}):")
+    regressions = 0
+    for name, fixture in current['fixtures'].items():
+        old_results = baseline['fixtures'].get(name, {}).get('results', {})
+        for stage, result in fixture['results'].items():
+            old = old_results.get(stage, {}).get(metric)
+            if not old:
+                continue
+            change = result[metric] / old - 1
+            regressed = change > threshold
+            regressions += regressed
+            print(f" {'⚠️ ' if regressed else '  '}{name:<4} {stage:<26} {change:>+8.1%}")
+    return regressions
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Проверка совпадения агрегатов pandas и DuckDB
+
+Для набора данных из data/fixtures/ (или любой базы) оба движка из
+analytics/aggregates.py считают все сводки, которые строит дашборд, при
+разных фильтрах: без ограничений, по датам, категориям, задачам, времени
+дня и с пустым результатом. Таблицы сравниваются по значениям и типам
+колонок; скрипт завершается с кодом 1 при любом расхождении.
+
+Без расширения sqlite для DuckDB (нет доступа к сети) используйте
+--parquet: DuckDB будет читать временный снимок Parquet (analytics/snapshot.py).
+"""
+
+import os
+import sys
+import argparse
+import math
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics.aggregates import (
+    ENTRY_ORDERS, KEYS, STATS, DuckDBAggregates, Filters, PandasAggregates, connect_duckdb, load_entries
+)
+from analytics.snapshot import write_snapshot
+from database.activities import fetch_activity_names
+from database.engine import create_db_engine
+from generate_test_data import FIXTURES, build_fixture, fixture_url
+
+# Группировки вкладок дашборда
+DASHBOARD_GROUPS = [
+    (['category'], ['sum', 'count', 'mean', 'max', 'min', 'days']),
+    (['activity_id'], ['sum', 'count', 'mean', 'max', 'min', 'days']),
+    (['day_of_week'], ['sum']),
+    (['hour'], ['sum']),
+    (['date'], ['sum', 'count', 'mean']),
+    (['day_of_week', 'hour'], ['sum']),
+    (['category', 'hour_group'], ['sum', 'count', 'mean']),
+    (['category', 'day_of_week'], ['sum', 'count']),
+    (['category', 'hour'], ['sum', 'count']),
+    (['date', 'category'], ['sum']),
+    (['year', 'week', 'category'], ['sum']),
+    (['year', 'month', 'category'], ['sum']),
+]
+# Каждый ключ по отдельности со всеми показателями
+GROUPS = DASHBOARD_GROUPS + [([key], list(STATS)) for key in KEYS]
+
+def scenarios(options: dict) -> dict:
+    """Наборы фильтров для проверки"""
+    first, last = options['min_date'], options['max_date']
+    middle = first + (last - first) / 2
+    activity_ids = options['activity_ids']
+    return {
+        'all': Filters(),
+        'sidebar_default': Filters.from_sidebar((first, last), options['categories'], activity_ids, "Все время"),
+        'last_30_days': Filters(last - timedelta(days=30), last),
+        'work_only': Filters(categories=('work',)),
+        'few_activities': Filters(activity_ids=tuple(activity_ids[:5])),
+        'evening': Filters(time_period="Вечер (18-24)"),
+        'combined': Filters(middle, last, ('work', 'study'), tuple(activity_ids[::2]), "День (12-18)"),
+        'empty': Filters(categories=()),
+    }
+
+def _compare(name: str, expected, actual) -> bool:
+    """Сравнивает результаты движков, печатает расхождение"""
+    try:
+        if isinstance(expected, pd.DataFrame):
+            pd.testing.assert_frame_equal(expected, actual, check_exact=False, rtol=1e-9)
+        elif isinstance(expected, dict):
+            assert expected.keys() == actual.keys(), f"ключи {list(expected)} != {list(actual)}"
+            for key, value in expected.items():
+                other = actual[key]
+                if isinstance(value, float) and isinstance(other, float):
+                    assert math.isclose(value, other, rel_tol=1e-9), f"{key}: {value} != {other}"
+                else:
+                    assert value == other, f"{key}: {value!r} != {other!r}"
+        else:
+            assert expected == actual, f"{expected!r} != {actual!r}"
+    except AssertionError as e:
+        print(f"   ❌ {name}: {e}")
+        return False
+    return True
+
+def _run(engines: dict, elapsed: dict, function):
+    """Вызывает функцию для каждого движка, накапливая время"""
+    results = {}
+    for name, aggregates in engines.items():
+        started = time.perf_counter()
+        results[name] = function(aggregates)
+        elapsed[name] += time.perf_counter() - started
+    return results['pandas'], results['duckdb']
+
+def check(db_url: str, source: str) -> int:
+    """Сравнивает движки по всем сценариям, возвращает число расхождений"""
+    db_engine = create_db_engine(db_url)
+    try:
+        with Session(db_engine) as session:
+            df = load_entries(session)
+            names = fetch_activity_names(session.connection())
+    finally:
+        db_engine.dispose()
+
+    engines = {'pandas': PandasAggregates(df, names), 'duckdb': DuckDBAggregates(connect_duckdb(source), names)}
+    elapsed = {name: 0.0 for name in engines}
+
+    failures = 0
+    options = _run(engines, elapsed, lambda aggregates: aggregates.options())
+    failures += not _compare('options', *options)
+
+    for scenario, filters in scenarios(options[0]).items():
+        checks = 0
+        scenario_failures = 0
+        filtered = {name: aggregates.with_filters(filters) for name, aggregates in engines.items()}
+
+        comparisons = [('summary', lambda aggregates: aggregates.summary())]
+        comparisons += [
+            (f"group({', '.join(keys)})", lambda aggregates, keys=keys, stats=stats: aggregates.group(keys, stats))
+            for keys, stats in GROUPS
+        ]
+        comparisons += [
+            (f"entries({order_by}, {ascending})",
+             lambda aggregates, order_by=order_by, ascending=ascending: aggregates.entries(order_by, ascending, limit=100))
+            for order_by in ENTRY_ORDERS for ascending in (True, False)
+        ]
+        for name, function in comparisons:
+            checks += 1
+            scenario_failures += not _compare(f"{scenario}: {name}", *_run(filtered, elapsed, function))
+
+        rows = filtered['pandas'].summary()['count']
+        status = '✅' if not scenario_failures else '❌'
+        print(f"{status} {scenario:<16} {rows:>10,} записей, проверок {checks}, расхождений {scenario_failures}")
+        failures += scenario_failures
+
+    print(f"\n⏱️  pandas {elapsed['pandas']:.2f} с, duckdb {elapsed['duckdb']:.2f} с")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка совпадения агрегатов pandas и DuckDB')
+    parser.add_argument('--size', choices=list(FIXTURES), default='10k', help='Набор данных (создается при отсутствии)')
+    parser.add_argument('--database', help='Адрес базы вместо набора данных')
+    parser.add_argument('--source', help='Источник DuckDB (по умолчанию - та же база)')
+    parser.add_argument('--parquet', action='store_true',
+                        help='Читать в DuckDB временный снимок Parquet вместо базы SQLite')
+    args = parser.parse_args()
+
+    db_url = args.database
+    if not db_url:
+        db_url = fixture_url(args.size)
+        if not os.path.exists(db_url.replace('sqlite:///', '')):
+            build_fixture(args.size, seed=42, end_date=datetime(2025, 1, 1), batch_size=100_000)
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = args.source or db_url
+        if args.parquet:
+            source = directory
+            db_engine = create_db_engine(db_url)
+            write_snapshot(db_engine, source)
+            db_engine.dispose()
+        print(f"🔎 pandas: {db_url}\n🔎 duckdb: {source}\n")
+        failures = check(db_url, source)
+
+    if failures:
+        print(f"❌ Расхождений: {failures}")
+        sys.exit(1)
+    print("✅ Агрегаты движков совпадают")
+
+if __name__ == "__main__":
+    main()
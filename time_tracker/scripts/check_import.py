@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Проверка импорта файлов (bot/importer.py) на поврежденных файлах
+
+Скрипт импортирует во временную базу файлы, которые ломаются посередине:
+массив JSON с некорректной записью в конце, CSV, часть которого не в
+UTF-8, JSON Lines с битой строкой и оборванный массив JSON. Файлы
+открываются так же, как в обработчике бота. Импорт не должен падать:
+прочитанные до ошибки записи сохраняются, ошибка попадает в итоги, а
+число добавленных записей совпадает с числом строк в базе. При любом
+расхождении скрипт завершается с кодом 1.
+"""
+
+import os
+import sys
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+
+from sqlalchemy import func, select
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.importer import CHUNK_SIZE, import_entries
+from database.engine import SessionLocal, create_db_engine, create_tables
+from database.models import TimeEntry
+
+# Больше двух пачек: к моменту ошибки часть записей уже закоммичена
+VALID_ROWS = CHUNK_SIZE * 2 + 200
+FIRST_USER_ID = 800000001
+
+RECORD = {'activity_name': 'Код-ревью', 'category': 'work', 'duration_minutes': 30, 'entry_date': '2025-01-15 10:00'}
+CSV_HEADER = 'activity_name,category,duration_minutes,entry_date\n'
+CSV_ROW = 'Код-ревью,work,30,2025-01-15 10:00\n'
+
+def json_with_bad_tail() -> bytes:
+    records = json.dumps([RECORD] * VALID_ROWS, ensure_ascii=False)
+    return (records[:-1] + ', {"bad": }]').encode('utf-8')
+
+def csv_with_cp1251_tail() -> bytes:
+    valid = (CSV_HEADER + CSV_ROW * VALID_ROWS).encode('utf-8')
+    return valid + ('Ревью,work,30,2025-01-16 10:00\n' * 10).encode('cp1251')
+
+def json_lines_with_bad_line() -> bytes:
+    lines = [json.dumps(RECORD, ensure_ascii=False)] * VALID_ROWS
+    lines.insert(CHUNK_SIZE + 1, '{"activity_name": ')
+    return '\n'.join(lines).encode('utf-8')
+
+def truncated_json() -> bytes:
+    records = json.dumps([RECORD] * VALID_ROWS, ensure_ascii=False)
+    return records[:-1].encode('utf-8')
+
+# Имя, формат, содержимое файла, часть текста ошибки и точно ли импортируются все
+# корректные записи. Текст декодируется блоками по 8 КБ, поэтому строки CSV из
+# блока с байтами не в UTF-8 не прочитаны - проверяем только, что импорт дошел
+# до этого блока
+CASES = [
+    ('JSON с битой записью в конце', 'json', json_with_bad_tail, 'некорректный JSON после записи', True),
+    ('CSV с хвостом в cp1251', 'csv', csv_with_cp1251_tail, 'не в кодировке UTF-8', False),
+    ('JSON Lines с битой строкой', 'json', json_lines_with_bad_line, 'некорректный JSON', True),
+    ('оборванный массив JSON', 'json', truncated_json, 'неожиданный конец JSON', True),
+]
+
+def expect(name: str, actual, expected) -> int:
+    ok = actual == expected
+    print(f"   {'✅' if ok else '❌'} {name}: {actual}" + ('' if ok else f" (ожидалось {expected})"))
+    return int(not ok)
+
+async def check_case(db_engine, directory: str, user_id: int, file_format: str, build, error_text: str,
+                     exact: bool) -> int:
+    path = os.path.join(directory, f"{user_id}.{file_format}")
+    with open(path, 'wb') as file:
+        file.write(build())
+    # Как в process_import_document
+    with open(path, encoding='utf-8-sig', newline='') as file:
+        try:
+            result = await import_entries(file, file_format, user_id)
+        except Exception as e:
+            print(f"   ❌ импорт упал: {type(e).__name__}: {e}")
+            return 1
+
+    with db_engine.connect() as connection:
+        stored = connection.execute(select(func.count(TimeEntry.id)).where(TimeEntry.user_id == user_id)).scalar()
+    if exact:
+        failures = expect('добавлено', result.imported, VALID_ROWS)
+    else:
+        failures = expect(f'добавлено {result.imported}, не меньше {CHUNK_SIZE * 2}',
+                          CHUNK_SIZE * 2 <= result.imported <= VALID_ROWS, True)
+    failures += expect('в базе', stored, result.imported)
+    failures += expect('ошибок', result.failed, 1)
+    failures += expect('текст ошибки', any(error_text in error for error in result.errors), True)
+    for error in result.errors:
+        print(f"      {error}")
+    return failures
+
+async def run_checks(db_url: str, directory: str) -> int:
+    db_engine = create_db_engine(db_url)
+    create_tables(db_engine)
+    SessionLocal.configure(bind=db_engine)
+    failures = 0
+    try:
+        for index, (name, file_format, build, error_text, exact) in enumerate(CASES):
+            print(f"\n📥 {name}")
+            failures += await check_case(db_engine, directory, FIRST_USER_ID + index, file_format, build, error_text,
+                                         exact)
+    finally:
+        db_engine.dispose()
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка импорта поврежденных файлов')
+    parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        failures = asyncio.run(run_checks(f"sqlite:///{os.path.join(directory, 'import.db')}", directory))
+
+    if failures:
+        print(f"\n❌ Проверок не пройдено: {failures}")
+        sys.exit(1)
+    print("\n✅ Поврежденные файлы импортируются до места ошибки, ошибка видна в итогах")
+
+if __name__ == "__main__":
+    main()
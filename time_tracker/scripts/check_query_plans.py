@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Проверка планов горячих запросов
+
+Выполняет частые запросы бота и дашборда через тот же журнал запросов,
+что и в работе (database/query_log.py), с нулевым порогом, и печатает их
+EXPLAIN QUERY PLAN. Если какой-то запрос полностью просматривает таблицу
+time_entries, скрипт завершается с кодом 1 - его можно запускать в CI
+после изменения запросов или индексов.
+"""
+
+import os
+import sys
+import argparse
+import logging
+import tempfile
+from datetime import datetime, timedelta
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import Session
+
+from analytics.aggregates import query_entries
+from bot.suggestions import ActivitySuggestions
+from database.engine import create_db_engine, create_tables
+from database.queries import activity_totals, entries_for_day, recent_entries
+from database.search import search_activities
+from database.timezones import local_now
+from database.query_log import query_log
+
+USER_ID = 123456789
+
+def today_entries(session):
+    """Записи пользователя за сегодня: /stats и ежедневное напоминание"""
+    entries_for_day(session, USER_ID, local_now(session, USER_ID).date())
+
+def suggestions_warm_up(session):
+    """Статистика задач за 90 дней: прогрев подсказок при запуске бота"""
+    ActivitySuggestions().warm_up(session, days=90)
+
+def dashboard_slice(session):
+    """Записи за период: хвост снимка для дашборда и выгрузка месяца в снимок"""
+    end = datetime.now()
+    query_entries(session, since=end - timedelta(days=30), until=end)
+
+def find_entries(session):
+    """Поиск задач и их итоги: /find"""
+    activity_ids = search_activities(session.connection(), 'прог', user_id=USER_ID)
+    activity_totals(session, USER_ID, activity_ids)
+    recent_entries(session, USER_ID, activity_ids)
+
+HOT_QUERIES = {
+    'today_entries': today_entries,
+    'suggestions_warm_up': suggestions_warm_up,
+    'dashboard_slice': dashboard_slice,
+    'find_entries': find_entries,
+}
+
+def check(db_url: str, create: bool) -> int:
+    """Печатает планы горячих запросов, возвращает число полных просмотров"""
+    db_engine = create_db_engine(db_url)
+    if create:
+        create_tables(db_engine)
+    failures = 0
+    try:
+        for name, run in HOT_QUERIES.items():
+            query_log.reset(threshold_ms=0)
+            with Session(db_engine) as session:
+                run(session)
+
+            print(f"\n🔎 {name}: {run.__doc__}")
+            for stats in query_log.stats.values():
+                if not stats.plan:
+                    continue
+                for line in stats.plan:
+                    print(f"   {'❌' if line in stats.full_scans else '  '} {line}")
+                failures += bool(stats.full_scans)
+    finally:
+        db_engine.dispose()
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка планов горячих запросов')
+    parser.add_argument('--database', help='Проверить существующую базу (по умолчанию - новая пустая схема)')
+    args = parser.parse_args()
+
+    # Планы печатаются ниже, предупреждения журнала о медленных запросах не нужны
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.database:
+            failures = check(args.database, create=False)
+        else:
+            failures = check(f"sqlite:///{os.path.join(directory, 'plans.db')}", create=True)
+
+    if failures:
+        print(f"\n❌ Полный просмотр time_entries в горячих запросах: {failures}")
+        sys.exit(1)
+    print("\n✅ Горячие запросы используют индексы")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Проверка режима webhook (bot/webhook.py) на записанных обновлениях
+
+Скрипт поднимает WebhookServer.create_app() на localhost, направляет ответы
+бота в заглушку Bot API из load_test.py и отправляет на сервер обновления
+в том виде, в каком их присылает Telegram. Проверяются ответы сервера
+(401 без секрета или с неверным, 400 на некорректное тело, 200 до конца
+обработки, 503 при полной очереди) и записи, которые обновления оставили
+во временной базе. При любом расхождении скрипт завершается с кодом 1.
+"""
+
+import os
+import sys
+import argparse
+import asyncio
+import logging
+import tempfile
+
+from aiohttp import ClientSession, web
+from sqlalchemy import select
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_bot import create_dispatcher
+from load_test import BOT_TOKEN, BOT_USER, FakeTelegramAPI
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from bot.webhook import SECRET_HEADER, WebhookServer
+from database.engine import SessionLocal, create_db_engine, create_tables
+from database.models import ActivityCategory, TimeEntry
+
+SECRET = 'webhook-check-secret'
+USER_ID = 700000001
+CHAT = {'id': USER_ID, 'first_name': 'Check', 'username': 'webhook_check', 'type': 'private'}
+USER = {'id': USER_ID, 'is_bot': False, 'first_name': 'Check', 'username': 'webhook_check', 'language_code': 'ru'}
+
+# Обновления в том виде, в каком Telegram присылает их на webhook:
+# добавление записи по шагам и быстрое добавление (/a с названием, затем время)
+RECORDED_UPDATES = [
+    {'update_id': 815000001, 'message': {
+        'message_id': 101, 'from': USER, 'chat': CHAT, 'date': 1760875200, 'text': '/a',
+        'entities': [{'offset': 0, 'length': 2, 'type': 'bot_command'}]}},
+    {'update_id': 815000002, 'callback_query': {
+        'id': '3006412278713480001', 'from': USER, 'chat_instance': '-5731409266316340001', 'data': 'category_work',
+        'message': {'message_id': 102, 'from': BOT_USER, 'chat': CHAT, 'date': 1760875201,
+                    'text': 'Выберите категорию активности:',
+                    'reply_markup': {'inline_keyboard': [[{'text': '💼 Работа', 'callback_data': 'category_work'}]]}}}},
+    {'update_id': 815000003, 'message': {
+        'message_id': 103, 'from': USER, 'chat': CHAT, 'date': 1760875210, 'text': 'Код-ревью'}},
+    {'update_id': 815000004, 'message': {
+        'message_id': 105, 'from': USER, 'chat': CHAT, 'date': 1760875215, 'text': '45'}},
+    {'update_id': 815000005, 'message': {
+        'message_id': 107, 'from': USER, 'chat': CHAT, 'date': 1760875300, 'text': '/a Отладка кода',
+        'entities': [{'offset': 0, 'length': 2, 'type': 'bot_command'}]}},
+    {'update_id': 815000006, 'message': {
+        'message_id': 109, 'from': USER, 'chat': CHAT, 'date': 1760875305, 'text': '30'}},
+]
+
+# Записи, которые должны появиться после RECORDED_UPDATES
+EXPECTED_ENTRIES = [
+    ('Код-ревью', ActivityCategory.WORK, 45),
+    ('Отладка кода', ActivityCategory.WORK, 30),
+]
+
+class BlockingDispatcher(Dispatcher):
+    """Диспетчер, обработка в котором ждет release: для проверки ответа до ее конца"""
+
+    def __init__(self):
+        super().__init__()
+        self.started = 0
+        self.release = asyncio.Event()
+
+    async def feed_update(self, bot, update, **kwargs):
+        self.started += 1
+        await self.release.wait()
+
+class Checks:
+    """Результаты проверок: печатает каждую и считает расхождения"""
+
+    def __init__(self):
+        self.failures = 0
+
+    def expect(self, name: str, actual, expected):
+        ok = actual == expected
+        self.failures += not ok
+        print(f"   {'✅' if ok else '❌'} {name}: {actual}" + ('' if ok else f" (ожидалось {expected})"))
+
+async def start_server(app: web.Application):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+async def post(client: ClientSession, url: str, body, secret=SECRET) -> int:
+    headers = {'Content-Type': 'application/json'}
+    if secret is not None:
+        headers[SECRET_HEADER] = secret
+    data = body if isinstance(body, (bytes, str)) else None
+    async with client.post(url, data=data, json=None if data is not None else body, headers=headers) as response:
+        return response.status
+
+async def check_requests(checks: Checks, bot: Bot, client: ClientSession):
+    """Секрет, тело запроса, ответ до конца обработки и переполнение очереди"""
+    dp = BlockingDispatcher()
+    server = WebhookServer(dp, bot, SECRET, max_concurrency=1, max_pending=2)
+    runner, base = await start_server(server.create_app())
+    url = base + server.path
+    update = RECORDED_UPDATES[0]
+    try:
+        print("\n🔐 Секретный токен и тело запроса")
+        checks.expect('без секрета', await post(client, url, update, secret=None), 401)
+        checks.expect('неверный секрет', await post(client, url, update, secret='wrong'), 401)
+        checks.expect('секрет не из ASCII', await post(client, url, update, secret='sécret'), 401)
+        checks.expect('тело не JSON', await post(client, url, b'{"update_id": '), 400)
+        checks.expect('JSON не обновление', await post(client, url, {'update_id': 'x', 'message': 1}), 400)
+        checks.expect('обработок после отказов', dp.started, 0)
+
+        print("\n⏱️  Ответ до конца обработки и очередь")
+        checks.expect('первое обновление', await post(client, url, update), 200)
+        await asyncio.sleep(0.05)
+        checks.expect('обработка идет', (dp.started, server.pending), (1, 1))
+        checks.expect('второе обновление', await post(client, url, RECORDED_UPDATES[1]), 200)
+        checks.expect(f'очередь из {server.max_pending}', await post(client, url, RECORDED_UPDATES[2]), 503)
+        dp.release.set()
+        await server.wait_pending()
+        checks.expect('очередь после обработки', (dp.started, server.pending), (2, 0))
+        checks.expect('после освобождения очереди', await post(client, url, RECORDED_UPDATES[2]), 200)
+        await server.wait_pending()
+    finally:
+        dp.release.set()
+        await runner.cleanup()
+
+async def check_entries(checks: Checks, bot: Bot, client: ClientSession, api: FakeTelegramAPI, db_url: str):
+    """Записанные обновления через настоящий роутер бота и записи в базе"""
+    server = WebhookServer(create_dispatcher([USER_ID]), bot, SECRET)
+    runner, base = await start_server(server.create_app())
+    url = base + server.path
+    try:
+        print("\n📝 Записанные обновления")
+        for update in RECORDED_UPDATES:
+            checks.expect(f"update {update['update_id']}", await post(client, url, update), 200)
+            # Telegram присылает обновления одного чата по очереди
+            await server.wait_pending()
+        checks.expect('ответов бота (sendMessage)', api.api_calls.get('sendMessage', 0) > 0, True)
+    finally:
+        await runner.cleanup()
+
+    db_engine = create_db_engine(db_url)
+    try:
+        with db_engine.connect() as connection:
+            rows = connection.execute(
+                select(TimeEntry.activity_name, TimeEntry.category, TimeEntry.duration_minutes)
+                .where(TimeEntry.user_id == USER_ID).order_by(TimeEntry.id)
+            ).all()
+    finally:
+        db_engine.dispose()
+    checks.expect('записи в базе', [tuple(row) for row in rows], EXPECTED_ENTRIES)
+
+async def run_checks(db_url: str) -> int:
+    db_engine = create_db_engine(db_url)
+    create_tables(db_engine)
+    SessionLocal.configure(bind=db_engine)
+
+    api = FakeTelegramAPI()
+    api_runner, api_base = await start_server(api.create_app())
+    bot = Bot(BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api_base)))
+    checks = Checks()
+    try:
+        async with ClientSession() as client:
+            await check_requests(checks, bot, client)
+            await check_entries(checks, bot, client, api, db_url)
+    finally:
+        await bot.session.close()
+        await api_runner.cleanup()
+        db_engine.dispose()
+    return checks.failures
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка режима webhook на записанных обновлениях')
+    parser.parse_args()
+
+    # Отказы сервера (401/400/503) ожидаемы, их предупреждения не нужны
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        failures = asyncio.run(run_checks(f"sqlite:///{os.path.join(directory, 'webhook.db')}"))
+
+    if failures:
+        print(f"\n❌ Проверок не пройдено: {failures}")
+        sys.exit(1)
+    print("\n✅ Webhook отвечает и обрабатывает обновления как ожидается")
+
+if __name__ == "__main__":
+    main()
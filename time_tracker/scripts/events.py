@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Журнал изменений записей (см. database/events.py)
+
+Без параметров показывает голову журнала, отметку уплотнения и отставание
+потребителей. --compact уплотняет журнал, --drop удаляет смещение
+потребителя, который больше не запускается и задерживает уплотнение.
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.engine import DATABASE_URL, create_db_engine, create_tables
+from database.events import (
+    EVENT_RETENTION_HOURS, compact_events, compacted_seq, consumer_offsets, drop_consumer, head_seq
+)
+from database.models import EntryEvent
+
+def status(db_engine):
+    with Session(db_engine) as session:
+        head = head_seq(session)
+        mark = compacted_seq(session)
+        count = session.execute(select(func.count(EntryEvent.seq))).scalar()
+        by_op = dict(session.execute(select(EntryEvent.op, func.count(EntryEvent.seq)).group_by(EntryEvent.op)).all())
+        offsets = consumer_offsets(session)
+
+    print(f"📜 Журнал: голова {head}, уплотнен до {mark}, событий {count:,}")
+    for op, rows in sorted(by_op.items()):
+        print(f"   {op:<10} {rows:>10,}")
+    if not offsets:
+        print("   Потребителей нет")
+    for consumer, state in sorted(offsets.items()):
+        lag = head - state['seq']
+        marker = '⚠️ ' if state['seq'] < mark else '  '
+        print(f" {marker}{consumer:<20} смещение {state['seq']:>10}  отставание {lag:>8,}  обновлено {state['updated_at']}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Журнал изменений записей')
+    parser.add_argument('--database', default=DATABASE_URL, help='Адрес базы данных')
+    parser.add_argument('--compact', action='store_true', help='Уплотнить журнал')
+    parser.add_argument('--retention', type=float, default=EVENT_RETENTION_HOURS,
+                        help='Сколько часов событий хранить при уплотнении')
+    parser.add_argument('--drop', metavar='ПОТРЕБИТЕЛЬ', help='Удалить смещение потребителя')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db_engine = create_db_engine(args.database)
+    create_tables(db_engine)
+
+    if args.drop:
+        with Session(db_engine) as session, session.begin():
+            if not drop_consumer(session, args.drop):
+                print(f"❌ Потребитель {args.drop} не найден")
+                sys.exit(1)
+        print(f"✅ Потребитель {args.drop} удален")
+
+    if args.compact:
+        result = compact_events(db_engine, args.retention)
+        print(f"✅ Удалено событий: {result['removed']:,}, журнал уплотнен до {result['compacted_seq']}")
+
+    status(db_engine)
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,33 @@
 #!/usr/bin/env python3
 """
 Скрипт для генерации синтетических данных для тестирования дашборда
-Создает разнообразные записи о времени с разными паттернами активности
+и нагрузочных замеров
+
+Паттерны (будни/выходные, часы суток, веса категорий и задач) считаются
+векторно в NumPy, записи вставляются пачками через Core executemany,
+каждая пачка в одной транзакции. При одинаковом --seed результат одинаковый.
 """
 
 import os
 import sys
-import random
+import argparse
+import time
 from datetime import datetime, timedelta
-from faker import Faker
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, insert
 
 # Добавляем корневую директорию в путь
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from database.engine import get_session, create_tables
-from database.models import TimeEntry, ActivityCategory
-
-# Инициализируем Faker для генерации данных
-fake = Faker('ru_RU')
+from database.engine import create_db_engine, create_tables, DATABASE_URL
+from database.events import compact_events
+from database.activities import ActivityResolver
+from database.models import Activity, TimeEntry, ActivityCategory
+from database.timezones import get_timezone, is_utc
 
-# Список типичных задач/активностей с категориями
+# Список типичных задач/активностей с категориями (по убыванию популярности)
 ACTIVITIES_WITH_CATEGORIES = {
     "work": [
         "Программирование",
@@ -53,194 +61,307 @@ ACTIVITIES_WITH_CATEGORIES = {
     ]
 }
 
-def generate_synthetic_data(days_back=30, user_id=123456789):
+CATEGORIES = [ActivityCategory(name) for name in ACTIVITIES_WITH_CATEGORIES]
+
+# Вероятности категорий: work, study, rest
+WEEKDAY_CATEGORY_WEIGHTS = [0.55, 0.30, 0.15]
+WEEKEND_CATEGORY_WEIGHTS = [0.15, 0.25, 0.60]
+# Относительное число записей в выходной день
+WEEKEND_DAY_WEIGHT = 0.6
+
+# Распределение по часам суток (0-23) для каждой категории
+HOUR_WEIGHTS = {
+    ActivityCategory.WORK: [0, 0, 0, 0, 0, 0, 0, 1, 3, 8, 10, 10, 6, 8, 10, 10, 8, 5, 3, 2, 1, 1, 0, 0],
+    ActivityCategory.STUDY: [0, 0, 0, 0, 0, 0, 2, 6, 8, 5, 3, 2, 2, 2, 2, 2, 3, 4, 6, 7, 6, 4, 2, 0],
+    ActivityCategory.REST: [0, 0, 0, 0, 0, 0, 1, 3, 2, 1, 1, 1, 4, 2, 1, 1, 2, 4, 7, 9, 9, 7, 4, 1],
+}
+
+# Продолжительность сессий (минуты) и их веса
+DURATIONS = [15, 30, 45, 60, 90, 120, 150, 180]
+DURATION_WEIGHTS = [0.2, 0.25, 0.2, 0.15, 0.1, 0.05, 0.03, 0.02]
+
+# Показатель закона Ципфа для популярности задач внутри категории
+ZIPF_EXPONENT = 1.1
+
+FIRST_USER_ID = 123456789
+
+# Именованные наборы для замеров: пользователи, дни, записи
+FIXTURES = {
+    '10k': (3, 180, 10_000),
+    '1m': (50, 730, 1_000_000),
+    '10m': (500, 1095, 10_000_000),
+}
+FIXTURES_DIR = os.path.join('data', 'fixtures')
+
+def _cdf(weights) -> np.ndarray:
+    """Нормированная накопленная сумма весов для выборки через searchsorted"""
+    cdf = np.cumsum(np.asarray(weights, dtype=np.float64))
+    return cdf / cdf[-1]
+
+def _sample(rng: np.random.Generator, cdf: np.ndarray, size: int) -> np.ndarray:
+    """Выбирает индексы по накопленному распределению"""
+    return np.searchsorted(cdf, rng.random(size), side='right')
+
+class EntryGenerator:
+    """Векторный генератор записей с фиксированным seed"""
+    
+    def __init__(self, users: int, days: int, end_date: datetime, seed: int = 42):
+        self.rng = np.random.default_rng(seed)
+        self.user_ids = FIRST_USER_ID + np.arange(users, dtype=np.int64)
+        self.start_day = np.datetime64((end_date - timedelta(days=days - 1)).date(), 'D')
+        
+        # Одни пользователи записывают больше других
+        self.user_cdf = _cdf(self.rng.lognormal(0.0, 0.5, users))
+        
+        weekdays = (self.start_day + np.arange(days)).astype('datetime64[D]').view('int64')
+        # 1970-01-01 - четверг, отсюда сдвиг на 3: понедельник = 0, воскресенье = 6
+        self.weekend = np.isin((weekdays + 3) % 7, (5, 6))
+        self.day_cdf = _cdf(np.where(self.weekend, WEEKEND_DAY_WEIGHT, 1.0))
+        
+        self.weekday_category_cdf = _cdf(WEEKDAY_CATEGORY_WEIGHTS)
+        self.weekend_category_cdf = _cdf(WEEKEND_CATEGORY_WEIGHTS)
+        self.hour_cdfs = [_cdf(HOUR_WEIGHTS[category]) for category in CATEGORIES]
+        
+        # Задачи всех категорий в одном списке, смещения начала каждой категории
+        self.activities = []
+        self.activity_offsets = []
+        self.activity_cdfs = []
+        for category in CATEGORIES:
+            names = ACTIVITIES_WITH_CATEGORIES[category.value]
+            self.activity_offsets.append(len(self.activities))
+            self.activities.extend((category, name) for name in names)
+            self.activity_cdfs.append(_cdf(1.0 / np.arange(1, len(names) + 1) ** ZIPF_EXPONENT))
+        
+        self.duration_cdf = _cdf(DURATION_WEIGHTS)
+        self.durations = np.array(DURATIONS)
+    
+    def batch(self, size: int) -> dict:
+        """Генерирует пачку записей в виде колонок NumPy"""
+        rng = self.rng
+        users = _sample(rng, self.user_cdf, size)
+        days = _sample(rng, self.day_cdf, size)
+        
+        weekend = self.weekend[days]
+        categories = np.where(
+            weekend,
+            _sample(rng, self.weekend_category_cdf, size),
+            _sample(rng, self.weekday_category_cdf, size)
+        )
+        
+        hours = np.empty(size, dtype=np.int64)
+        activities = np.empty(size, dtype=np.int64)
+        for index in range(len(CATEGORIES)):
+            mask = categories == index
+            count = int(mask.sum())
+            hours[mask] = _sample(rng, self.hour_cdfs[index], count)
+            activities[mask] = self.activity_offsets[index] + _sample(rng, self.activity_cdfs[index], count)
+        
+        # Случайный момент внутри выбранного часа с точностью до микросекунды
+        offsets = hours * 3_600_000_000 + rng.integers(0, 3_600_000_000, size)
+        entry_dates = (self.start_day + days).astype('datetime64[us]') + offsets.astype('timedelta64[us]')
+        
+        return {
+            'users': users,
+            'activities': activities,
+            'durations': self.durations[_sample(rng, self.duration_cdf, size)],
+            'entry_dates': entry_dates,
+        }
+
+def _activity_ids(connection, generator: EntryGenerator) -> np.ndarray:
+    """Создает задачи в справочнике, возвращает таблицу id [пользователь, задача]"""
+    resolver = ActivityResolver()
+    rows = [
+        {'user_id': int(user_id), 'category': category, 'activity_name': name}
+        for user_id in generator.user_ids
+        for category, name in generator.activities
+    ]
+    resolver.assign(connection, rows)
+    return np.array([row['activity_id'] for row in rows]).reshape(len(generator.user_ids), -1)
+
+def _local_columns(entry_dates: np.ndarray, users: np.ndarray, zones: list) -> tuple:
+    """local_date и local_hour пачки в поясах пользователей (вместо построчных значений по умолчанию)"""
+    local = entry_dates.copy()
+    for index, zone in enumerate(zones):
+        mask = users == index
+        if is_utc(zone) or not mask.any():
+            continue
+        converted = pd.DatetimeIndex(entry_dates[mask]).tz_localize('UTC').tz_convert(zone).tz_localize(None)
+        local[mask] = converted.to_numpy().astype('datetime64[us]')
+    days = local.astype('datetime64[D]')
+    hours = (local - days).astype('timedelta64[h]').astype(np.int64)
+    return days.tolist(), hours.tolist()
+
+def generate_synthetic_data(db_engine, users=1, days=30, entries=None, seed=42,
+                            end_date=None, batch_size=100_000):
     """
     Генерирует синтетические данные о времени
     
     Args:
-        days_back (int): Количество дней назад для генерации данных
-        user_id (int): ID пользователя Telegram
+        db_engine: движок базы данных
+        users (int): количество пользователей
+        days (int): количество дней до end_date
+        entries (int): общее количество записей (по умолчанию 3 на пользователя в день)
+        seed (int): seed генератора случайных чисел
+        end_date (datetime): последний день периода
+        batch_size (int): записей в одной транзакции
     """
+    end_date = end_date or datetime.now()
+    if entries is None:
+        entries = users * days * 3
+    generator = EntryGenerator(users, days, end_date, seed)
     
-    print(f"🎯 Генерация синтетических данных за последние {days_back} дней...")
+    print(f"🎯 Генерация {entries:,} записей: {users} польз., {days} дн., seed={seed}")
     
-    # Создаем таблицы, если их нет
-    create_tables()
+    with db_engine.begin() as connection:
+        activity_ids = _activity_ids(connection, generator)
+        zones = [get_timezone(connection, int(user_id)) for user_id in generator.user_ids]
     
-    session = get_session()
+    categories = np.array([category.name for category, _ in generator.activities], dtype=object)
+    names = np.array([name for _, name in generator.activities], dtype=object)
     
-    try:
-        # Проверяем, есть ли уже данные
-        existing_count = session.query(TimeEntry).count()
-        if existing_count > 0:
-            print(f"⚠️  В базе уже есть {existing_count} записей")
-            response = input("Хотите добавить новые записи? (y/n): ")
-            if response.lower() != 'y':
-                print("❌ Генерация отменена")
-                return
-        
-        # Генерируем данные
-        entries_created = 0
-        start_date = datetime.now() - timedelta(days=days_back)
-        
-        current_date = start_date
-        while current_date <= datetime.now():
-            
-            # Определяем количество записей на день (1-5)
-            daily_entries = random.randint(1, 5)
-            
-            for _ in range(daily_entries):
-                # Генерируем время записи в течение дня
-                hour = random.randint(6, 23)  # 6:00 - 23:00
-                minute = random.randint(0, 59)
-                
-                entry_time = current_date.replace(
-                    hour=hour, 
-                    minute=minute, 
-                    second=random.randint(0, 59)
-                )
-                
-                # Выбираем категорию с весами
-                category = random.choices(
-                    ['work', 'study', 'rest'],
-                    weights=[0.5, 0.3, 0.2]  # Больше работы, меньше отдыха
-                )[0]
-                
-                # Выбираем активность из выбранной категории
-                activity = random.choice(ACTIVITIES_WITH_CATEGORIES[category])
-                
-                # Генерируем продолжительность (15-180 минут)
-                duration = random.choices(
-                    [15, 30, 45, 60, 90, 120, 150, 180],
-                    weights=[0.2, 0.25, 0.2, 0.15, 0.1, 0.05, 0.03, 0.02]
-                )[0]
-                
-                # Определяем категорию для активности
-                category_enum = ActivityCategory(category)
-                
-                # Создаем запись
-                time_entry = TimeEntry(
-                    user_id=user_id,
-                    activity_name=activity,
-                    category=category_enum,
-                    duration_minutes=duration,
-                    entry_date=entry_time
-                )
-                
-                session.add(time_entry)
-                entries_created += 1
-            
-            current_date += timedelta(days=1)
-        
-        # Сохраняем все записи
-        session.commit()
-        
-        print(f"✅ Создано {entries_created} записей")
-        print(f"📅 Период: {start_date.strftime('%d.%m.%Y')} - {datetime.now().strftime('%d.%m.%Y')}")
-        
-        # Показываем статистику
-        show_statistics(session)
-        
-    except Exception as e:
-        session.rollback()
-        print(f"❌ Ошибка при создании данных: {e}")
-    finally:
-        session.close()
+    started = time.perf_counter()
+    created = 0
+    while created < entries:
+        size = min(batch_size, entries - created)
+        batch = generator.batch(size)
+        users_index, activities = batch['users'], batch['activities']
+        local_dates, local_hours = _local_columns(batch['entry_dates'], users_index, zones)
+        
+        columns = {
+            'user_id': generator.user_ids[users_index].tolist(),
+            'activity_name': names[activities].tolist(),
+            'activity_id': activity_ids[users_index, activities].tolist(),
+            'category': categories[activities].tolist(),
+            'duration_minutes': batch['durations'].tolist(),
+            'entry_date': batch['entry_dates'].tolist(),
+            'local_date': local_dates,
+            'local_hour': local_hours,
+        }
+        rows = [dict(zip(columns, values)) for values in zip(*columns.values())]
+        
+        with db_engine.begin() as connection:
+            connection.execute(insert(TimeEntry), rows)
+        
+        created += size
+        elapsed = time.perf_counter() - started
+        print(f"   ⏳ {created:,}/{entries:,} ({created / elapsed:,.0f} записей/с)")
+    
+    print(f"✅ Создано {created:,} записей за {time.perf_counter() - started:.1f}с")
+    return created
 
-def show_statistics(session):
+def show_statistics(db_engine):
     """Показывает статистику созданных данных"""
     
     print("\n📊 Статистика созданных данных:")
     
-    # Общая статистика
-    total_entries = session.query(TimeEntry).count()
-    total_time = session.query(TimeEntry).with_entities(
-        func.sum(TimeEntry.duration_minutes)
-    ).scalar() or 0
-    
-    print(f"   📝 Всего записей: {total_entries}")
-    print(f"   ⏰ Общее время: {total_time//60}ч {total_time%60}мин")
-    
-    # Статистика по задачам
-    activities = session.query(
-        TimeEntry.activity_name,
-        func.count(TimeEntry.id).label('count'),
-        func.sum(TimeEntry.duration_minutes).label('total_time')
-    ).group_by(TimeEntry.activity_name).order_by(
-        func.sum(TimeEntry.duration_minutes).desc()
-    ).limit(5).all()
-    
-    print(f"   🏆 Топ-5 задач:")
-    for activity, count, time in activities:
-        hours = time // 60
-        minutes = time % 60
-        time_str = f"{hours}ч {minutes}мин" if hours > 0 else f"{minutes}мин"
-        print(f"      • {activity}: {time_str} ({count} записей)")
-    
-    # Статистика по дням
-    days_with_data = session.query(
-        func.date(TimeEntry.entry_date)
-    ).distinct().count()
-    
-    print(f"   📅 Дней с данными: {days_with_data}")
-
-def clear_all_data():
+    with db_engine.connect() as connection:
+        # Общая статистика
+        total_entries, total_time, users = connection.execute(
+            func.count(TimeEntry.id).select().add_columns(
+                func.sum(TimeEntry.duration_minutes),
+                func.count(TimeEntry.user_id.distinct())
+            )
+        ).one()
+        total_time = total_time or 0
+        
+        print(f"   📝 Всего записей: {total_entries:,}")
+        print(f"   👤 Пользователей: {users}")
+        print(f"   ⏰ Общее время: {total_time//60}ч {total_time%60}мин")
+        
+        # Статистика по задачам
+        activities = connection.execute(
+            func.count(TimeEntry.id).select()
+            .add_columns(Activity.name, func.sum(TimeEntry.duration_minutes).label('total_time'))
+            .join(Activity, Activity.id == TimeEntry.activity_id)
+            .group_by(Activity.name)
+            .order_by(func.sum(TimeEntry.duration_minutes).desc())
+            .limit(5)
+        ).all()
+        
+        print(f"   🏆 Топ-5 задач:")
+        for count, activity, time_spent in activities:
+            hours = time_spent // 60
+            minutes = time_spent % 60
+            time_str = f"{hours}ч {minutes}мин" if hours > 0 else f"{minutes}мин"
+            print(f"      • {activity}: {time_str} ({count:,} записей)")
+        
+        # Период данных
+        first, last = connection.execute(
+            func.min(TimeEntry.entry_date).select().add_columns(func.max(TimeEntry.entry_date))
+        ).one()
+        if first:
+            print(f"   📅 Период: {first:%d.%m.%Y} - {last:%d.%m.%Y}")
+
+def clear_all_data(db_engine):
     """Очищает все данные из базы"""
     
     print("🗑️  Очистка всех данных...")
     
-    session = get_session()
+    with db_engine.begin() as connection:
+        count = connection.execute(TimeEntry.__table__.delete()).rowcount
+        connection.execute(Activity.__table__.delete())
+    print(f"✅ Удалено {count:,} записей")
+
+def fixture_url(name: str) -> str:
+    """Адрес базы именованного набора данных"""
+    return f"sqlite:///{os.path.join(FIXTURES_DIR, name)}.db"
+
+def build_fixture(name: str, seed: int, end_date: datetime, batch_size: int):
+    """Пересоздает именованный набор data/fixtures/<name>.db"""
+    users, days, entries = FIXTURES[name]
+    path = os.path.join(FIXTURES_DIR, f"{name}.db")
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    
+    print(f"\n📦 Набор {name}: {path}")
+    db_engine = create_db_engine(fixture_url(name))
     try:
-        count = session.query(TimeEntry).count()
-        session.query(TimeEntry).delete()
-        session.commit()
-        print(f"✅ Удалено {count} записей")
-    except Exception as e:
-        session.rollback()
-        print(f"❌ Ошибка при удалении данных: {e}")
+        create_tables(db_engine)
+        generate_synthetic_data(db_engine, users, days, entries, seed, end_date, batch_size)
+        # Набор - установившееся состояние базы: журнал массовой загрузки не нужен
+        compact_events(db_engine, retention_hours=0)
+        show_statistics(db_engine)
     finally:
-        session.close()
+        db_engine.dispose()
 
 def main():
-    """Основная функция"""
-    
-    print("🎲 Генератор синтетических данных для Time Tracker")
-    print("=" * 50)
-    
-    # Параметры генерации
-    days_back = input("Введите количество дней для генерации (по умолчанию 30): ").strip()
-    days_back = int(days_back) if days_back.isdigit() else 30
-    
-    user_id = input("Введите Telegram ID пользователя (по умолчанию 123456789): ").strip()
-    user_id = int(user_id) if user_id.isdigit() else 123456789
-    
-    print(f"\n📋 Параметры генерации:")
-    print(f"   📅 Дней назад: {days_back}")
-    print(f"   👤 User ID: {user_id}")
-    
-    # Меню действий
-    print(f"\n🔧 Выберите действие:")
-    print("1. Создать новые данные")
-    print("2. Очистить все данные")
-    print("3. Показать статистику")
-    print("4. Выход")
-    
-    choice = input("\nВаш выбор (1-4): ").strip()
-    
-    if choice == "1":
-        generate_synthetic_data(days_back, user_id)
-    elif choice == "2":
-        clear_all_data()
-    elif choice == "3":
-        session = get_session()
-        show_statistics(session)
-        session.close()
-    elif choice == "4":
-        print("👋 До свидания!")
-    else:
-        print("❌ Неверный выбор")
+    parser = argparse.ArgumentParser(description='Генератор синтетических данных для Time Tracker')
+    parser.add_argument('--users', type=int, default=1, help='Количество пользователей')
+    parser.add_argument('--days', type=int, default=30, help='Количество дней до --end-date')
+    parser.add_argument('--entries', type=int, help='Общее количество записей (по умолчанию 3 в день на пользователя)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed генератора случайных чисел')
+    parser.add_argument('--end-date', type=lambda value: datetime.strptime(value, '%Y-%m-%d'),
+                        help='Последний день периода, ГГГГ-ММ-ДД (по умолчанию сегодня)')
+    parser.add_argument('--database', default=DATABASE_URL, help='Адрес базы данных')
+    parser.add_argument('--batch-size', type=int, default=100_000, help='Записей в одной транзакции')
+    parser.add_argument('--clear', action='store_true', help='Удалить существующие записи перед генерацией')
+    parser.add_argument('--stats', action='store_true', help='Только показать статистику')
+    parser.add_argument('--fixture', choices=[*FIXTURES, 'all'],
+                        help='Пересоздать именованный набор в data/fixtures/ (seed и --end-date учитываются)')
+    args = parser.parse_args()
+    
+    if args.fixture:
+        # Для воспроизводимости наборы по умолчанию заканчиваются фиксированной датой
+        end_date = args.end_date or datetime(2025, 1, 1)
+        names = list(FIXTURES) if args.fixture == 'all' else [args.fixture]
+        for name in names:
+            build_fixture(name, args.seed, end_date, args.batch_size)
+        return
+    
+    db_engine = create_db_engine(args.database)
+    create_tables(db_engine)
+    
+    if args.stats:
+        show_statistics(db_engine)
+        return
+    if args.clear:
+        clear_all_data(db_engine)
+    
+    generate_synthetic_data(db_engine, args.users, args.days, args.entries, args.seed,
+                            args.end_date, args.batch_size)
+    show_statistics(db_engine)
 
 if __name__ == "__main__":
-    # Импортируем func для SQL запросов
-    from sqlalchemy import func
-    main() 
\ No newline at end of file
+    main()
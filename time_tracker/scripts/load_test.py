@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест бота против локальной заглушки Telegram Bot API
+
+Скрипт поднимает aiohttp-сервер с методами getUpdates/sendMessage/
+editMessageText/answerCallbackQuery, направляет на него настоящий Bot
+в режиме polling и имитирует N пользователей, которые добавляют записи
+(`/a` -> категория -> название -> время) и запрашивают `/stats`.
+Параллельно в отдельном потоке выполняется запрос дашборда к тому же
+файлу SQLite. В конце выводятся обновления в секунду, перцентили задержки
+(от отправки обновления до первого ответа бота), ошибки блокировок и
+задержка цикла событий.
+"""
+
+import os
+import sys
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from aiohttp import web
+from sqlalchemy import event, select
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_bot import create_dispatcher
+from generate_test_data import FIXTURES, FIRST_USER_ID, build_fixture, fixture_url
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from database.engine import SessionLocal, create_db_engine
+from database.models import TimeEntry
+
+BOT_TOKEN = '42:LOADTEST'
+BOT_USER = {'id': 42, 'is_bot': True, 'first_name': 'LoadTest', 'username': 'load_test_bot'}
+
+class FakeTelegramAPI:
+    """
+    Локальная заглушка Bot API
+
+    Обновления пользователей складываются в очередь и отдаются боту через
+    getUpdates с long polling. Первый ответ бота в чат (sendMessage или
+    editMessageText) завершает ожидание `send_and_wait` для этого чата.
+    """
+
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._updates: List[dict] = []
+        self._new_updates = asyncio.Event()
+        self._waiters: Dict[int, asyncio.Future] = {}
+        self.api_calls: Dict[str, int] = {}
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.api_calls[method] = self.api_calls.get(method, 0) + 1
+        params = dict(await request.post())
+
+        if method == 'getUpdates':
+            result = await self._get_updates(int(params.get('offset', 0)), float(params.get('timeout', 0)))
+        elif method == 'getMe':
+            result = BOT_USER
+        elif method == 'sendMessage':
+            chat_id = int(params['chat_id'])
+            result = {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': params.get('text', ''),
+            }
+            self._reply(chat_id)
+        else:
+            if 'chat_id' in params:
+                self._reply(int(params['chat_id']))
+            result = True
+
+        return web.json_response({'ok': True, 'result': result})
+
+    async def _get_updates(self, offset: int, timeout: float) -> list:
+        self._updates = [update for update in self._updates if update['update_id'] >= offset]
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:100]
+
+    def _reply(self, chat_id: int):
+        waiter = self._waiters.pop(chat_id, None)
+        if waiter and not waiter.done():
+            waiter.set_result(time.perf_counter())
+
+    async def send_and_wait(self, update: dict, chat_id: int, timeout: float) -> float:
+        """Отправляет обновление боту и возвращает время до первого ответа в чат"""
+        waiter = self._waiters[chat_id] = asyncio.get_running_loop().create_future()
+        update['update_id'] = next(self._update_ids)
+        started = time.perf_counter()
+        self._updates.append(update)
+        self._new_updates.set()
+        return await asyncio.wait_for(waiter, timeout) - started
+
+    def message(self, user_id: int, text: str) -> dict:
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'message': message}
+
+    def callback(self, user_id: int, data: str) -> dict:
+        return {'callback_query': {
+            'id': str(next(self._message_ids)),
+            'chat_instance': 'load-test',
+            'data': data,
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+            'message': {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': 'Выберите категорию активности:',
+            },
+        }}
+
+class LoadStats:
+    """Счетчики нагрузочного теста"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.timeouts = 0
+        self.lock_errors = 0
+        self.db_errors = 0
+        self.loop_lag: List[float] = []
+        self.dashboard_reads: List[float] = []
+        self.dashboard_errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, step: str, seconds: float):
+        self.latencies.setdefault(step, []).append(seconds)
+
+    def on_db_error(self, context):
+        """Слушатель handle_error движка: считает ошибки блокировки SQLite"""
+        with self._lock:
+            self.db_errors += 1
+            if 'locked' in str(context.original_exception).lower():
+                self.lock_errors += 1
+
+def percentiles(values: List[float]) -> dict:
+    values = np.array(values) * 1000
+    if not len(values):
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'p50_ms': round(float(np.percentile(values, 50)), 2),
+        'p95_ms': round(float(np.percentile(values, 95)), 2),
+        'p99_ms': round(float(np.percentile(values, 99)), 2),
+        'max_ms': round(float(values.max()), 2),
+    }
+
+async def user_session(api: FakeTelegramAPI, stats: LoadStats, user_id: int,
+                       deadline: float, stats_every: int, timeout: float):
+    """Один пользователь: добавляет записи, каждые stats_every записей смотрит /stats"""
+    steps = [
+        ('add.command', lambda: api.message(user_id, '/a')),
+        ('add.category', lambda: api.callback(user_id, 'category_work')),
+        ('add.name', lambda: api.message(user_id, 'Программирование')),
+        ('add.duration', lambda: api.message(user_id, '45')),
+    ]
+    for flow in itertools.count(1):
+        if time.perf_counter() >= deadline:
+            return
+        flow_steps = list(steps)
+        if flow % stats_every == 0:
+            flow_steps.append(('stats', lambda: api.message(user_id, '/stats')))
+        for step, make_update in flow_steps:
+            try:
+                stats.record(step, await api.send_and_wait(make_update(), user_id, timeout))
+            except asyncio.TimeoutError:
+                stats.timeouts += 1
+                # Состояние FSM неизвестно - начинаем сценарий заново
+                try:
+                    await api.send_and_wait(api.message(user_id, '/cancel'), user_id, timeout)
+                except asyncio.TimeoutError:
+                    stats.timeouts += 1
+                break
+
+async def monitor_loop_lag(stats: LoadStats, interval: float = 0.05):
+    """Измеряет, насколько позже запланированного просыпается цикл событий"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        stats.loop_lag.append(max(0.0, time.perf_counter() - started - interval))
+
+def dashboard_reader(db_url: str, stats: LoadStats, stop: threading.Event, pause: float):
+    """Повторяет запрос load_data дашборда к тому же файлу базы"""
+    db_engine = create_db_engine(db_url)
+    event.listen(db_engine, 'handle_error', stats.on_db_error)
+    query = select(
+        TimeEntry.id, TimeEntry.user_id, TimeEntry.activity_id, TimeEntry.category,
+        TimeEntry.duration_minutes, TimeEntry.entry_date
+    )
+    try:
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with db_engine.connect() as connection:
+                    pd.DataFrame(connection.execute(query).all())
+                stats.dashboard_reads.append(time.perf_counter() - started)
+            except Exception:
+                stats.dashboard_errors += 1
+            stop.wait(pause)
+    finally:
+        db_engine.dispose()
+
+async def run_load_test(db_url: str, users: int, duration: float, stats_every: int,
+                        timeout: float, dashboard_pause: Optional[float]) -> dict:
+    """Запускает заглушку API, бота, пользователей и читателя дашборда"""
+    stats = LoadStats()
+    db_engine = create_db_engine(db_url)
+    event.listen(db_engine, 'handle_error', stats.on_db_error)
+    SessionLocal.configure(bind=db_engine)
+
+    api = FakeTelegramAPI()
+    runner = web.AppRunner(api.create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+
+    bot = Bot(BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{port}")))
+    user_ids = [FIRST_USER_ID + index for index in range(users)]
+    dp = create_dispatcher(user_ids)
+    polling = asyncio.create_task(dp.start_polling(bot, polling_timeout=1, handle_signals=False))
+    lag_monitor = asyncio.create_task(monitor_loop_lag(stats))
+
+    stop_reader = threading.Event()
+    reader = None
+    if dashboard_pause is not None:
+        reader = threading.Thread(target=dashboard_reader, args=(db_url, stats, stop_reader, dashboard_pause))
+        reader.start()
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            user_session(api, stats, user_id, started + duration, stats_every, timeout)
+            for user_id in user_ids
+        ))
+        elapsed = time.perf_counter() - started
+    finally:
+        stop_reader.set()
+        if reader:
+            await asyncio.to_thread(reader.join)
+        lag_monitor.cancel()
+        await dp.stop_polling()
+        await polling
+        await runner.cleanup()
+        db_engine.dispose()
+
+    updates = sum(len(values) for values in stats.latencies.values())
+    all_latencies = [value for values in stats.latencies.values() for value in values]
+    return {
+        'users': users,
+        'duration_s': round(elapsed, 2),
+        'updates': updates,
+        'updates_per_s': round(updates / elapsed, 1),
+        'latency': {'all': percentiles(all_latencies), **{
+            step: percentiles(values) for step, values in stats.latencies.items()
+        }},
+        'timeouts': stats.timeouts,
+        'lock_errors': stats.lock_errors,
+        'db_errors': stats.db_errors,
+        'event_loop_lag': percentiles(stats.loop_lag),
+        'dashboard_reads': percentiles(stats.dashboard_reads),
+        'dashboard_errors': stats.dashboard_errors,
+        'api_calls': api.api_calls,
+    }
+
+def print_report(report: dict):
+    print(f"\n📈 {report['updates']:,} обновлений за {report['duration_s']}с: "
+          f"{report['updates_per_s']} обновлений/с ({report['users']} польз.)")
+    print("   ⏱️  Задержка ответа:")
+    for step, result in report['latency'].items():
+        if result['count']:
+            print(f"      {step:<14} p50 {result['p50_ms']:>8.1f} мс  p95 {result['p95_ms']:>8.1f} мс  "
+                  f"p99 {result['p99_ms']:>8.1f} мс  max {result['max_ms']:>8.1f} мс")
+    lag = report['event_loop_lag']
+    print(f"   🔄 Задержка цикла событий: p99 {lag.get('p99_ms', 0):.1f} мс, max {lag.get('max_ms', 0):.1f} мс")
+    reads = report['dashboard_reads']
+    if reads['count']:
+        print(f"   📊 Чтения дашборда: {reads['count']}, p50 {reads['p50_ms']:.1f} мс, p99 {reads['p99_ms']:.1f} мс")
+    print(f"   🔒 Ошибок блокировки: {report['lock_errors']} (всего ошибок БД: {report['db_errors']}, "
+          f"дашборда: {report['dashboard_errors']})")
+    print(f"   ⌛ Таймаутов ответа: {report['timeouts']}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест бота против заглушки Telegram Bot API')
+    parser.add_argument('--users', type=int, default=20, help='Одновременных пользователей')
+    parser.add_argument('--duration', type=float, default=30, help='Длительность теста, секунды')
+    parser.add_argument('--size', choices=list(FIXTURES), default='10k', help='Набор данных (копируется во временный файл)')
+    parser.add_argument('--database', help='Файл SQLite вместо набора (будет изменен!)')
+    parser.add_argument('--stats-every', type=int, default=5, help='Запрашивать /stats после каждой N-й записи')
+    parser.add_argument('--timeout', type=float, default=10, help='Ожидание ответа бота, секунды')
+    parser.add_argument('--dashboard-pause', type=float, default=1.0,
+                        help='Пауза между чтениями дашборда, секунды (отрицательное значение отключает)')
+    parser.add_argument('--output', help='Сохранить отчет в JSON')
+    args = parser.parse_args()
+
+    # Лог каждого обновления из DbSessionMiddleware исказил бы замер
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.database:
+            path = args.database
+        else:
+            fixture = fixture_url(args.size).replace('sqlite:///', '')
+            if not os.path.exists(fixture):
+                build_fixture(args.size, seed=42, end_date=datetime(2025, 1, 1), batch_size=100_000)
+            path = os.path.join(directory, f"{args.size}.db")
+            shutil.copyfile(fixture, path)
+
+        print(f"🚀 Нагрузочный тест: {args.users} польз., {args.duration:.0f}с, база {path}")
+        report = asyncio.run(run_load_test(
+            f"sqlite:///{path}", args.users, args.duration, args.stats_every, args.timeout,
+            args.dashboard_pause if args.dashboard_pause >= 0 else None
+        ))
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"\n💾 Отчет сохранен: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Миграция на справочник задач (таблица activities)
+Добавляет колонку time_entries.activity_id, объединяет варианты написания
+задач по нормализованному ключу и проставляет activity_id существующим записям
+"""
+
+import os
+import sys
+import argparse
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func
+
+from database.engine import engine, get_session, upgrade_schema
+from database.activities import backfill_activity_ids
+from database.models import Base, Activity, TimeEntry
+
+def migrate_activities(chunk_size=50000):
+    """Создает справочник задач и заполняет activity_id"""
+    
+    print("🔄 Миграция на справочник задач...")
+    
+    # Создаем новые таблицы и колонки без автоматического заполнения
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+    
+    def report(done_id, max_id):
+        print(f"   ⏳ Обработано id до {done_id} из {max_id}")
+    
+    updated = backfill_activity_ids(engine, chunk_size=chunk_size, progress=report)
+    
+    session = get_session()
+    try:
+        activities = session.query(func.count(Activity.id)).scalar()
+        spellings = session.query(TimeEntry.activity_name).distinct().count()
+        print("✅ Миграция завершена!")
+        print(f"📝 Обновлено записей: {updated}")
+        print(f"📚 Задач в справочнике: {activities} (вариантов написания: {spellings})")
+    finally:
+        session.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Миграция на справочник задач')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='Размер пачки id для одной транзакции')
+    args = parser.parse_args()
+    
+    migrate_activities(args.chunk_size)
+
+if __name__ == "__main__":
+    main()
@@ -1,91 +1,67 @@
 #!/usr/bin/env python3
 """
 Миграция для добавления категорий к существующим записям
+
+Записи обрабатываются пачками по диапазону id: каждое уникальное название
+в пачке классифицируется один раз, затем выполняется по одному
+UPDATE ... WHERE activity_name IN (...) на категорию. Номер последней
+обработанной записи сохраняется в migration_checkpoints, поэтому после сбоя
+миграция продолжается с того же места.
 """
 
 import os
 import sys
+import argparse
+from collections import Counter, defaultdict
+from datetime import datetime
 
 # Добавляем корневую директорию в путь
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from database.engine import get_session, create_tables
-from database.models import TimeEntry, ActivityCategory
+from sqlalchemy import func, or_, select, update
 
-# Маппинг активностей к категориям
-ACTIVITY_CATEGORY_MAPPING = {
-    # Работа
-    "программирование": ActivityCategory.WORK,
-    "код-ревью": ActivityCategory.WORK,
-    "встречи": ActivityCategory.WORK,
-    "планирование": ActivityCategory.WORK,
-    "отладка": ActivityCategory.WORK,
-    "тестирование": ActivityCategory.WORK,
-    "работа с базой данных": ActivityCategory.WORK,
-    "оптимизация": ActivityCategory.WORK,
-    "работа с api": ActivityCategory.WORK,
-    "настройка": ActivityCategory.WORK,
-    "документирование": ActivityCategory.WORK,
-    "git": ActivityCategory.WORK,
-    "deployment": ActivityCategory.WORK,
-    "code review": ActivityCategory.WORK,
-    "meetings": ActivityCategory.WORK,
-    "debugging": ActivityCategory.WORK,
-    "testing": ActivityCategory.WORK,
-    "database": ActivityCategory.WORK,
-    "optimization": ActivityCategory.WORK,
-    "api": ActivityCategory.WORK,
-    "setup": ActivityCategory.WORK,
-    "documentation": ActivityCategory.WORK,
-    
-    # Учеба
-    "изучение": ActivityCategory.STUDY,
-    "чтение": ActivityCategory.STUDY,
-    "английский": ActivityCategory.STUDY,
-    "видео": ActivityCategory.STUDY,
-    "алгоритмы": ActivityCategory.STUDY,
-    "фреймворки": ActivityCategory.STUDY,
-    "технологии": ActivityCategory.STUDY,
-    "документация": ActivityCategory.STUDY,
-    "курсы": ActivityCategory.STUDY,
-    "learning": ActivityCategory.STUDY,
-    "reading": ActivityCategory.STUDY,
-    "english": ActivityCategory.STUDY,
-    "video": ActivityCategory.STUDY,
-    "algorithms": ActivityCategory.STUDY,
-    "frameworks": ActivityCategory.STUDY,
-    "technologies": ActivityCategory.STUDY,
-    "courses": ActivityCategory.STUDY,
-    
-    # Отдых
-    "упражнения": ActivityCategory.REST,
-    "медитация": ActivityCategory.REST,
-    "прогулки": ActivityCategory.REST,
-    "хобби": ActivityCategory.REST,
-    "отдых": ActivityCategory.REST,
-    "книги": ActivityCategory.REST,
-    "физические": ActivityCategory.REST,
-    "exercise": ActivityCategory.REST,
-    "meditation": ActivityCategory.REST,
-    "walking": ActivityCategory.REST,
-    "hobby": ActivityCategory.REST,
-    "rest": ActivityCategory.REST,
-    "books": ActivityCategory.REST,
-    "physical": ActivityCategory.REST
-}
+from database.engine import engine, get_session, create_tables
+from database.activities import backfill_activity_ids
+from database.models import TimeEntry, ActivityCategory, MigrationCheckpoint
+from database.classifier import classify_activity
 
 def get_category_for_activity(activity_name):
-    """Определяет категорию для активности по названию"""
-    activity_lower = activity_name.lower()
-    
-    for keyword, category in ACTIVITY_CATEGORY_MAPPING.items():
-        if keyword in activity_lower:
-            return category
-    
-    # По умолчанию считаем работой
-    return ActivityCategory.WORK
+    """Определяет категорию для активности по названию (по умолчанию - работа)"""
+    return classify_activity(activity_name)
 
-def migrate_to_categories():
+def entries_filter(reclassify_all):
+    """Условие отбора записей: все или только без категории"""
+    if reclassify_all:
+        return TimeEntry.id.isnot(None)
+    return TimeEntry.category.is_(None)
+
+def print_distribution(category_stats):
+    """Выводит распределение записей по категориям"""
+    print("\n📊 Статистика распределения по категориям:")
+    print(f"💼 Работа: {category_stats[ActivityCategory.WORK]} записей")
+    print(f"📚 Учеба: {category_stats[ActivityCategory.STUDY]} записей")
+    print(f"😴 Отдых: {category_stats[ActivityCategory.REST]} записей")
+
+def dry_run(reclassify_all=False):
+    """Показывает, как распределятся записи, ничего не изменяя"""
+    session = get_session()
+    try:
+        category_stats = defaultdict(int)
+        names = session.query(TimeEntry.activity_name, func.count(TimeEntry.id)).filter(
+            entries_filter(reclassify_all)
+        ).group_by(TimeEntry.activity_name)
+        
+        distinct_names = 0
+        for activity_name, count in names.yield_per(10000):
+            category_stats[get_category_for_activity(activity_name)] += count
+            distinct_names += 1
+        
+        print(f"🔍 Пробный запуск: {sum(category_stats.values())} записей, {distinct_names} уникальных названий")
+        print_distribution(category_stats)
+    finally:
+        session.close()
+
+def migrate_to_categories(chunk_size=10000, reclassify_all=False, restart=False):
     """Мигрирует существующие записи, добавляя категории"""
     
     print("🔄 Начинаем миграцию для добавления категорий...")
@@ -93,46 +69,93 @@ def migrate_to_categories():
     # Создаем таблицы (если нужно)
     create_tables()
     
+    checkpoint_name = 'categories_all' if reclassify_all else 'categories'
     session = get_session()
     
     try:
-        # Получаем все записи без категорий
-        entries_without_category = session.query(TimeEntry).filter(
-            TimeEntry.category.is_(None)
-        ).all()
-        
-        if not entries_without_category:
-            print("✅ Все записи уже имеют категории")
-            return
+        checkpoint = session.get(MigrationCheckpoint, checkpoint_name)
+        if checkpoint is None or restart:
+            checkpoint = session.merge(MigrationCheckpoint(name=checkpoint_name, last_id=0))
+            session.commit()
+        elif checkpoint.last_id:
+            print(f"⏩ Продолжаем с записи id > {checkpoint.last_id}")
         
-        print(f"📝 Найдено {len(entries_without_category)} записей без категорий")
+        max_id = session.query(func.max(TimeEntry.id)).scalar() or 0
+        category_stats = defaultdict(int)
+        changed = 0
         
-        # Статистика по категориям
-        category_stats = {
-            ActivityCategory.WORK: 0,
-            ActivityCategory.STUDY: 0,
-            ActivityCategory.REST: 0
-        }
-        
-        # Обновляем записи
-        for entry in entries_without_category:
-            category = get_category_for_activity(entry.activity_name)
-            entry.category = category
-            category_stats[category] += 1
+        while True:
+            # Следующая пачка по диапазону id, в память попадают только id и названия
+            rows = session.execute(
+                select(TimeEntry.id, TimeEntry.activity_name)
+                .where(TimeEntry.id > checkpoint.last_id, entries_filter(reclassify_all))
+                .order_by(TimeEntry.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            
+            low_id, high_id = rows[0].id, rows[-1].id
+            
+            # Каждое уникальное название классифицируем один раз
+            names_by_category = defaultdict(set)
+            name_counts = Counter(row.activity_name for row in rows)
+            for activity_name, count in name_counts.items():
+                category = get_category_for_activity(activity_name)
+                names_by_category[category].add(activity_name)
+                category_stats[category] += count
+            
+            for category, names in names_by_category.items():
+                conditions = [
+                    TimeEntry.id.between(low_id, high_id),
+                    TimeEntry.activity_name.in_(names),
+                    entries_filter(reclassify_all)
+                ]
+                values = {'category': category}
+                if reclassify_all:
+                    # Задача привязана к категории, поэтому при смене категории
+                    # activity_id сбрасываем и заполняем заново после миграции
+                    # NULL != category не истинно, записи без категории отбираем явно
+                    conditions.append(or_(TimeEntry.category.is_(None), TimeEntry.category != category))
+                    values['activity_id'] = None
+                result = session.execute(update(TimeEntry).where(*conditions).values(**values))
+                changed += result.rowcount
+            
+            checkpoint.last_id = high_id
+            checkpoint.updated_at = datetime.utcnow()
+            session.commit()
+            print(f"   ⏳ Обработано id до {high_id} из {max_id}")
         
+        # Миграция завершена, следующий запуск начнется с начала
+        session.delete(checkpoint)
         session.commit()
         
+        backfill_activity_ids(engine)
+        
         print("✅ Миграция завершена успешно!")
-        print("\n📊 Статистика распределения по категориям:")
-        print(f"💼 Работа: {category_stats[ActivityCategory.WORK]} записей")
-        print(f"📚 Учеба: {category_stats[ActivityCategory.STUDY]} записей")
-        print(f"😴 Отдых: {category_stats[ActivityCategory.REST]} записей")
+        if reclassify_all:
+            print(f"ℹ️  Категория изменилась у {changed} записей")
+        print_distribution(category_stats)
         
     except Exception as e:
         session.rollback()
         print(f"❌ Ошибка при миграции: {e}")
+        print("💡 Запустите миграцию снова, чтобы продолжить с последней сохраненной пачки")
     finally:
         session.close()
 
+def main():
+    parser = argparse.ArgumentParser(description='Миграция для добавления категорий к записям')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Количество записей в одной транзакции')
+    parser.add_argument('--all', action='store_true', help='Переклассифицировать все записи, а не только без категории')
+    parser.add_argument('--dry-run', action='store_true', help='Только показать распределение по категориям')
+    parser.add_argument('--restart', action='store_true', help='Начать заново, игнорируя сохраненный прогресс')
+    args = parser.parse_args()
+    
+    if args.dry_run:
+        dry_run(args.all)
+    else:
+        migrate_to_categories(args.chunk_size, args.all, args.restart)
+
 if __name__ == "__main__":
-    migrate_to_categories() 
\ No newline at end of file
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Шарды хранилища (см. database/shards.py)
+
+Без параметров показывает пользователей, записи и минуты каждого шарда и
+сколько пользователей не на своем шарде. --move переносит одного
+пользователя, --rebalance - всех, чей шард по хешу изменился (после
+изменения SHARD_COUNT или включения шардов на базе с данными). Бот и
+дашборд при этом могут работать: обновления переносимого пользователя
+бот откладывает.
+
+Снимок, архив, журнал и копии шардов обслуживаются теми же скриптами с
+параметрами --database и --directory шарда, например:
+    python scripts/snapshot.py --database sqlite:///data/shards/shard-1.db --directory data/snapshot/shard-1
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.models import UserShard
+from database.shards import (
+    move_users, placements, rebalance_plan, register_user, remove_stray_data, shard_router, shard_totals, stray_data
+)
+
+def status(router):
+    per_shard, total = shard_totals(router)
+    with Session(router.catalog) as session:
+        catalog = dict(session.execute(select(UserShard.shard, func.count()).group_by(UserShard.shard)).all())
+        moving = session.execute(select(func.count()).where(UserShard.moving.is_(True))).scalar()
+
+    print(f"🗂 Шардов: {len(router.names)}")
+    for name, totals in per_shard.items():
+        minutes = sum(totals['minutes'].values())
+        print(f"   {name:<10} пользователей {totals['users']:>6,}  в каталоге {catalog.get(name, 0):>6,}  "
+              f"записей {totals['entries']:>10,}  часов {minutes / 60:>10,.0f}")
+    print(f"   {'всего':<10} пользователей {total['users']:>6,}  записей {total['entries']:>10,}")
+    for category, minutes in sorted(total['minutes'].items()):
+        print(f"      {category:<8} {minutes / 60:>12,.1f} ч")
+    if moving:
+        print(f"⏳ Переносятся: {moving}")
+    plan = rebalance_plan(router)
+    if plan:
+        print(f"⚠️ Не на своем шарде: {len(plan)} (перенести: --rebalance)")
+    stray = stray_data(router)
+    if stray:
+        print(f"⚠️ Остатки прерванных переносов: {len(stray)} (удалить: --cleanup)")
+
+def print_move(result):
+    print(f"   {result['user_id']}: {result['source']} → {result['target']}, "
+          f"записей {result['entries']:,} за {result['seconds']:.1f} с")
+
+def main():
+    parser = argparse.ArgumentParser(description='Шарды хранилища')
+    parser.add_argument('--move', type=int, metavar='ПОЛЬЗОВАТЕЛЬ', help='Перенести пользователя')
+    parser.add_argument('--to', metavar='ШАРД', help=f"Шард для --move: {', '.join(shard_router.names)}")
+    parser.add_argument('--rebalance', action='store_true', help='Перенести пользователей на шарды по хешу')
+    parser.add_argument('--dry-run', action='store_true', help='Только показать, кто будет перенесен')
+    parser.add_argument('--cleanup', action='store_true', help='Удалить остатки прерванных переносов')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    shard_router.create_all()
+
+    if args.move is not None:
+        if args.to not in shard_router.urls:
+            print(f"❌ Укажите шард --to: {', '.join(shard_router.names)}")
+            sys.exit(1)
+        results = move_users(shard_router, [(args.move, args.to)])
+        if not results:
+            print(f"✅ Пользователь {args.move} уже в шарде {args.to}")
+        for result in results:
+            print_move(result)
+
+    if args.rebalance:
+        plan = rebalance_plan(shard_router)
+        print(f"🔀 Перенести пользователей: {len(plan)}")
+        if args.dry_run:
+            for user_id, source, target in plan:
+                print(f"   {user_id}: {source} → {target}")
+        elif plan:
+            # Пользователи без строки каталога закрепляются там, где их данные
+            placed = placements(shard_router)
+            for user_id, _, _ in plan:
+                register_user(shard_router, user_id, placed[user_id])
+            move_users(shard_router, [(user_id, target) for user_id, _, target in plan], progress=print_move)
+
+    if args.cleanup:
+        stray = stray_data(shard_router)
+        remove_stray_data(shard_router, stray)
+        print(f"✅ Удалены остатки переносов: {len(stray)}")
+
+    status(shard_router)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Обновление снимка записей в Parquet (см. analytics/snapshot.py)
+
+Запускается один раз или в цикле (--interval) отдельным сервисом рядом с
+ботом. При каждом проходе переписывается только текущий месяц, если в нем
+появились изменения; прошедшие месяцы запечатываются. Первый проход после
+запуска дополнительно сверяет запечатанные месяцы с базой. Следующие проходы
+читают журнал entry_events со своего смещения: без новых событий снимок не
+пересчитывается, а изменения в запечатанных месяцах запускают их сверку:
+такие месяцы помечаются stale, и дашборд читает их из базы до --rebuild.
+Раз в EVENT_COMPACT_INTERVAL секунд журнал уплотняется. --verify сравнивает
+записи, собранные из снимка и хвоста базы, с полной загрузкой из SQLite.
+"""
+
+import os
+import sys
+import argparse
+import logging
+import time
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics.aggregates import load_entries
+from analytics.archive import ARCHIVE_DIR, archive_cutoff
+from analytics.snapshot import (
+    SCHEMA_VERSION, SNAPSHOT_DIR, event_months, load_snapshot, month_key, read_manifest, sealed_months, stale_months,
+    write_snapshot
+)
+from database.engine import DATABASE_URL, create_db_engine, create_tables
+from database.events import EventConsumer, compact_events, head_seq
+
+# Смещение снимка в журнале entry_events
+CONSUMER = EventConsumer('snapshot')
+# Как часто уплотнять журнал, секунды
+COMPACT_INTERVAL = float(os.getenv('EVENT_COMPACT_INTERVAL', '3600'))
+
+def verify(db_engine, directory: str) -> bool:
+    """Сравнивает записи из снимка с полной загрузкой из базы"""
+    with Session(db_engine) as session:
+        started = time.perf_counter()
+        snapshot = load_snapshot(session, directory)
+        snapshot_s = time.perf_counter() - started
+        started = time.perf_counter()
+        expected = load_entries(session)
+        full_s = time.perf_counter() - started
+
+    if snapshot is None:
+        print("⚠️  В снимке нет запечатанных месяцев, дашборд читает базу целиком")
+        return True
+
+    snapshot = snapshot.sort_values('id', ignore_index=True)
+    expected = expected.sort_values('id', ignore_index=True)
+    try:
+        pd.testing.assert_frame_equal(snapshot, expected, check_dtype=False)
+    except AssertionError as e:
+        print(f"❌ Снимок расходится с базой: {e}")
+        return False
+    print(f"✅ Снимок совпадает с базой: {len(snapshot):,} записей, "
+          f"загрузка {snapshot_s * 1000:.0f} мс против {full_s * 1000:.0f} мс из SQLite")
+    return True
+
+def run_once(db_engine, directory: str, rebuild=(), check_sealed: bool = False):
+    changed = set()
+    with Session(db_engine) as session:
+        head = head_seq(session)
+        offset = CONSUMER.offset(session)
+        if offset is not None and not rebuild and not check_sealed:
+            current = month_key(datetime.utcnow())
+            manifest = read_manifest(directory)
+            unsealed = [key for key, state in manifest['months'].items() if not state['sealed']]
+            if offset == head and all(key >= current for key in unsealed) and manifest['version'] == SCHEMA_VERSION:
+                # В журнале ничего нового и запечатывать нечего
+                return
+            # Изменения задним числом в запечатанных месяцах: сверяем их с базой
+            changed = event_months(session, offset) & set(sealed_months(directory))
+            check_sealed = bool(changed)
+
+    started = time.perf_counter()
+    # Месяцы, перенесенные в архив, удаляются из снимка
+    result = write_snapshot(db_engine, directory, rebuild=rebuild, check_sealed=check_sealed,
+                            drop_before=archive_cutoff(ARCHIVE_DIR), changed=changed)
+    elapsed = time.perf_counter() - started
+    with Session(db_engine) as session, session.begin():
+        CONSUMER.commit(session, head)
+    if result['written']:
+        print(f"✅ Снимок обновлен за {elapsed:.2f} с, месяцы: {', '.join(result['written'])}")
+    if result['stale']:
+        print(f"⚠️  Запечатанные месяцы изменились в базе и читаются из нее: {', '.join(result['stale'])} "
+              f"(переписать: --rebuild)")
+
+def main():
+    parser = argparse.ArgumentParser(description='Обновление снимка записей в Parquet')
+    parser.add_argument('--database', default=DATABASE_URL, help='Адрес базы данных')
+    parser.add_argument('--directory', default=SNAPSHOT_DIR, help='Каталог снимка')
+    parser.add_argument('--interval', type=float, default=0,
+                        help='Обновлять каждые N секунд (0 - один раз)')
+    parser.add_argument('--rebuild', nargs='+', default=[], metavar='ГГГГ-ММ',
+                        help='Переписать указанные месяцы, даже запечатанные')
+    parser.add_argument('--verify', action='store_true', help='Сравнить снимок с базой')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db_engine = create_db_engine(args.database)
+    # Журнал событий и таблица смещений могли еще не появиться, если бот не перезапускался
+    create_tables(db_engine)
+
+    if args.verify:
+        sys.exit(0 if verify(db_engine, args.directory) else 1)
+
+    run_once(db_engine, args.directory, args.rebuild, check_sealed=True)
+    months = read_manifest(args.directory)['months']
+    sealed = sum(state['sealed'] for state in months.values())
+    print(f"📦 {args.directory}: месяцев {len(months)}, запечатано {sealed}")
+    stale = stale_months(args.directory)
+    if stale:
+        print(f"⚠️  Читаются из базы до --rebuild: {', '.join(stale)}")
+
+    compacted_at = 0.0
+    while args.interval > 0:
+        time.sleep(args.interval)
+        try:
+            run_once(db_engine, args.directory)
+            if time.monotonic() - compacted_at > COMPACT_INTERVAL:
+                compact_events(db_engine)
+                compacted_at = time.monotonic()
+        except Exception as e:
+            # База может быть временно заблокирована ботом - попробуем в следующий раз
+            print(f"❌ Ошибка обновления снимка: {e}")
+
+if __name__ == "__main__":
+    main()